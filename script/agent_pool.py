@@ -0,0 +1,85 @@
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from uuid import uuid4
+
+##############################
+# POOL DE AGENTES E CLIENTES COMPARTILHADOS
+##############################
+
+# Um único cliente HTTP/Groq por processo mantém as conexões TLS abertas
+# (keep-alive). Os agentes ficam num pool: cada chamada pega um agente livre,
+# limpa a memória dele (isolando as conversas) e devolve ao terminar.
+AGENT_POOL_SIZE = int(os.getenv("AGENT_POOL_SIZE", os.getenv("AGENT_MAX_WORKERS", "8")))
+
+_groq_client = None
+_groq_lock = threading.Lock()
+
+
+def get_groq_client():
+    global _groq_client
+    with _groq_lock:
+        if _groq_client is None:
+            import httpx
+            from groq import Groq as GroqClient
+
+            http_client = httpx.Client(
+                limits=httpx.Limits(max_connections=AGENT_POOL_SIZE * 2, max_keepalive_connections=AGENT_POOL_SIZE),
+                timeout=httpx.Timeout(60.0, connect=10.0),
+            )
+            # As novas tentativas (429, 5xx) ficam com o groq_scheduler, que
+            # conhece os limites e a fila; o retry interno do SDK furaria a fila
+            _groq_client = GroqClient(api_key=os.getenv("GROQ_API_KEY"), http_client=http_client, max_retries=0)
+        return _groq_client
+
+
+class AgentPool:
+    def __init__(self, factory, size: int = AGENT_POOL_SIZE):
+        self.factory = factory
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _take(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return self.factory()
+        return self._idle.get()
+
+    def _reset(self, agent) -> None:
+        agent.memory.clear()
+        agent.session_id = str(uuid4())
+
+    @contextmanager
+    def acquire(self):
+        agent = self._take()
+        try:
+            self._reset(agent)
+            yield agent
+        finally:
+            self._idle.put(agent)
+
+    def run(self, prompt: str, stream: bool = False, **kwargs):
+        """Mesma assinatura de Agent.run, usando um agente livre do pool."""
+        if stream:
+            return self._run_stream(prompt, **kwargs)
+        with self.acquire() as agent:
+            return agent.run(prompt, **kwargs)
+
+    def _run_stream(self, prompt: str, **kwargs):
+        with self.acquire() as agent:
+            yield from agent.run(prompt, stream=True, **kwargs)
+
+    def warm(self, count: int = 1) -> None:
+        """Cria agentes antecipadamente e abre a conexão com a Groq."""
+        agents = [self._take() for _ in range(min(count, self.size))]
+        for agent in agents:
+            self._idle.put(agent)
+        get_groq_client().models.list()
@@ -0,0 +1,172 @@
+import os
+import time
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import medir, observar_etapa
+
+##############################
+# EXECUÇÃO DOS AGENTES FORA DO EVENT LOOP
+##############################
+
+# O agent.run do phi é síncrono (LLM + busca na web). Rodamos as chamadas
+# num pool de threads limitado para não travar o event loop do bot.
+AGENT_MAX_WORKERS = int(os.getenv("AGENT_MAX_WORKERS", "8"))
+AGENT_TIMEOUT = float(os.getenv("AGENT_TIMEOUT", "90"))
+
+_executor = ThreadPoolExecutor(max_workers=AGENT_MAX_WORKERS, thread_name_prefix="agent")
+
+
+class AgentTimeoutError(Exception):
+    pass
+
+
+def submit(fn, *args, **kwargs):
+    """Agenda fn no pool de agentes e devolve um concurrent.futures.Future.
+
+    fn roda com uma cópia do contexto atual (contextvars), para que dados
+    como a prioridade do pedido cheguem à thread do agente.
+    """
+    context = contextvars.copy_context()
+    return _executor.submit(context.run, fn, *args, **kwargs)
+
+
+def submit_agent(agent, prompt: str, **kwargs):
+    return submit(agent.run, prompt, **kwargs)
+
+
+async def run_agent(agent, prompt: str, timeout: float = AGENT_TIMEOUT, **kwargs):
+    """Executa agent.run no pool sem bloquear o event loop.
+
+    Se a chamada estourar o timeout (ou a task for cancelada) o future é
+    cancelado; se ainda estiver na fila ele nem chega a rodar.
+    """
+    with medir("agente", modo="completo"):
+        future = asyncio.wrap_future(submit_agent(agent, prompt, **kwargs))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise AgentTimeoutError(f"O agente não respondeu em {timeout:.0f}s")
+
+
+async def stream_agent(agent, prompt: str, timeout: float = AGENT_TIMEOUT, **kwargs):
+    """Versão em stream de run_agent: gera os pedaços de texto conforme chegam.
+
+    O stream síncrono do phi é consumido numa thread do pool e repassado ao
+    event loop por uma fila. Se quem consome parar (timeout, cancelamento ou
+    break), a thread interrompe o stream e libera o agente; se o pedido ainda
+    estava na fila do pool, o agente nem chega a ser chamado.
+    """
+    loop = asyncio.get_running_loop()
+    chunks = asyncio.Queue()
+    stop = threading.Event()
+    done = object()
+
+    def produce():
+        # Quem consome pode ter desistido enquanto o pedido esperava um worker
+        if stop.is_set():
+            return
+        stream = agent.run(prompt, stream=True, **kwargs)
+        try:
+            for chunk in stream:
+                if stop.is_set():
+                    break
+                if chunk.content:
+                    loop.call_soon_threadsafe(chunks.put_nowait, chunk.content)
+            loop.call_soon_threadsafe(chunks.put_nowait, done)
+        except Exception as e:
+            loop.call_soon_threadsafe(chunks.put_nowait, e)
+        finally:
+            stream.close()
+
+    future = submit(produce)
+    inicio = time.perf_counter()
+    primeiro = True
+    deadline = loop.time() + timeout
+    try:
+        with medir("agente", modo="stream"):
+            while True:
+                try:
+                    item = await asyncio.wait_for(chunks.get(), deadline - loop.time())
+                except asyncio.TimeoutError:
+                    raise AgentTimeoutError(f"O agente não respondeu em {timeout:.0f}s")
+                if item is done:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                if primeiro:
+                    primeiro = False
+                    # Tempo até o usuário ver o primeiro texto
+                    observar_etapa("agente_primeiro_pedaco", time.perf_counter() - inicio)
+                yield item
+    finally:
+        stop.set()
+        future.cancel()
+
+
+class _InFlight:
+    def __init__(self):
+        self.task = None
+        self.listeners = []
+        self.last_partial = None
+
+
+class SingleFlight:
+    """Chamadas simultâneas com a mesma chave compartilham uma única execução.
+
+    A primeira chamada (líder) executa fn; as que chegam enquanto ela está em
+    andamento só esperam o mesmo resultado (ou a mesma exceção). Os textos
+    parciais do líder são repassados a todos os on_partial inscritos. Nada é
+    guardado depois que a execução termina: isso é papel do cache.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.stats = {"executadas": 0, "agrupadas": 0}
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def coalescing_rate(self) -> float:
+        total = self.stats["executadas"] + self.stats["agrupadas"]
+        return self.stats["agrupadas"] / total if total else 0.0
+
+    async def run(self, key, fn, on_partial=None):
+        """Executa `await fn(on_partial)` uma vez por chave em andamento."""
+        call = self._calls.get(key)
+        if call is None:
+            self.stats["executadas"] += 1
+            call = _InFlight()
+
+            async def broadcast(partial):
+                call.last_partial = partial
+                for listener in list(call.listeners):
+                    try:
+                        await listener(partial)
+                    except Exception as e:
+                        print(f"Falha ao repassar texto parcial: {e}")
+
+            # A execução é uma task própria: se o líder for cancelado, quem
+            # está esperando continua recebendo o resultado
+            call.task = asyncio.ensure_future(fn(broadcast))
+            call.task.add_done_callback(lambda _: self._calls.pop(key, None))
+            self._calls[key] = call
+        else:
+            self.stats["agrupadas"] += 1
+
+        if on_partial is not None:
+            call.listeners.append(on_partial)
+        try:
+            # Quem chega no meio já recebe o texto gerado até agora
+            if on_partial is not None and call.last_partial is not None:
+                await on_partial(call.last_partial)
+            return await asyncio.shield(call.task)
+        finally:
+            if on_partial in call.listeners:
+                call.listeners.remove(on_partial)
+
+
+def shutdown(wait: bool = False) -> None:
+    _executor.shutdown(wait=wait, cancel_futures=True)
@@ -1,75 +1,138 @@
 # Catálogo de Livros Inteligente com Agentes de IA
 
 # Imports
-import re
+import os
+import queue
+from concurrent.futures import wait, FIRST_COMPLETED
 import streamlit as st
-import pandas as pd
 from phi.agent import Agent
-from phi.model.groq import Groq
 from phi.tools.duckduckgo import DuckDuckGo
 from phi.tools.newspaper_tools import NewspaperTools
 from dotenv import load_dotenv
+from response_cache import get_cache
+from agent_runner import submit
+from agent_pool import AgentPool, get_groq_client
+from groq_scheduler import (
+    ScheduledGroq,
+    SchedulerBusyError,
+    agendamento,
+    PRIORIDADE_INTERATIVA,
+    PRIORIDADE_RECOMENDACAO,
+)
+from postprocess import clean_response, StreamCleaner
+from price_index import get_price_index, formatar_ofertas
+from catalog_search import get_catalog_search, formatar_livro, formatar_recomendacoes
+from covers import get_cover_store, cover_url, COVER_TIMEOUT
+from metrics import medir, novo_trace, contar_cache, instrumentar_ferramentas
 
-# Carrega o arquivo de variáveis de ambiente
+# Carrega o arquivo de variáveis de ambiente. Fica fora de qualquer chamada
+# do Streamlit: set_page_config tem de ser a primeira (e é barato repetir,
+# o .env não sobrescreve o que já está definido)
 load_dotenv()
 
+# Mostra as respostas enquanto são geradas
+STREAMING_ENABLED = os.getenv("STREAMING_ENABLED", "1") == "1"
+# Responde com o catálogo raspado quando o livro está nele; os agentes só
+# entram nas seções que o catálogo não cobre
+LOCAL_SEARCH_ENABLED = os.getenv("LOCAL_SEARCH_ENABLED", "1") == "1"
+LOCAL_MIN_RECOMMENDATIONS = int(os.getenv("LOCAL_MIN_RECOMMENDATIONS", "3"))
+
 ########## Agentes de IA ##########
 
 # Agente para buscar informações sobre livros
-dsa_agente_info_livros = Agent(
-    name="Agente de Informações de Livros",
-    model=Groq(id="deepseek-r1-distill-llama-70b"),
-    tools=[DuckDuckGo(), NewspaperTools()],
-    instructions=[
-        "Forneça informações concisas sobre o livro incluindo:",
-        "- Título e autor",
-        "- Sinopse resumida (máximo 5 frases)",
-        "- Gênero literário",
-        "- Número de páginas",
-        "- Preço médio estimado (formato: R$ XXX,XX)",
-        "NÃO inclua fontes ou referências externas"
-    ],
-    show_tool_calls=True,
-    markdown=True
-)
+def criar_agente_info_livros():
+    return Agent(
+        name="Agente de Informações de Livros",
+        model=ScheduledGroq(id="deepseek-r1-distill-llama-70b", client=get_groq_client()),
+        tools=instrumentar_ferramentas([DuckDuckGo(), NewspaperTools()]),
+        instructions=[
+            "Forneça informações concisas sobre o livro incluindo:",
+            "- Título e autor",
+            "- Sinopse resumida (máximo 5 frases)",
+            "- Gênero literário",
+            "- Número de páginas",
+            "- Preço médio estimado (formato: R$ XXX,XX)",
+            "NÃO inclua fontes ou referências externas"
+        ],
+        show_tool_calls=True,
+        markdown=True
+    )
 
 # Agente para recomendações de livros
-dsa_agente_recomendacoes = Agent(
-    name="Agente de Recomendações",
-    model=Groq(id="deepseek-r1-distill-llama-70b"),
-    tools=[DuckDuckGo(), NewspaperTools()],
-    instructions=[
-        "INSTRUÇÕES ESTRITAS:",
-        "1. Recomende EXATAMENTE 10 livros similares ao solicitado",
-        "2. Para cada livro, forneça APENAS:",
-        "   - Título em negrito",
-        "   - Autor",
-        "   - Gênero literário",
-        "   - Preço médio estimado (formato: R$ XX,XX)",
-        "   - Breve resumo sobre o livro (maximo 5 frases)",
-        "   - Breve motivo da recomendação (1 frase)",
-        "3. Formate como lista markdown simples",
-        "4. NÃO mostre seu processo de pensamento",
-        "5. NÃO inclua links ou fontes",
-        "6. NÃO explique como chegou às recomendações",
-        "7. APENAS liste os livros no formato solicitado"
-    ],
-    show_tool_calls=False,
-    markdown=True
-)
+def criar_agente_recomendacoes():
+    return Agent(
+        name="Agente de Recomendações",
+        model=ScheduledGroq(id="deepseek-r1-distill-llama-70b", client=get_groq_client()),
+        tools=instrumentar_ferramentas([DuckDuckGo(), NewspaperTools()]),
+        instructions=[
+            "INSTRUÇÕES ESTRITAS:",
+            "1. Recomende EXATAMENTE 10 livros similares ao solicitado",
+            "2. Para cada livro, forneça APENAS:",
+            "   - Título em negrito",
+            "   - Autor",
+            "   - Gênero literário",
+            "   - Preço médio estimado (formato: R$ XX,XX)",
+            "   - Breve resumo sobre o livro (maximo 5 frases)",
+            "   - Breve motivo da recomendação (1 frase)",
+            "3. Formate como lista markdown simples",
+            "4. NÃO mostre seu processo de pensamento",
+            "5. NÃO inclua links ou fontes",
+            "6. NÃO explique como chegou às recomendações",
+            "7. APENAS liste os livros no formato solicitado"
+        ],
+        show_tool_calls=False,
+        markdown=True
+    )
 
-# Agente coordenador
-multi_ai_agent = Agent(
-    team=[dsa_agente_info_livros, dsa_agente_recomendacoes],
-    model=Groq(id="deepseek-r1-distill-llama-70b"),
-    instructions=[
-        "Coordene a equipe de agentes para fornecer uma experiência completa ao usuário",
-        "Garanta que todas as informações solicitadas sejam fornecidas",
-        "Formate a saída de maneira organizada e agradável"
-    ],
-    show_tool_calls=True,
-    markdown=True
-)
+# O Streamlit executa este arquivo a cada interação: os agentes ficam em
+# pools criados uma vez por processo e compartilhados entre sessões. Cada
+# busca pega um agente livre (com a memória limpa), então sessões
+# simultâneas não misturam conversas.
+@st.cache_resource(show_spinner=False)
+def criar_agentes():
+    return AgentPool(criar_agente_info_livros), AgentPool(criar_agente_recomendacoes)
+
+dsa_agente_info_livros, dsa_agente_recomendacoes = criar_agentes()
+
+# Busca uma seção (informações ou recomendações), passando antes pelo cache.
+# Roda numa thread do agent_runner; quem desenha na tela é a thread do Streamlit.
+# Com on_partial, o texto parcial (já limpo) é repassado a cada pedaço recebido;
+# se o pedido precisar esperar no groq_scheduler, a posição na fila também.
+def buscar_secao(agent_type, agente, prompt, book_query, on_partial=None, prioridade=PRIORIDADE_INTERATIVA):
+    cache = get_cache()
+    content = cache.get(agent_type, book_query)
+    contar_cache(agent_type, content is not None)
+    if content is None:
+        aviso = None
+        if on_partial is not None:
+            aviso = lambda posicao: on_partial(f"⏳ Muitos pedidos agora: você é o {posicao}º da fila...")
+        with agendamento(prioridade, aviso):
+            if STREAMING_ENABLED and on_partial is not None:
+                cleaner = StreamCleaner(telegram=False)
+                with medir("agente", modo="stream"):
+                    for chunk in agente.run(prompt, stream=True):
+                        if chunk.content:
+                            on_partial(cleaner.feed(chunk.content))
+                with medir("limpeza", origem=agent_type):
+                    content = cleaner.finish()
+            else:
+                with medir("agente", modo="completo"):
+                    response = agente.run(prompt)
+                with medir("limpeza", origem=agent_type):
+                    content = clean_response(response.content, telegram=False)
+        cache.set(agent_type, book_query, content)
+    return content
+
+# Consultas locais (catálogo e preços) memorizadas por texto buscado; o TTL
+# cobre a troca dos arquivos quando os scrapers rodam de novo. As respostas
+# dos agentes já ficam no response_cache, compartilhado entre sessões.
+@st.cache_data(ttl=600, show_spinner=False)
+def consultar_catalogo(book_query, usar_agentes):
+    livro = None if usar_agentes else get_catalog_search().encontrar(book_query)
+    candidatos = get_catalog_search().recomendar(livro, limite=10) if livro else []
+    # Quando o livro veio do catálogo, os preços já estão na ficha dele
+    precos = [] if livro else get_price_index().buscar(book_query, limite=1, minimo=0.75)
+    return livro, candidatos, precos
 
 ########## App Web ##########
 
@@ -148,6 +211,9 @@ st.sidebar.markdown("""
 Desenvolvido com IA pela Data Science Academy
 """)
 
+# Permite pular o catálogo local e sempre consultar os agentes
+usar_agentes = st.sidebar.checkbox("Sempre consultar os agentes de IA", value=not LOCAL_SEARCH_ENABLED)
+
 # Botão de suporte na barra lateral
 if st.sidebar.button("✉️ Suporte"):
     st.sidebar.write("Dúvidas ou sugestões? Envie e-mail para: victorfernandes_cpv@outlook.com")
@@ -164,27 +230,85 @@ book_query = st.text_input("Digite o nome do livro (e autor se possível):")
 # Se o usuário pressionar o botão, entramos neste bloco
 if st.button("Buscar Livro"):
     if book_query:
+        novo_trace("streamlit", consulta=book_query)
         # Container principal para os resultados
         main_container = st.container()
         
         with main_container:
             st.subheader(f"Resultados para: {book_query}")
+
+            # O catálogo local responde na hora; o que ele não cobrir vai para os agentes
+            livro, candidatos, precos = consultar_catalogo(book_query, usar_agentes)
+
+            # Seção 2: Preços reais das lojas raspadas (índice local, sem LLM)
+            if precos:
+                st.markdown("### 💰 Preços nas Lojas")
+                st.markdown(formatar_ofertas(precos[0], negrito="**"))
             
-            # Seção 1: Informações do Livro
-            with st.spinner("Buscando informações sobre o livro..."):
-                info_col, _ = st.columns([3, 1])
-                with info_col:
-                    st.markdown("### 📖 Informações do Livro")
-                    book_info_response = dsa_agente_info_livros.run(f"Obtenha informações detalhadas sobre o livro: {book_query}")
-                    clean_info = re.sub(r"Running:.*?\n\n", "", book_info_response.content, flags=re.DOTALL)
-                    st.markdown(clean_info, unsafe_allow_html=True)
+            # Seção 1: Informações do Livro, com a capa (miniatura do cache local) ao lado
+            info_col, cover_col = st.columns([3, 1])
+            with info_col:
+                st.markdown("### 📖 Informações do Livro")
+                info_placeholder = st.empty()
+                info_placeholder.info("⏳ Buscando informações sobre o livro...")
+            cover_placeholder = cover_col.empty()
+            url = cover_url((livro or (precos[0] if precos else {})).get("ofertas", []))
+            cover = get_cover_store().submit(url) if url else None
             
             # Seção 3: Recomendações
-            with st.spinner("Preparando recomendações personalizadas..."):
-                st.markdown("### 🔍 Você Pode Gostar Também")
-                recommendations_response = dsa_agente_recomendacoes.run(f"Recomende 10 livros similares a: {book_query}")
-                clean_recommendations = re.sub(r"Running:.*?\n\n", "", recommendations_response.content, flags=re.DOTALL)
-                st.markdown(clean_recommendations, unsafe_allow_html=True)
+            st.markdown("### 🔍 Você Pode Gostar Também")
+            recommendations_placeholder = st.empty()
+            recommendations_placeholder.info("⏳ Preparando recomendações personalizadas...")
+
+            if livro:
+                info_placeholder.markdown(formatar_livro(livro, negrito="**"))
+            if len(candidatos) >= LOCAL_MIN_RECOMMENDATIONS:
+                recommendations_placeholder.markdown(formatar_recomendacoes(candidatos, negrito="**"))
+            if livro:
+                st.caption("Resultados do catálogo local. Marque \"Sempre consultar os agentes de IA\" para a análise completa.")
+
+            # As duas buscas são independentes: rodam em paralelo e cada seção
+            # é atualizada conforme o texto chega. Só esta thread desenha na
+            # tela; as threads dos agentes mandam o texto parcial pela fila.
+            partials = queue.Queue()
+            futures = {}
+            if not livro:
+                futures[submit(buscar_secao, "library_info", dsa_agente_info_livros,
+                               f"Obtenha informações detalhadas sobre o livro: {book_query}", book_query,
+                               lambda text: partials.put((info_placeholder, text)))] = info_placeholder
+            if len(candidatos) < LOCAL_MIN_RECOMMENDATIONS:
+                futures[submit(buscar_secao, "library_recomendacoes", dsa_agente_recomendacoes,
+                               f"Recomende 10 livros similares a: {book_query}", book_query,
+                               lambda text: partials.put((recommendations_placeholder, text)),
+                               PRIORIDADE_RECOMENDACAO)] = recommendations_placeholder
+            pending = set(futures)
+            if cover is not None and not pending:
+                # Sem agentes não há o que esperar além da capa: espera pouco
+                wait([cover], timeout=COVER_TIMEOUT)
+            while pending or cover is not None:
+                if cover is not None and (cover.done() or not pending):
+                    if cover.done() and cover.result():
+                        cover_placeholder.image(cover.result())
+                    cover = None
+                # Os parciais de uma busca terminada já estão na fila, então
+                # drenamos a fila antes de desenhar o resultado final
+                finished = {future for future in pending if future.done()}
+                latest = {}
+                while not partials.empty():
+                    placeholder, text = partials.get_nowait()
+                    latest[placeholder] = text
+                for placeholder, text in latest.items():
+                    if placeholder not in [futures[future] for future in finished]:
+                        placeholder.markdown(text, unsafe_allow_html=True)
+                for future in finished:
+                    try:
+                        futures[future].markdown(future.result(), unsafe_allow_html=True)
+                    except SchedulerBusyError:
+                        futures[future].warning("🚦 Estamos com muitos pedidos agora. Tente novamente em alguns instantes.")
+                    except Exception as e:
+                        futures[future].error(f"Ocorreu um erro: {e}")
+                pending -= finished
+                wait(pending | ({cover} if cover is not None else set()), timeout=0.1, return_when=FIRST_COMPLETED)
     else:
         st.error("Por favor, digite o nome de um livro para buscar.")
 
@@ -1,13 +1,16 @@
 import os
 import re
-from flask import Flask
-import threading
+import time
+import hashlib
+import asyncio
+import weakref
 from telegram import (
     Update,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
     Bot
 )
+from telegram.error import BadRequest, RetryAfter
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -17,10 +20,23 @@ from telegram.ext import (
     CallbackContext,
     filters,
 )
-from phi.agent import Agent
-from phi.model.groq import Groq
-from phi.tools.googlesearch import GoogleSearch
 from dotenv import load_dotenv
+from agent_runner import run_agent, stream_agent, AgentTimeoutError, SingleFlight
+from agent_pool import AgentPool, get_groq_client
+from groq_scheduler import (
+    SchedulerBusyError,
+    agendamento,
+    PRIORIDADE_INTERATIVA,
+    PRIORIDADE_RECOMENDACAO,
+)
+from response_cache import get_cache, normalize_query
+from conversation_store import get_conversation_store
+from postprocess import clean_response, split_message, pack_messages, escape_markdown, StreamCleaner
+from price_index import get_price_index, formatar_ofertas, similaridade, trigramas, variantes_da_consulta
+from webhook_server import serve
+from catalog_search import get_catalog_search, formatar_livro, formatar_recomendacoes
+from covers import get_cover_store, cover_url
+from metrics import registry, medir, cronometrar, novo_trace, contar_cache, instrumentar_ferramentas
 
 # Carrega variáveis de ambiente
 load_dotenv()
@@ -28,37 +44,56 @@ load_dotenv()
 TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
-bot = Bot(token=TOKEN)
-
-bot.delete_webhook()
-
-
-##############################
-# GAMBIARRA PRA RODAR NO RENDER
-##############################
-app = Flask('')
-
-@app.route('/')
-def home():
-    return "✅ Bot da Sarah está rodando!"
-
-def run():
-    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 8080)))
-
-def keep_alive():
-    t = threading.Thread(target=run)
-    t.start()
+# Mostra a resposta enquanto ela é gerada, editando a mensagem aos poucos
+STREAMING_ENABLED = os.getenv("STREAMING_ENABLED", "1") == "1"
+# Intervalo mínimo entre edições da mesma mensagem (limite do Telegram)
+TELEGRAM_EDIT_INTERVAL = float(os.getenv("TELEGRAM_EDIT_INTERVAL", "1.5"))
+# Responde primeiro com o catálogo raspado; os agentes só entram quando o
+# livro não está lá (ou quando o usuário pede a análise completa)
+LOCAL_SEARCH_ENABLED = os.getenv("LOCAL_SEARCH_ENABLED", "1") == "1"
+# Mínimo de livros da mesma categoria para recomendar só com o catálogo
+LOCAL_MIN_RECOMMENDATIONS = int(os.getenv("LOCAL_MIN_RECOMMENDATIONS", "3"))
+# Semelhança mínima (Dice) entre a consulta e o título de uma resposta
+# pré-calculada para reaproveitá-la (acentos, pontuação e "capa comum" já
+# não contam na normalização; isto deixa passar só diferenças mínimas)
+PRECOMPUTED_MIN_SIMILARITY = float(os.getenv("PRECOMPUTED_MIN_SIMILARITY", "0.9"))
+# Lista de livros numa mensagem só (um por linha): quantos títulos no máximo
+# e quantos de um mesmo usuário são buscados ao mesmo tempo
+BATCH_MAX_TITLES = int(os.getenv("BATCH_MAX_TITLES", "10"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "3"))
+# Manda a capa (miniatura do cache local) junto com o diagnóstico
+COVERS_ENABLED = os.getenv("COVERS_ENABLED", "1") == "1"
+
+# Modo webhook: o Telegram entrega os updates por HTTP no mesmo servidor do
+# health check. No Render a URL pública vem em RENDER_EXTERNAL_URL; sem URL
+# (ex.: rodando local) o bot usa polling.
+WEBHOOK_URL = os.getenv("WEBHOOK_URL") or os.getenv("RENDER_EXTERNAL_URL")
+# O Telegram manda o segredo em cada update e o servidor recusa quem não
+# tiver. Sem WEBHOOK_SECRET ele é derivado do token: o mesmo em todas as
+# réplicas e restarts, e ninguém sem o token consegue forjar updates.
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+PORT = int(os.getenv("PORT", "8080"))
+HEALTH_MESSAGE = "✅ Bot da Sarah está rodando!"
+# Quantos updates são processados ao mesmo tempo (1 = um por vez)
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "64"))
 
 
 ##############################
 # AGENTES
 ##############################
 
+# phi, Groq e a busca do Google só são importados quando o primeiro agente é
+# criado (no aquecimento em segundo plano), fora do caminho da inicialização
+
 def create_book_info_agent():
+    from phi.agent import Agent
+    from phi.tools.googlesearch import GoogleSearch
+    from groq_scheduler import ScheduledGroq
+
     return Agent(
         name="Agente de Informações de Livros",
-        model=Groq(id="deepseek-r1-distill-llama-70b"),
-        tools=[GoogleSearch()],
+        model=ScheduledGroq(id="deepseek-r1-distill-llama-70b", client=get_groq_client()),
+        tools=instrumentar_ferramentas([GoogleSearch()]),
         instructions=[
             "Forneça informações concisas sobre o livro incluindo:",
             "- Título e autor",
@@ -75,10 +110,14 @@ def create_book_info_agent():
 
 
 def create_recommendation_agent():
+    from phi.agent import Agent
+    from phi.tools.googlesearch import GoogleSearch
+    from groq_scheduler import ScheduledGroq
+
     return Agent(
         name="Agente de Recomendações",
-        model=Groq(id="deepseek-r1-distill-llama-70b"),
-        tools=[GoogleSearch()],
+        model=ScheduledGroq(id="deepseek-r1-distill-llama-70b", client=get_groq_client()),
+        tools=instrumentar_ferramentas([GoogleSearch()]),
         instructions=[
             "INSTRUÇÕES ESTRITAS:",
             "1. Recomende EXATAMENTE 5 livros similares ao solicitado",
@@ -98,36 +137,292 @@ def create_recommendation_agent():
     )
 
 
+# Agentes reaproveitados entre mensagens (a memória é limpa a cada uso)
+book_info_agents = AgentPool(create_book_info_agent)
+recommendation_agents = AgentPool(create_recommendation_agent)
+
+
+def warm_agents() -> None:
+    book_info_agents.warm()
+    recommendation_agents.warm()
+
+
+def warm_up() -> None:
+    """Prepara o que a primeira resposta vai usar: catálogo, cache, estado das
+    conversas (limpando as vencidas) e agentes (importa phi/Groq e abre a
+    conexão com a API)."""
+    for part, warm in (("catalogo", get_catalog_search), ("cache", get_cache),
+                       ("conversas", lambda: get_conversation_store().backend.purge_expired()),
+                       ("agentes", warm_agents)):
+        try:
+            with medir("aquecimento", parte=part):
+                warm()
+        except Exception as e:
+            print(f"Falha ao aquecer ({part}): {e}")
+
+
+async def post_init(application: Application) -> None:
+    # Aquece em segundo plano, sem atrasar o início do bot
+    asyncio.get_running_loop().run_in_executor(None, warm_up)
+
+
 ##############################
 # FUNÇÕES DE PROCESSAMENTO
 ##############################
 
-async def get_book_info(book_query: str) -> str:
-    agent = create_book_info_agent()
-    response = agent.run(f"Informações sobre: {book_query}")
-    return clean_response(response.content)
+# Pedidos iguais (mesmo tipo e mesma consulta normalizada) que chegam
+# enquanto um deles ainda está em andamento esperam essa mesma chamada
+in_flight = SingleFlight()
+registry.adicionar_coletor(lambda: [
+    ("agentes_em_andamento", {}, in_flight.in_flight()),
+    ("agentes_pedidos", {"situacao": "executados"}, in_flight.stats["executadas"]),
+    ("agentes_pedidos", {"situacao": "agrupados"}, in_flight.stats["agrupadas"]),
+])
+
+
+async def precomputed(agent_type: str, book_query: str):
+    """Resposta pré-calculada (precompute.py) para o livro do catálogo que
+    corresponde à consulta: o job grava pelo título do catálogo (normalizado,
+    sem acentos e sem "capa comum"), que o usuário raramente digita igual.
+
+    Só vale se a consulta for o mesmo título ou quase: a resposta é sobre um
+    livro específico e não pode ir para outro ("Filhos de Duna" não é DUNA)."""
+    try:
+        livro = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: get_catalog_search().encontrar(book_query)
+        )
+    except Exception as e:
+        print(f"Falha na busca local: {e}")
+        return None
+    if livro is None or normalize_query(livro["titulo"]) == normalize_query(book_query):
+        return None
+    # Com ou sem o autor que o usuário acrescentou ('1984 (George Orwell)')
+    if not any(titulo == livro["titulo"]
+               or similaridade(trigramas(titulo), trigramas(livro["titulo"])) >= PRECOMPUTED_MIN_SIMILARITY
+               for titulo in variantes_da_consulta(book_query)):
+        return None
+    return get_cache().get(agent_type, livro["titulo"])
+
+
+async def ask_agent(agent_type: str, agents: AgentPool, prompt: str, book_query: str, on_partial=None,
+                    priority: int = PRIORIDADE_INTERATIVA, on_queue=None) -> str:
+    cache = get_cache()
+    cached = cache.get(agent_type, book_query)
+    if cached is None:
+        cached = await precomputed(agent_type, book_query)
+    contar_cache(agent_type, cached is not None)
+    if cached is not None:
+        return cached
+
+    async def call_agent(on_partial):
+        # A prioridade e o aviso de fila seguem, via contexto, até o groq_scheduler
+        with agendamento(priority, on_queue):
+            if STREAMING_ENABLED:
+                cleaner = StreamCleaner()
+                async for chunk in stream_agent(agents, prompt):
+                    await on_partial(cleaner.feed(chunk))
+                with medir("limpeza", origem=agent_type):
+                    content = cleaner.finish()
+            else:
+                response = await run_agent(agents, prompt)
+                with medir("limpeza", origem=agent_type):
+                    content = clean_response(response.content)
+
+        cache.set(agent_type, book_query, content)
+        return content
+
+    return await in_flight.run((agent_type, normalize_query(book_query)), call_agent, on_partial)
+
+
+async def get_book_info(book_query: str, on_partial=None, on_queue=None,
+                        priority: int = PRIORIDADE_INTERATIVA) -> str:
+    return await ask_agent(
+        "telegram_info", book_info_agents, f"Informações sobre: {book_query}", book_query, on_partial,
+        priority, on_queue
+    )
+
+
+async def get_recommendations(book_query: str, on_partial=None, on_queue=None,
+                              priority: int = PRIORIDADE_RECOMENDACAO) -> str:
+    return await ask_agent(
+        "telegram_recomendacoes", recommendation_agents, f"Recomende livros similares a: {book_query}", book_query, on_partial,
+        priority, on_queue
+    )
+
+
+class ThrottledEditor:
+    """Edita uma mensagem com o texto parcial, no máximo uma vez por intervalo.
+
+    O StreamCleaner só libera Markdown já fechado, então as edições parciais
+    também vão formatadas. Se o texto passar do limite, mostra a primeira
+    mensagem; a versão final (dividida) fica por conta de quem chamou.
+    """
+
+    def __init__(self, bot: Bot, message, header: str, interval: float = TELEGRAM_EDIT_INTERVAL):
+        self.bot = bot
+        self.message = message
+        self.header = header
+        self.interval = interval
+        self._next_edit = 0.0
+        self._last_text = None
+
+    async def update(self, partial: str) -> None:
+        now = time.monotonic()
+        if not partial or now < self._next_edit:
+            return
+
+        text = split_message(f"{self.header}{partial}")[0]
+        if text == self._last_text:
+            return
+
+        self._next_edit = now + self.interval
+        try:
+            with medir("telegram_edicao", tipo="parcial"):
+                await self.bot.edit_message_text(
+                    chat_id=self.message.chat_id,
+                    message_id=self.message.message_id,
+                    text=text,
+                    parse_mode="Markdown",
+                )
+            self._last_text = text
+        except RetryAfter as e:
+            self._next_edit = now + e.retry_after
+        except BadRequest:
+            # Ex.: "message is not modified"; a próxima edição tenta de novo
+            pass
+
+    async def finish(self, text: str) -> None:
+        """Edição final com a resposta completa (a última parcial muitas vezes já era ela)."""
+        if text == self._last_text:
+            return
+        try:
+            with medir("telegram_edicao", tipo="final"):
+                await self.bot.edit_message_text(
+                    chat_id=self.message.chat_id,
+                    message_id=self.message.message_id,
+                    text=text,
+                    parse_mode="Markdown",
+                )
+        except BadRequest as e:
+            # Uma parcial igual pode ter chegado ao Telegram sem voltar a resposta
+            if "not modified" not in str(e).lower():
+                raise
+        self._last_text = text
+
+    def queue_notifier(self):
+        """Callback para o groq_scheduler (chamado da thread do agente) que mostra a posição na fila."""
+        loop = asyncio.get_running_loop()
+
+        def notify(position: int) -> None:
+            text = f"⏳ Muitos pedidos agora: você é o {position}º da fila. Já já chega a sua vez!"
+            asyncio.run_coroutine_threadsafe(self.update(text), loop)
+
+        return notify
+
+
+def get_store_prices(book_query: str) -> str:
+    """Preços reais das lojas raspadas (sem LLM), em Markdown do Telegram."""
+    resultados = get_price_index().buscar(book_query, limite=1, minimo=0.75)
+    if not resultados:
+        return ""
+    return f"\n\n💰 *Preços nas lojas*\n{formatar_ofertas(resultados[0])}"
+
+
+async def find_store_prices(book_query: str) -> str:
+    """get_store_prices fora do event loop; erro vira texto vazio."""
+    try:
+        return await asyncio.get_running_loop().run_in_executor(None, get_store_prices, book_query)
+    except Exception as e:
+        print(f"Falha ao consultar o índice de preços: {e}")
+        return ""
 
 
-async def get_recommendations(book_query: str) -> str:
-    agent = create_recommendation_agent()
-    response = agent.run(f"Recomende livros similares a: {book_query}")
-    return clean_response(response.content)
+# Miniatura já enviada -> file_id do Telegram (reenviar não faz upload de novo)
+_cover_file_ids = {}
 
 
-def clean_response(text: str) -> str:
-    text = re.sub(r"Running:.*?\n\n", "", text, flags=re.DOTALL)
-    text = re.sub(r"\*\*(.*?)\*\*", r"*\1*", text)
-    return text.strip()
+async def find_cover(book_query: str, livro: dict = None):
+    """Caminho da miniatura da capa do livro (catálogo ou índice de preços), ou None."""
+    if not COVERS_ENABLED:
+        return None
+    try:
+        if livro is None:
+            resultados = await asyncio.get_running_loop().run_in_executor(
+                None, lambda: get_price_index().buscar(book_query, limite=1, minimo=0.75)
+            )
+            livro = resultados[0] if resultados else {"ofertas": []}
+        url = cover_url(livro["ofertas"])
+        return await get_cover_store().aget(url) if url else None
+    except Exception as e:
+        print(f"Falha ao buscar a capa: {e}")
+        return None
+
+
+async def send_cover(update: Update, cover: asyncio.Task) -> None:
+    """Envia a capa se ela ficou pronta (find_cover já limita a espera)."""
+    path = await cover
+    if path is None:
+        return
+    message = update.message or update.callback_query.message
+    try:
+        with medir("telegram_envio", tipo="capa"):
+            if path in _cover_file_ids:
+                await message.reply_photo(photo=_cover_file_ids[path])
+                return
+            with open(path, "rb") as f:
+                sent = await message.reply_photo(photo=f)
+        if sent is not None and getattr(sent, "photo", None):
+            _cover_file_ids[path] = sent.photo[-1].file_id
+    except Exception as e:
+        print(f"Falha ao enviar a capa: {e}")
+
+
+async def find_in_catalog(book_query: str):
+    """Livro do catálogo local que corresponde à consulta, ou None (erro também vira None)."""
+    if not LOCAL_SEARCH_ENABLED:
+        return None
+    try:
+        # Na primeira chamada o índice é montado a partir dos arquivos: fora do loop
+        with medir("catalogo"):
+            livro = await asyncio.get_running_loop().run_in_executor(
+                None, lambda: get_catalog_search().encontrar(book_query)
+            )
+        registry.contar("catalogo_consultas_total", resultado="hit" if livro is not None else "miss")
+        return livro
+    except Exception as e:
+        print(f"Falha na busca local: {e}")
+        return None
+
+
+async def recommend_from_catalog(livro) -> list:
+    """Recomendações do catálogo local para o livro (erro vira lista vazia)."""
+    if livro is None:
+        return []
+    try:
+        # A similaridade percorre o catálogo inteiro: fora do loop, como a busca
+        with medir("catalogo_recomendacao"):
+            return await asyncio.get_running_loop().run_in_executor(
+                None, lambda: get_catalog_search().recomendar(livro)
+            )
+    except Exception as e:
+        print(f"Falha nas recomendações locais: {e}")
+        return []
 
 
 def get_send_function(update: Update):
     if update.message:
-        return update.message.reply_text
+        send = update.message.reply_text
     elif update.callback_query:
-        return update.callback_query.message.reply_text
+        send = update.callback_query.message.reply_text
     else:
         raise ValueError("Update não possui message nem callback_query")
 
+    async def timed_send(*args, **kwargs):
+        with medir("telegram_envio"):
+            return await send(*args, **kwargs)
+
+    return timed_send
+
 
 ##############################
 # INTERFACE - BOTÕES
@@ -142,13 +437,14 @@ def main_menu():
     )
 
 
-def post_diagnostico_menu():
-    return InlineKeyboardMarkup(
-        [
-            [InlineKeyboardButton("🌟 Recomendar livros a partir desse", callback_data='recomendacao')],
-            [InlineKeyboardButton("🔄 Recomeçar", callback_data='inicio')],
-        ]
-    )
+def post_diagnostico_menu(from_catalog: bool = False):
+    buttons = [
+        [InlineKeyboardButton("🌟 Recomendar livros a partir desse", callback_data='recomendacao')],
+        [InlineKeyboardButton("🔄 Recomeçar", callback_data='inicio')],
+    ]
+    if from_catalog:
+        buttons.insert(0, [InlineKeyboardButton("🤖 Análise completa com IA", callback_data='diagnostico_ia')])
+    return InlineKeyboardMarkup(buttons)
 
 
 def post_recommendation_menu():
@@ -163,8 +459,11 @@ def post_recommendation_menu():
 # HANDLERS
 ##############################
 
+# A ação escolhida no menu e o último livro de cada usuário ficam no
+# conversation_store (compartilhado entre réplicas), não em context.user_data
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    context.user_data.clear()
+    get_conversation_store().clear(update.effective_user.id)
     await update.message.reply_text(
         "👋 *Bem-vindo ao Catálogo Inteligente de Livros da Sarah!*\n\n"
         "Escolha uma opção abaixo:",
@@ -175,10 +474,13 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
-    await query.answer()
+    novo_trace("telegram_botao", acao=query.data)
+    store = get_conversation_store()
+    user_id = update.effective_user.id
+    state, _ = await asyncio.gather(store.load(user_id), query.answer())
 
     if query.data == 'inicio':
-        context.user_data.clear()
+        store.clear(user_id)
         await query.edit_message_text(
             "👋 *Menu Principal*\n\nEscolha uma opção:",
             reply_markup=main_menu(),
@@ -186,17 +488,23 @@ async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         )
 
     elif query.data == 'diagnostico':
-        context.user_data['action'] = 'diagnostico'
+        store.set(user_id, {**state, 'action': 'diagnostico'})
         await query.edit_message_text(
             "📖 *Diagnóstico do Livro*\n\nDigite o nome do livro que deseja analisar:",
             parse_mode="Markdown"
         )
 
+    elif query.data == 'diagnostico_ia' and 'last_book' in state:
+        await process_diagnostico(update, context, state['last_book'], use_catalog=False)
+
+    elif query.data == 'recomendacao_ia' and 'last_book' in state:
+        await process_recommendation(update, context, state['last_book'], use_catalog=False)
+
     elif query.data == 'recomendacao':
-        if 'last_book' in context.user_data:
-            await process_recommendation(update, context, context.user_data['last_book'])
+        if 'last_book' in state:
+            await process_recommendation(update, context, state['last_book'])
         else:
-            context.user_data['action'] = 'recomendacao'
+            store.set(user_id, {**state, 'action': 'recomendacao'})
             await query.edit_message_text(
                 "🌟 *Recomendar Livros*\n\nDigite o nome de um livro para obter recomendações:",
                 parse_mode="Markdown"
@@ -204,7 +512,10 @@ async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    action = context.user_data.get('action')
+    store = get_conversation_store()
+    user_id = update.effective_user.id
+    state = await store.load(user_id)
+    action = state.get('action')
 
     if not action:
         await update.message.reply_text(
@@ -214,7 +525,15 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return
 
     book_query = update.message.text
-    context.user_data['last_book'] = book_query
+    titles = split_titles(book_query)
+    if len(titles) > 1:
+        store.set(user_id, {**state, 'last_book': titles[0]})
+        novo_trace("telegram_mensagem", acao=action, titulos=len(titles))
+        await process_batch(update, context, action, titles)
+        return
+
+    store.set(user_id, {**state, 'last_book': book_query})
+    novo_trace("telegram_mensagem", acao=action)
 
     if action == 'diagnostico':
         await process_diagnostico(update, context, book_query)
@@ -222,38 +541,87 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await process_recommendation(update, context, book_query)
 
 
-async def process_diagnostico(update: Update, context: ContextTypes.DEFAULT_TYPE, book_query: str):
+@cronometrar("resposta", fluxo="diagnostico")
+async def process_diagnostico(update: Update, context: ContextTypes.DEFAULT_TYPE, book_query: str,
+                              use_catalog: bool = True):
     send = get_send_function(update)
-    processing_msg = await send("🔍 Buscando informações do livro...")
 
-    try:
-        info = await get_book_info(book_query)
-        await context.bot.edit_message_text(
-            chat_id=processing_msg.chat_id,
-            message_id=processing_msg.message_id,
-            text=f"📖 *Informações do Livro*\n\n{info}",
+    livro = await find_in_catalog(book_query) if use_catalog else None
+    if livro is not None:
+        cover = asyncio.create_task(find_cover(book_query, livro))
+        await send(
+            f"📖 *Informações do Livro* (catálogo)\n\n{formatar_livro(livro)}",
             parse_mode="Markdown"
         )
+        await send_cover(update, cover)
+        await send(
+            "O que deseja fazer agora?",
+            reply_markup=post_diagnostico_menu(from_catalog=True),
+        )
+        return
+
+    processing_msg = await send("🔍 Buscando informações do livro...")
+    # O índice de preços e a capa são locais: rodam em paralelo com o agente
+    prices = asyncio.create_task(find_store_prices(book_query))
+    cover = asyncio.create_task(find_cover(book_query))
+
+    try:
+        editor = ThrottledEditor(context.bot, processing_msg, "📖 *Informações do Livro*\n\n")
+        info = await get_book_info(book_query, on_partial=editor.update, on_queue=editor.queue_notifier())
+        info += await prices
+        first, *rest = split_message(f"📖 *Informações do Livro*\n\n{info}")
+        await editor.finish(first)
+        for part in rest:
+            await send(part, parse_mode="Markdown")
+        await send_cover(update, cover)
         await send(
             "O que deseja fazer agora?",
             reply_markup=post_diagnostico_menu(),
         )
+    except AgentTimeoutError:
+        await send("⏳ A busca demorou demais. Tente novamente em instantes.")
+    except SchedulerBusyError:
+        await send("🚦 Estamos com muitos pedidos agora. Tente novamente em alguns instantes.")
     except Exception as e:
         await send(f"❌ Ocorreu um erro: {str(e)}")
+    finally:
+        # Se o agente falhou, preços e capa não são mais esperados
+        prices.cancel()
+        cover.cancel()
 
 
-async def process_recommendation(update: Update, context: CallbackContext, book_query: str) -> None:
+@cronometrar("resposta", fluxo="recomendacao")
+async def process_recommendation(update: Update, context: CallbackContext, book_query: str,
+                                 use_catalog: bool = True) -> None:
     send = get_send_function(update)
 
+    livro = await find_in_catalog(book_query) if use_catalog else None
+    candidatos = await recommend_from_catalog(livro)
+    if len(candidatos) >= LOCAL_MIN_RECOMMENDATIONS:
+        await send(
+            text=f"🌟 *Livros Recomendados* (catálogo)\n\n{formatar_recomendacoes(candidatos)}",
+            parse_mode="Markdown"
+        )
+        await send(
+            "O que deseja fazer agora?",
+            reply_markup=InlineKeyboardMarkup(
+                [
+                    [InlineKeyboardButton("🤖 Recomendações da IA", callback_data="recomendacao_ia")],
+                    [InlineKeyboardButton("🔍 Buscar outro livro", callback_data="recomendacao")],
+                    [InlineKeyboardButton("🔄 Recomeçar", callback_data="inicio")]
+                ]
+            )
+        )
+        return
+
     processing_msg = await send("📚 Buscando recomendações...")
 
     try:
-        recommendations = await get_recommendations(book_query)
+        editor = ThrottledEditor(context.bot, processing_msg, "🌟 *Livros Recomendados*\n\n")
+        recommendations = await get_recommendations(book_query, on_partial=editor.update, on_queue=editor.queue_notifier())
 
-        await send(
-            text=f"🌟 *Livros Recomendados*\n\n{recommendations}",
-            parse_mode="Markdown"
-        )
+        for part in split_message(f"🌟 *Livros Recomendados*\n\n{recommendations}"):
+            await send(text=part, parse_mode="Markdown")
 
         await send(
             "O que deseja fazer agora?",
@@ -270,18 +638,120 @@ async def process_recommendation(update: Update, context: CallbackContext, book_
             message_id=processing_msg.message_id
         )
 
+    except AgentTimeoutError:
+        await send("⏳ A busca demorou demais. Tente novamente em instantes.")
+    except SchedulerBusyError:
+        await send("🚦 Estamos com muitos pedidos agora. Tente novamente em alguns instantes.")
     except Exception as e:
         await send(f"❌ Ocorreu um erro: {str(e)}")
 
 
 ##############################
-# CONFIGURAÇÃO DO BOT
+# LISTAS DE LIVROS
 ##############################
 
-def main() -> None:
-    keep_alive()  # Ativa a gambiarra para manter o Render feliz
+_LIST_MARKER = re.compile(r"^\s*(?:\d+[.)]|[-*•–])\s+")
+_TITLE_SEPARATOR = re.compile(r"[\n;]+")
+# Um semáforo por usuário, enquanto ele tiver alguma lista em andamento
+_user_limits = weakref.WeakValueDictionary()
+
 
-    application = Application.builder().token(TOKEN).build()
+def split_titles(text: str) -> list:
+    """'1. Duna\\n2. 1984\\n- duna' -> ['Duna', '1984'] (uma linha ou ';' por título)."""
+    titles, seen = [], set()
+    for line in _TITLE_SEPARATOR.split(text):
+        title = _LIST_MARKER.sub("", line).strip(" \t\"'“”")
+        key = normalize_query(title)
+        if key and key not in seen:
+            seen.add(key)
+            titles.append(title)
+    return titles
+
+
+async def batch_answer(action: str, title: str) -> str:
+    """Resposta de um título da lista: catálogo primeiro, agente se precisar."""
+    livro = await find_in_catalog(title)
+    if action == 'diagnostico':
+        if livro is not None:
+            return formatar_livro(livro)
+        info = await get_book_info(title)
+        return info + await asyncio.get_running_loop().run_in_executor(None, get_store_prices, title)
+
+    candidatos = await recommend_from_catalog(livro)
+    if len(candidatos) >= LOCAL_MIN_RECOMMENDATIONS:
+        return formatar_recomendacoes(candidatos)
+    return await get_recommendations(title)
+
+
+@cronometrar("resposta", fluxo="lista")
+async def process_batch(update: Update, context: ContextTypes.DEFAULT_TYPE, action: str, titles: list) -> None:
+    """Busca os títulos em paralelo (até BATCH_CONCURRENCY por usuário) e envia
+    cada resultado assim que fica pronto; os que terminam enquanto uma mensagem
+    está sendo enviada vão juntos na próxima, até o limite do Telegram."""
+    send = get_send_function(update)
+    icon = "📖" if action == 'diagnostico' else "🌟"
+    extra = titles[BATCH_MAX_TITLES:]
+    titles = titles[:BATCH_MAX_TITLES]
+
+    header = f"{icon} Buscando {len(titles)} livros..."
+    if extra:
+        header += f"\n(só os {BATCH_MAX_TITLES} primeiros; mande os outros {len(extra)} depois)"
+    await send(header)
+
+    limit = _user_limits.get(update.effective_user.id)
+    if limit is None:
+        limit = _user_limits[update.effective_user.id] = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def lookup(title: str) -> str:
+        async with limit:
+            try:
+                with medir("lista_item", acao=action):
+                    answer = await batch_answer(action, title)
+            except AgentTimeoutError:
+                answer = "⏳ A busca demorou demais. Tente este de novo em instantes."
+            except SchedulerBusyError:
+                answer = "🚦 Estamos com muitos pedidos agora. Tente este de novo em alguns instantes."
+            except Exception as e:
+                answer = f"❌ Ocorreu um erro: {escape_markdown(str(e))}"
+        return f"{icon} *{escape_markdown(title)}*\n\n{answer}"
+
+    ready = asyncio.Queue()
+    tasks = [asyncio.create_task(lookup(title)) for title in titles]
+    for task in tasks:
+        task.add_done_callback(ready.put_nowait)
+
+    try:
+        delivered = 0
+        while delivered < len(tasks):
+            finished = [await ready.get()]
+            while not ready.empty():
+                finished.append(ready.get_nowait())
+            delivered += len(finished)
+            for message in pack_messages([task.result() for task in finished]):
+                await send(message, parse_mode="Markdown")
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    await send(
+        "O que deseja fazer agora?",
+        reply_markup=main_menu(),
+    )
+
+
+##############################
+# CONFIGURAÇÃO DO BOT
+##############################
+
+def build_application() -> Application:
+    # Permite que vários chats sejam atendidos ao mesmo tempo; o limite real
+    # de chamadas simultâneas aos agentes fica no pool do agent_runner
+    application = (
+        Application.builder()
+        .token(TOKEN)
+        .concurrent_updates(CONCURRENT_UPDATES if CONCURRENT_UPDATES > 1 else False)
+        .build()
+    )
 
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("ajuda", start))
@@ -289,8 +759,29 @@ def main() -> None:
     application.add_handler(CallbackQueryHandler(handle_buttons))
 
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    return application
+
+
+def webhook_secret() -> str:
+    if WEBHOOK_SECRET:
+        return WEBHOOK_SECRET
+    return hashlib.sha256(f"webhook:{TOKEN}".encode()).hexdigest()
+
 
-    application.run_polling()
+def bot_setup() -> dict:
+    """O que o webhook_server.serve precisa para subir o bot."""
+    return {
+        "application": build_application(),
+        "webhook_url": WEBHOOK_URL,
+        "secret": webhook_secret() if WEBHOOK_URL else None,
+        "max_connections": min(max(CONCURRENT_UPDATES, 1), 100),
+        "post_init": post_init,
+    }
+
+
+def main() -> None:
+    # Aqui os imports já foram feitos; boot_telegram.py abre a porta antes deles
+    asyncio.run(serve(bot_setup, PORT, health_message=HEALTH_MESSAGE))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,73 @@
+# Mede o custo de preparar um agente por mensagem: antes (agente + cliente
+# Groq novos a cada chamada) e depois (pool de agentes + cliente compartilhado).
+#
+# Uso (a partir da pasta script/):
+#   python -m benchmarks.bench_agent_pool            # só custo local
+#   python -m benchmarks.bench_agent_pool --live     # inclui ida e volta na Groq
+import argparse
+import statistics
+import time
+
+from phi.agent import Agent
+from phi.model.groq import Groq
+from phi.tools.googlesearch import GoogleSearch
+
+from app_telegram import book_info_agents, create_book_info_agent
+from agent_pool import get_groq_client
+
+
+_template = create_book_info_agent()
+
+
+def legacy_agent():
+    # Réplica do create_book_info_agent original (sem cliente compartilhado)
+    return Agent(name=_template.name, model=Groq(id=_template.model.id), tools=[GoogleSearch()],
+                 instructions=_template.instructions, show_tool_calls=False, markdown=True)
+
+
+def measure(fn, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), max(samples)
+
+
+def before_local():
+    legacy_agent().model.get_client()
+
+
+def after_local():
+    with book_info_agents.acquire() as agent:
+        agent.model.get_client()
+
+
+def before_live():
+    legacy_agent().model.get_client().models.list()
+
+
+def after_live():
+    with book_info_agents.acquire() as agent:
+        agent.model.get_client().models.list()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--live", action="store_true", help="faz uma chamada real à API da Groq")
+    args = parser.parse_args()
+
+    scenarios = [("preparo local", before_local, after_local)]
+    if args.live:
+        get_groq_client().models.list()  # abre a conexão do cliente compartilhado
+        scenarios.append(("ida e volta Groq", before_live, after_live))
+
+    for name, before, after in scenarios:
+        b_med, b_max = measure(before, args.repeat)
+        a_med, a_max = measure(after, args.repeat)
+        print(f"{name:>18}: antes {b_med:8.2f} ms (máx {b_max:.2f}) | depois {a_med:8.2f} ms (máx {a_max:.2f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# Compara a extração antiga dos cards da Amazon (4–5 query_selector/inner_text
+# por card, relendo todos os cards a cada "Ver mais") com a extração em lote
+# (um page.evaluate por lote, só com os cards novos), sobre uma página salva.
+#
+# O "Ver mais" é simulado movendo 24 cards do <template id="mais-cards"> para
+# o carrossel a cada rodada.
+#
+# Uso (a partir da pasta script/):
+#   python -m benchmarks.bench_amazon_extract [--repeat 3]
+import argparse
+import os
+import time
+
+from playwright.sync_api import sync_playwright
+
+from get_amazon import SELETOR_CARD, extrair_lote
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "amazon_carousel.html")
+
+VER_MAIS = """
+() => {
+    const template = document.getElementById("mais-cards");
+    const cards = Array.from(template.content.children).slice(0, 24);
+    cards.forEach((card) => document.querySelector("ol.a-carousel").appendChild(card));
+    return cards.length;
+}
+"""
+
+
+def extracao_antiga(page):
+    livros = []
+    for item in page.query_selector_all(SELETOR_CARD):
+        nome = item.query_selector("span.dcl-truncate span").inner_text().strip()
+        link_img = item.query_selector("img").get_attribute("src")
+        preco_novo = item.query_selector("span.a-price .a-offscreen").inner_text().strip()
+        preco_antigo_tag = item.query_selector("div.dcl-product-old-price-section .a-text-price .a-offscreen")
+        preco_antigo = preco_antigo_tag.inner_text().strip() if preco_antigo_tag else None
+        livros.append((nome, link_img, preco_novo, preco_antigo))
+    return livros
+
+
+def rodar(page, html, extrair):
+    page.set_content(html)
+    total = 0
+    start = time.perf_counter()
+    while True:
+        total += len(extrair(page))
+        if not page.evaluate(VER_MAIS):
+            break
+    return time.perf_counter() - start, total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with open(FIXTURE, encoding="utf-8") as f:
+        html = f.read()
+
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=True)
+        page = browser.new_page()
+        for nome, extrair in (("antiga", extracao_antiga), ("em lote", extrair_lote)):
+            tempos = []
+            for _ in range(args.repeat):
+                segundos, registros = rodar(page, html, extrair)
+                tempos.append(segundos)
+            print(f"{nome:>8}: {min(tempos) * 1000:8.1f} ms, {registros} registros gravados")
+        browser.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+# Compara a extração do __NEXT_DATA__ pelo BeautifulSoup (caminho antigo) com
+# a busca direta nos bytes, usando as páginas salvas em benchmarks/fixtures.
+#
+# Uso (a partir da pasta script/):
+#   python -m benchmarks.bench_next_data [--repeat 50]
+import argparse
+import glob
+import json
+import os
+import time
+
+import get_americanas
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "americanas_*.html")
+
+
+def rapido_com_json_padrao(html: bytes):
+    tag = get_americanas._NEXT_DATA_TAG.search(html)
+    return json.loads(html[tag.end():html.find(b"</script>", tag.end())])
+
+
+def measure(fn, data, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(data)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    caminhos = {
+        "bs4 + json": get_americanas.extrair_next_data_bs4,
+        "bytes + json": rapido_com_json_padrao,
+        f"bytes + {get_americanas.json_loads.__module__}": get_americanas.extrair_next_data_rapido,
+    }
+
+    for path in sorted(glob.glob(FIXTURES)):
+        with open(path, "rb") as f:
+            html = f.read()
+        assert get_americanas.extrair_next_data_rapido(html) == get_americanas.extrair_next_data_bs4(html)
+
+        print(f"{os.path.basename(path)} ({len(html) / 1024:.0f} KiB)")
+        base = None
+        for nome, fn in caminhos.items():
+            ms = measure(fn, html, args.repeat)
+            base = base or ms
+            print(f"  {nome:>14}: {ms:8.3f} ms/página  ({base / ms:5.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
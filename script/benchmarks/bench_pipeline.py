@@ -0,0 +1,297 @@
+# Benchmark de ponta a ponta dos bots, sem rede: a Groq e as ferramentas de
+# busca são trocadas pelos stubs de benchmarks/stubs.py (latência e jitter
+# configuráveis) e a API do Telegram por um bot falso com latência fixa.
+#
+# Cenários:
+#   telegram   cada sessão aperta "Diagnóstico", manda um título e depois
+#              aperta "Recomendar" (handle_buttons / handle_message)
+#   streamlit  cada sessão abre o app_library (AppTest), digita um título e
+#              clica em "Buscar Livro"
+#
+# Relata vazão e p50/p95/p99 por etapa. Com --limite-p95 o processo sai com
+# código 1 se alguma etapa passar do limite (para usar no CI).
+#
+# Uso (a partir da pasta script/):
+#   python -m benchmarks.bench_pipeline [--cenario telegram|streamlit|todos]
+#       [--sessoes 40] [--concorrencia 8] [--llm-latencia 0.8] [--llm-jitter 0.3]
+#       [--busca-latencia 0.3] [--repeticao 0.2] [--estado sqlite|redis-local]
+#       [--json saida.json] [--limite-p95 10]
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from benchmarks.stubs import ConfigStub, Latencia, RedisLocal, instalar
+
+FALHAS = ("❌", "🚦", "⏳ A busca demorou")
+
+
+def configurar_ambiente(args) -> None:
+    # Precisa vir antes de importar os apps: a configuração é lida no import
+    os.environ["GROQ_API_KEY"] = "benchmark"
+    os.environ["TELEGRAM_BOT_TOKEN"] = "123:benchmark"
+    pasta = tempfile.mkdtemp(prefix="bench_cache_")
+    os.environ["CACHE_PATH"] = os.path.join(pasta, "cache.sqlite3")
+    os.environ["CONVERSATION_STORE"] = os.path.join(pasta, "conversas.sqlite3")
+    os.environ["METRICS_LOG"] = args.metrics_log or ""
+    os.environ["LOCAL_SEARCH_ENABLED"] = "1" if args.catalogo else "0"
+    if not args.limites_reais:
+        # Sem os limites da conta o que se mede é o pipeline, não o token bucket
+        os.environ["GROQ_RPM"] = "1000000"
+        os.environ["GROQ_TPM"] = "1000000000"
+        os.environ["GROQ_QUEUE_MAX"] = "100000"
+        # Nem mexe nos baldes da conta que o bot de verdade divide
+        os.environ["GROQ_LIMITS_STORE"] = ""
+
+
+def titulos(args):
+    """Consultas das sessões: uma fração repete títulos "populares" (cache e agrupamento)."""
+    rng = random.Random(args.seed)
+    populares = [f"Livro Popular {i}" for i in range(5)]
+    return [rng.choice(populares) if rng.random() < args.repeticao else f"Livro Simulado {i}"
+            for i in range(args.sessoes)]
+
+
+def percentil(valores, q: float) -> float:
+    ordenados = sorted(valores)
+    return ordenados[min(int(q * len(ordenados)), len(ordenados) - 1)]
+
+
+def resumir(cenario: str, amostras: dict, erros: dict, duracao: float, sessoes: int) -> dict:
+    etapas = {}
+    for etapa, valores in amostras.items():
+        etapas[etapa] = {
+            "n": len(valores), "erros": erros.get(etapa, 0),
+            "p50": percentil(valores, 0.5), "p95": percentil(valores, 0.95),
+            "p99": percentil(valores, 0.99), "max": max(valores),
+        }
+    return {"cenario": cenario, "sessoes": sessoes, "duracao": duracao,
+            "sessoes_por_segundo": sessoes / duracao if duracao else 0.0, "etapas": etapas}
+
+
+def imprimir(resultado: dict) -> None:
+    print(f"\n== {resultado['cenario']}: {resultado['sessoes']} sessões em {resultado['duracao']:.1f}s "
+          f"({resultado['sessoes_por_segundo']:.2f} sessões/s)")
+    print(f"{'etapa':>14} {'n':>5} {'erros':>5} {'p50':>8} {'p95':>8} {'p99':>8} {'máx':>8}")
+    for etapa, e in resultado["etapas"].items():
+        print(f"{etapa:>14} {e['n']:>5} {e['erros']:>5} {e['p50']:>7.2f}s {e['p95']:>7.2f}s "
+              f"{e['p99']:>7.2f}s {e['max']:>7.2f}s")
+
+
+########## Telegram ##########
+
+class FakeBot:
+    """Só o que os handlers usam da API do Telegram, com latência simulada."""
+
+    def __init__(self, latencia: float):
+        self.latencia = latencia
+        self._ids = itertools.count(1)
+        self._textos = {}   # (chat_id, message_id) -> texto atual
+
+    async def _chamada(self):
+        await asyncio.sleep(self.latencia)
+
+    async def editar(self, chat_id, message_id, text) -> None:
+        await self._chamada()
+        # Como o Telegram: editar com o mesmo texto é erro
+        if self._textos.get((chat_id, message_id)) == text:
+            from telegram.error import BadRequest
+
+            raise BadRequest("Message is not modified: specified new message content and reply markup "
+                             "are exactly the same as a current content and reply markup of the message")
+        self._textos[(chat_id, message_id)] = text
+
+    async def edit_message_text(self, text=None, chat_id=None, message_id=None, **kwargs):
+        await self.editar(chat_id, message_id, text)
+
+    async def delete_message(self, **kwargs):
+        await self._chamada()
+
+
+class FakeMessage:
+    def __init__(self, bot: FakeBot, chat_id: int, text: str = None, enviados: list = None):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = next(bot._ids)
+        self.text = text
+        if text is not None:
+            bot._textos[(chat_id, self.message_id)] = text
+        self.enviados = enviados if enviados is not None else []
+
+    async def reply_text(self, text=None, **kwargs):
+        await self.bot._chamada()
+        self.enviados.append(text or "")
+        return FakeMessage(self.bot, self.chat_id, text, self.enviados)
+
+    async def reply_photo(self, photo=None, **kwargs):
+        await self.bot._chamada()
+        return FakeMessage(self.bot, self.chat_id, None, self.enviados)
+
+
+class FakeCallbackQuery:
+    def __init__(self, data: str, message: FakeMessage):
+        self.data = data
+        self.message = message
+
+    async def answer(self):
+        await self.message.bot._chamada()
+
+    async def edit_message_text(self, text=None, **kwargs):
+        await self.message.bot.editar(self.message.chat_id, self.message.message_id, text)
+
+
+async def sessao_telegram(app, bot, chat_id: int, titulo: str, amostras: dict, erros: dict) -> None:
+    context = SimpleNamespace(bot=bot)
+    usuario = SimpleNamespace(id=chat_id)
+    enviados = []
+    menu = FakeMessage(bot, chat_id, enviados=enviados)
+
+    passos = [
+        ("menu", lambda: app.handle_buttons(SimpleNamespace(
+            message=None, effective_user=usuario, callback_query=FakeCallbackQuery("diagnostico", menu)), context)),
+        ("diagnostico", lambda: app.handle_message(SimpleNamespace(
+            message=FakeMessage(bot, chat_id, titulo, enviados), effective_user=usuario, callback_query=None), context)),
+        ("recomendacao", lambda: app.handle_buttons(SimpleNamespace(
+            message=None, effective_user=usuario, callback_query=FakeCallbackQuery("recomendacao", menu)), context)),
+    ]
+    for etapa, passo in passos:
+        antes = len(enviados)
+        inicio = time.perf_counter()
+        try:
+            await passo()
+            falhou = any(texto.startswith(FALHAS) for texto in enviados[antes:])
+        except Exception as e:
+            print(f"[{etapa}] {type(e).__name__}: {e}", file=sys.stderr)
+            falhou = True
+        amostras.setdefault(etapa, []).append(time.perf_counter() - inicio)
+        if falhou:
+            erros[etapa] = erros.get(etapa, 0) + 1
+
+
+def instalar_estado(args) -> None:
+    """--estado redis-local: as conversas vão para o stand-in do Redis, com a
+    latência de rede de --estado-latencia por round-trip."""
+    if args.estado != "redis-local":
+        return
+    import conversation_store
+
+    with conversation_store._store_lock:
+        conversation_store._store = conversation_store.ConversationStore(
+            conversation_store.RedisBackend(RedisLocal(args.estado_latencia))
+        )
+
+
+async def rodar_telegram(args, consultas) -> dict:
+    import app_telegram
+
+    instalar_estado(args)
+    bot = FakeBot(args.telegram_latencia)
+    limite = asyncio.Semaphore(args.concorrencia)
+    amostras, erros = {}, {}
+
+    async def sessao(chat_id, titulo):
+        async with limite:
+            await sessao_telegram(app_telegram, bot, chat_id, titulo, amostras, erros)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(sessao(i, titulo) for i, titulo in enumerate(consultas, 1)))
+    return resumir("telegram", amostras, erros, time.perf_counter() - inicio, len(consultas))
+
+
+########## Streamlit ##########
+
+def sessao_streamlit(titulo: str, timeout: float):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(os.path.dirname(os.path.dirname(__file__)), "app_library.py"),
+                           default_timeout=timeout)
+    at.run()
+    at.text_input[0].input(titulo)
+    botao = next(b for b in at.button if b.label == "Buscar Livro")
+    inicio = time.perf_counter()
+    botao.click().run()
+    duracao = time.perf_counter() - inicio
+    falhou = bool(at.exception) or bool(at.error) or any("🚦" in w.value for w in at.warning)
+    return duracao, falhou
+
+
+def rodar_streamlit(args, consultas) -> dict:
+    # As threads dos agentes não têm ScriptRunContext (e nem precisam): o aviso só polui a saída
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").setLevel(logging.ERROR)
+    amostras, erros = {"busca": []}, {}
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concorrencia) as executor:
+        for duracao, falhou in executor.map(lambda t: sessao_streamlit(t, args.timeout), consultas):
+            amostras["busca"].append(duracao)
+            if falhou:
+                erros["busca"] = erros.get("busca", 0) + 1
+    return resumir("streamlit", amostras, erros, time.perf_counter() - inicio, len(consultas))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cenario", choices=["telegram", "streamlit", "todos"], default="todos")
+    parser.add_argument("--sessoes", type=int, default=40)
+    parser.add_argument("--concorrencia", type=int, default=8)
+    parser.add_argument("--llm-latencia", type=float, default=0.8, help="segundos até o primeiro token")
+    parser.add_argument("--llm-jitter", type=float, default=0.3, help="fração da latência, para mais ou para menos")
+    parser.add_argument("--llm-tokens-por-segundo", type=float, default=250.0)
+    parser.add_argument("--palavras-resposta", type=int, default=300)
+    parser.add_argument("--busca-latencia", type=float, default=0.3)
+    parser.add_argument("--busca-jitter", type=float, default=0.3)
+    parser.add_argument("--sem-ferramentas", action="store_true", help="o modelo responde sem chamar a busca")
+    parser.add_argument("--telegram-latencia", type=float, default=0.05, help="cada chamada à API do Telegram")
+    parser.add_argument("--repeticao", type=float, default=0.2, help="fração de sessões com títulos repetidos")
+    parser.add_argument("--estado", choices=["sqlite", "redis-local"], default="sqlite",
+                        help="onde o bot guarda o estado das conversas")
+    parser.add_argument("--estado-latencia", type=float, default=0.001, help="round-trip do redis-local (s)")
+    parser.add_argument("--catalogo", action="store_true", help="deixa o catálogo local responder quando acertar")
+    parser.add_argument("--limites-reais", action="store_true", help="mantém GROQ_RPM/GROQ_TPM configurados")
+    parser.add_argument("--timeout", type=float, default=120.0, help="timeout de cada sessão do Streamlit")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--metrics-log", help="grava também o log JSON do módulo metrics")
+    parser.add_argument("--json", help="salva o resultado neste arquivo")
+    parser.add_argument("--limite-p95", type=float, help="falha se o p95 de alguma etapa passar disso (s)")
+    args = parser.parse_args()
+
+    configurar_ambiente(args)
+    instalar(ConfigStub(
+        primeiro_token=Latencia(args.llm_latencia, args.llm_jitter),
+        busca=Latencia(args.busca_latencia, args.busca_jitter),
+        tokens_por_segundo=args.llm_tokens_por_segundo,
+        palavras_resposta=args.palavras_resposta,
+        usar_ferramentas=not args.sem_ferramentas,
+        seed=args.seed,
+    ))
+
+    consultas = titulos(args)
+    resultados = []
+    if args.cenario in ("telegram", "todos"):
+        resultados.append(asyncio.run(rodar_telegram(args, consultas)))
+    if args.cenario in ("streamlit", "todos"):
+        resultados.append(rodar_streamlit(args, consultas))
+
+    for resultado in resultados:
+        imprimir(resultado)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"parametros": vars(args), "resultados": resultados}, f, ensure_ascii=False, indent=2)
+
+    falhas = sum(e["erros"] for r in resultados for e in r["etapas"].values())
+    lentas = [f"{r['cenario']}/{etapa}" for r in resultados for etapa, e in r["etapas"].items()
+              if args.limite_p95 is not None and e["p95"] > args.limite_p95]
+    if falhas or lentas:
+        print(f"\n{falhas} sessões com erro; p95 acima do limite: {', '.join(lentas) or 'nenhuma'}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
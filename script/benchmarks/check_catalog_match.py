@@ -0,0 +1,77 @@
+# Confere o casamento de consultas com o catálogo sobre um catálogo
+# sintético: títulos curtos contidos numa consulta maior ('Filhos de Duna',
+# 'A casa dos espíritos') não podem casar com outro livro (DUNA, A CASA) e
+# levar os preços dele; variações do mesmo título continuam casando, também
+# com o autor que o bot pede junto ('1984 (George Orwell)'). Para responder
+# só com o catálogo (sem agente) o casamento tem de ser quase exato.
+#
+# Uso (a partir da pasta script/):
+#   python -m benchmarks.check_catalog_match
+from catalog_search import CatalogSearch
+from price_index import PriceIndex
+
+# Limiar das ofertas mostradas junto da resposta do agente (get_store_prices)
+LIMIAR_PRECOS = 0.75
+
+CATALOGO = ["Duna", "A Casa", "Sapiens", "O Senhor dos Anéis", "1984", "Messias"]
+
+NAO_CASAM = [
+    "Filhos de Duna",
+    "O Messias de Duna",
+    "Dunas",
+    "A casa dos espíritos",
+    "Homo Deus, de autor de Sapiens",
+]
+
+# Parecidas com um título do catálogo, mas não o bastante para pular o agente
+PARECIDAS = ["Dunas", "O Senhor", "O Senhor dos Anéis: As Duas Torres", "O Senhor (J. R. R. Tolkien)"]
+
+CASAM = {
+    "duna": "DUNA",
+    "O senhor dos aneis": "O SENHOR DOS ANEIS",
+    "Senhor dos Anéis, O": "O SENHOR DOS ANEIS",
+    "1984": "1984",
+    "1984 (George Orwell)": "1984",
+    "Sapiens (Yuval Noah Harari)": "SAPIENS",
+    "Duna - Frank Herbert": "DUNA",
+    "Sapiens por Yuval Noah Harari": "SAPIENS",
+}
+
+
+def construir() -> PriceIndex:
+    indice = PriceIndex()
+    for titulo in CATALOGO:
+        indice.adicionar("americanas", {"nome_livro": titulo, "preco_novo": "39,90"})
+    return indice
+
+
+def main() -> None:
+    indice = construir()
+    falhas = []
+    for consulta in NAO_CASAM:
+        resultados = indice.buscar(consulta, limite=1, minimo=LIMIAR_PRECOS)
+        if resultados:
+            falhas.append(f"{consulta!r} casou com {resultados[0]['titulo']!r} ({resultados[0]['score']})")
+    for consulta, esperado in CASAM.items():
+        resultados = indice.buscar(consulta, limite=1, minimo=LIMIAR_PRECOS)
+        if not resultados or resultados[0]["titulo"] != esperado:
+            falhas.append(f"{consulta!r} deveria casar com {esperado!r}: {resultados}")
+
+    busca = CatalogSearch(indice, modo="trigram")
+    for consulta in NAO_CASAM + PARECIDAS:
+        livro = busca.encontrar(consulta)
+        if livro is not None:
+            falhas.append(f"{consulta!r} pularia o agente com {livro['titulo']!r} ({livro['score']})")
+    for consulta, esperado in CASAM.items():
+        livro = busca.encontrar(consulta)
+        if livro is None or livro["titulo"] != esperado:
+            falhas.append(f"{consulta!r} deveria ser respondida pelo catálogo com {esperado!r}")
+
+    for falha in falhas:
+        print(falha)
+    assert not falhas, f"{len(falhas)} casamentos errados"
+    print(f"ok: {len(NAO_CASAM)} consultas recusadas, {len(CASAM)} aceitas")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# Confere a limpeza em stream (postprocess.StreamCleaner): para textos
+# aleatórios com os marcadores que dão trabalho (negrito sem par, links pela
+# metade, cercas ```, rastros 'Running:' e <think>), o resultado pedaço a
+# pedaço tem de ser igual ao de clean_response no texto inteiro, qualquer
+# que seja o corte dos pedaços, e cada texto parcial tem de ser começo do
+# final (o Telegram edita a mensagem com ele). Também confere que o tempo
+# cresce linearmente nos casos que já foram quadráticos.
+#
+# Uso (a partir da pasta script/):
+#   python -m benchmarks.check_postprocess [--textos 3000] [--semente 0]
+import time
+import random
+import argparse
+
+from postprocess import StreamCleaner, clean_response, _TelegramMarkdown
+
+PECAS = [
+    "a", "b", "palavra", " ", " ", "  ", "\t", "\n", "\n", "\n\n", "é", "😀", "1",
+    "*", "**", "_", "__", "`", "```", "```python\n", "\\", "[", "]", "](", "(", ")",
+    "#", "## ", "* ", "+ ", "  * ", "http://x.y",
+    "Running:", "<think>", "</think>", "<thi", "Runn",
+]
+
+# Entradas que faziam a busca do fechamento recomeçar a cada marcador/pedaço
+PATOLOGICOS = {
+    "colchetes": lambda n: "[a" * n,
+    "links sem fim": lambda n: "[a](b " * n,
+    "negrito": lambda n: "**a b " * n,
+    "negrito aberto": lambda n: "**" + "a b " * n,
+    "espacos": lambda n: " " * n,
+}
+
+
+def texto_aleatorio(rng: random.Random) -> str:
+    return "".join(rng.choice(PECAS) for _ in range(rng.randint(0, 60)))
+
+
+def em_pedacos(texto: str, rng: random.Random) -> list:
+    pedacos = []
+    i = 0
+    while i < len(texto):
+        tamanho = rng.choice((1, 1, 2, 3, 5, 8, 13))
+        pedacos.append(texto[i:i + tamanho])
+        i += tamanho
+    return pedacos
+
+
+def conferir(texto: str, pedacos: list, telegram: bool) -> str:
+    """Devolve a descrição da divergência (ou '' se está tudo certo)."""
+    esperado = clean_response(texto, telegram)
+    cleaner = StreamCleaner(telegram)
+    parciais = [cleaner.feed(pedaco) for pedaco in pedacos]
+    final = cleaner.finish()
+    if final != esperado:
+        return f"final {final!r} != {esperado!r}"
+    for parcial in parciais:
+        if telegram and not final.startswith(parcial):
+            return f"parcial {parcial!r} não é começo de {final!r}"
+    return ""
+
+
+def tempo(texto: str, tamanho: int = 5) -> float:
+    # Só a conversão: StreamCleaner.feed devolve o texto acumulado inteiro a
+    # cada pedaço, o que já custa o tamanho da resposta por chamada
+    markdown = _TelegramMarkdown()
+    inicio = time.perf_counter()
+    for i in range(0, len(texto), tamanho):
+        markdown.feed(texto[i:i + tamanho])
+    markdown.feed("", final=True)
+    # O texto inteiro de uma vez passa pelo mesmo caminho
+    clean_response(texto)
+    return time.perf_counter() - inicio
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--textos", type=int, default=3000)
+    parser.add_argument("--semente", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.semente)
+    falhas = []
+    for _ in range(args.textos):
+        texto = texto_aleatorio(rng)
+        for telegram in (True, False):
+            erro = conferir(texto, em_pedacos(texto, rng), telegram)
+            if erro:
+                falhas.append(f"{texto!r} (telegram={telegram}): {erro}")
+    for falha in falhas[:10]:
+        print(falha)
+    assert not falhas, f"{len(falhas)} textos com resultado diferente em stream"
+
+    for nome, gerar in PATOLOGICOS.items():
+        # Linear: 8x o texto leva ~8x o tempo (quadrático levaria ~64x)
+        razao = tempo(gerar(40000)) / tempo(gerar(5000))
+        print(f"{nome}: 8x o texto, {razao:.1f}x o tempo")
+        assert razao < 20, f"{nome}: tempo cresce mais que linearmente ({razao:.1f}x)"
+    print(f"ok: {args.textos} textos iguais em stream e de uma vez")
+
+
+if __name__ == "__main__":
+    main()
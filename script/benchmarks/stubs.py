@@ -0,0 +1,228 @@
+# Substitutos locais e determinísticos da API da Groq e das ferramentas de
+# busca, para os benchmarks rodarem sem rede (e sem gastar cota).
+#
+# A Groq é simulada na camada HTTP (httpx.MockTransport no cliente
+# compartilhado do agent_pool): o ScheduledGroq, o agendador, o stream e o
+# ciclo de chamada de ferramenta do phi rodam de verdade. A latência de cada
+# resposta sai de um gerador aleatório semeado pelo conteúdo do pedido, então
+# a mesma carga produz as mesmas esperas a cada execução.
+import functools
+import hashlib
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+
+import httpx
+
+
+@dataclass
+class Latencia:
+    media: float
+    jitter: float = 0.0   # fração da média, para mais ou para menos
+
+    def sortear(self, rng: random.Random) -> float:
+        return max(self.media * rng.uniform(1 - self.jitter, 1 + self.jitter), 0.0)
+
+
+@dataclass
+class ConfigStub:
+    primeiro_token: Latencia   # até o primeiro pedaço da resposta
+    busca: Latencia            # cada chamada de ferramenta de busca
+    tokens_por_segundo: float = 250.0
+    palavras_resposta: int = 300
+    pedacos: int = 20
+    usar_ferramentas: bool = True
+    seed: int = 0
+
+
+def _rng(config: ConfigStub, *partes) -> random.Random:
+    chave = hashlib.sha1(repr((config.seed,) + partes).encode("utf-8")).hexdigest()
+    return random.Random(int(chave[:16], 16))
+
+
+def _resposta_final(pedido: str, palavras: int) -> str:
+    # Traz um bloco <think> e Markdown, como o deepseek, para a limpeza ter trabalho
+    corpo = " ".join(f"palavra{i % 97}" for i in range(palavras))
+    return (
+        f"<think>Pensando sobre {pedido}...</think>\n"
+        f"**Título:** {pedido}\n**Autor:** Autor Simulado\n\n- Gênero: Ficção\n- Nota: 4,2\n\n{corpo}"
+    )
+
+
+def _usage(prompt: str, completion: str) -> dict:
+    prompt_tokens, completion_tokens = len(prompt) // 4, len(completion) // 4
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+def _chamada_de_ferramenta(corpo: dict, pedido: str):
+    """Na primeira volta do agente, pede uma busca com a própria consulta."""
+    funcao = corpo["tools"][0]["function"]
+    parametro = (funcao["parameters"].get("required") or list(funcao["parameters"]["properties"]))[0]
+    return {"id": "call_bench", "type": "function",
+            "function": {"name": funcao["name"], "arguments": json.dumps({parametro: pedido})}}
+
+
+def _sse(dados: dict) -> bytes:
+    return f"data: {json.dumps(dados)}\n\n".encode("utf-8")
+
+
+class StubGroq:
+    """Handler do MockTransport que responde como o endpoint de chat da Groq."""
+
+    def __init__(self, config: ConfigStub):
+        self.config = config
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        if not request.url.path.endswith("/chat/completions"):
+            return httpx.Response(200, json={"object": "list", "data": []})
+
+        corpo = json.loads(request.content)
+        mensagens = corpo["messages"]
+        pedido = next((m["content"] for m in reversed(mensagens) if m["role"] == "user"), "")
+        ja_buscou = any(m["role"] == "tool" for m in mensagens)
+        rng = _rng(self.config, pedido, ja_buscou)
+        prompt = json.dumps(mensagens)
+
+        ferramenta = None
+        if self.config.usar_ferramentas and corpo.get("tools") and not ja_buscou:
+            ferramenta = _chamada_de_ferramenta(corpo, pedido)
+            texto = ""
+        else:
+            texto = _resposta_final(pedido, self.config.palavras_resposta)
+
+        espera = self.config.primeiro_token.sortear(rng)
+        base = {"id": "chatcmpl-bench", "created": int(time.time()), "model": corpo["model"]}
+        if not corpo.get("stream"):
+            time.sleep(espera + len(texto) / 4 / self.config.tokens_por_segundo)
+            mensagem = {"role": "assistant", "content": texto or None}
+            if ferramenta:
+                mensagem["tool_calls"] = [ferramenta]
+            return httpx.Response(200, json={
+                **base, "object": "chat.completion",
+                "choices": [{"index": 0, "message": mensagem,
+                             "finish_reason": "tool_calls" if ferramenta else "stop"}],
+                "usage": _usage(prompt, texto),
+            })
+
+        def eventos():
+            time.sleep(espera)
+            chunk = {**base, "object": "chat.completion.chunk"}
+            if ferramenta:
+                delta = {"role": "assistant", "tool_calls": [{"index": 0, **ferramenta}]}
+                yield _sse({**chunk, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+            else:
+                tamanho = max(len(texto) // self.config.pedacos, 1)
+                for inicio in range(0, len(texto), tamanho):
+                    pedaco = texto[inicio:inicio + tamanho]
+                    yield _sse({**chunk, "choices": [{"index": 0, "delta": {"content": pedaco}, "finish_reason": None}]})
+                    time.sleep(len(pedaco) / 4 / self.config.tokens_por_segundo)
+            yield _sse({**chunk, "choices": [{"index": 0, "delta": {},
+                                               "finish_reason": "tool_calls" if ferramenta else "stop"}],
+                        "x_groq": {"id": "req_bench", "usage": _usage(prompt, texto)}})
+            yield b"data: [DONE]\n\n"
+
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=eventos())
+
+
+def _busca_simulada(config: ConfigStub, original):
+    @functools.wraps(original)
+    def busca(self, *args, **kwargs):
+        consulta = str(args[0] if args else next(iter(kwargs.values()), ""))
+        time.sleep(config.busca.sortear(_rng(config, original.__name__, consulta)))
+        return json.dumps([
+            {"title": f"{consulta} - resultado {i}", "href": f"https://exemplo.com/{i}",
+             "body": f"Resumo simulado {i} sobre {consulta}."}
+            for i in range(3)
+        ])
+
+    return busca
+
+
+class RedisLocal:
+    """O pedaço do redis-py que o conversation_store usa (get/set/delete e
+    pipeline), em memória e com latência de rede simulada por round-trip."""
+
+    def __init__(self, latencia: float = 0.0):
+        self.latencia = latencia
+        self.round_trips = 0
+        self._dados = {}
+        self._lock = threading.Lock()
+
+    def _round_trip(self) -> None:
+        self.round_trips += 1
+        time.sleep(self.latencia)
+
+    def _get(self, chave):
+        with self._lock:
+            valor, expira = self._dados.get(chave, (None, None))
+            if expira is not None and expira < time.time():
+                del self._dados[chave]
+                return None
+            return valor
+
+    def _set(self, chave, valor, ex=None):
+        with self._lock:
+            self._dados[chave] = (valor, time.time() + ex if ex else None)
+        return True
+
+    def _delete(self, *chaves):
+        with self._lock:
+            return sum(self._dados.pop(chave, None) is not None for chave in chaves)
+
+    def get(self, chave):
+        self._round_trip()
+        return self._get(chave)
+
+    def set(self, chave, valor, ex=None):
+        self._round_trip()
+        return self._set(chave, valor, ex)
+
+    def delete(self, *chaves):
+        self._round_trip()
+        return self._delete(*chaves)
+
+    def pipeline(self, transaction: bool = True):
+        return _PipelineLocal(self)
+
+
+class _PipelineLocal:
+    def __init__(self, redis: RedisLocal):
+        self.redis = redis
+        self._comandos = []
+
+    def set(self, *args, **kwargs):
+        self._comandos.append((self.redis._set, args, kwargs))
+        return self
+
+    def delete(self, *args):
+        self._comandos.append((self.redis._delete, args, {}))
+        return self
+
+    def execute(self):
+        self.redis._round_trip()
+        comandos, self._comandos = self._comandos, []
+        return [comando(*args, **kwargs) for comando, args, kwargs in comandos]
+
+
+def instalar(config: ConfigStub) -> None:
+    """Troca o cliente Groq do processo e as ferramentas de busca pelos stubs.
+
+    Precisa rodar antes de os agentes serem criados (as ferramentas guardam o
+    método no momento em que o Toolkit é instanciado).
+    """
+    import agent_pool
+    from groq import Groq as GroqClient
+    from phi.tools.duckduckgo import DuckDuckGo
+    from phi.tools.googlesearch import GoogleSearch
+    from phi.tools.newspaper_tools import NewspaperTools
+
+    for classe, metodo in ((GoogleSearch, "google_search"), (DuckDuckGo, "duckduckgo_search"),
+                           (DuckDuckGo, "duckduckgo_news"), (NewspaperTools, "get_article_text")):
+        setattr(classe, metodo, _busca_simulada(config, getattr(classe, metodo)))
+
+    http_client = httpx.Client(transport=httpx.MockTransport(StubGroq(config)))
+    with agent_pool._groq_lock:
+        agent_pool._groq_client = GroqClient(api_key="benchmark", http_client=http_client, max_retries=0)
@@ -0,0 +1,40 @@
+import time
+
+INICIO = time.perf_counter()
+
+import os
+import asyncio
+
+from webhook_server import serve
+from metrics import medir_imports, relatorio_de_imports
+
+##############################
+# INICIALIZAÇÃO RÁPIDA DO BOT DO TELEGRAM
+##############################
+
+# Ponto de entrada para hospedagens que "dormem" (Render free): abre a porta
+# e responde ao health check antes de importar o bot (telegram, pandas do
+# catálogo etc.); o bot é importado e montado numa thread, e phi/Groq ficam
+# para o aquecimento em segundo plano. Mostra quanto cada import custou.
+#
+# Uso (a partir da pasta script/):
+#   python boot_telegram.py
+#
+# Mesma porta do app_telegram (lida aqui para não importá-lo antes da hora)
+PORT = int(os.getenv("PORT", "8080"))
+HEALTH_MESSAGE = "✅ Bot da Sarah está rodando!"
+
+
+def carregar_bot() -> dict:
+    with medir_imports() as tempos:
+        import app_telegram
+    print(relatorio_de_imports(tempos))
+    return app_telegram.bot_setup()
+
+
+def main() -> None:
+    asyncio.run(serve(carregar_bot, PORT, health_message=HEALTH_MESSAGE, started_at=INICIO))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import argparse
+import gzip
+import json
+
+##############################
+# LEITURA E ESCRITA DOS CATÁLOGOS RASPADOS
+##############################
+
+# Os scrapers gravam JSON Lines (um livro por linha, opcionalmente .gz) à
+# medida que os registros são extraídos. Os leitores iteram linha a linha,
+# sem carregar o arquivo inteiro. Arquivos .json antigos (uma lista só)
+# continuam legíveis.
+
+
+def abrir_texto(path: str, mode: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class JsonlWriter:
+    """Grava um registro por linha, descarregando em disco a cada flush_every registros."""
+
+    def __init__(self, path: str, flush_every: int = 1, append: bool = False):
+        self.path = path
+        self.flush_every = flush_every
+        self.count = 0
+        self._file = abrir_texto(path, "a" if append else "w")
+
+    def write(self, record: dict) -> None:
+        self._file.write(json.dumps(record, ensure_ascii=False))
+        self._file.write("\n")
+        self.count += 1
+        if self.count % self.flush_every == 0:
+            self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def iter_registros(path: str):
+    """Itera os livros de um arquivo .jsonl, .jsonl.gz ou .json (lista)."""
+    if path.endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            yield from json.load(f)
+        return
+
+    with abrir_texto(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # Última linha truncada por um processo interrompido
+                break
+
+
+def iter_lotes(path: str, tamanho: int = 50_000):
+    lote = []
+    for registro in iter_registros(path):
+        lote.append(registro)
+        if len(lote) == tamanho:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def _tipar(df, schema=None):
+    """Colunas numéricas viram float64 e o resto string, para o schema ser estável entre lotes."""
+    import pandas as pd
+    import pyarrow as pa
+
+    if schema is not None:
+        df = df.reindex(columns=schema.names)
+    for col in df.columns:
+        if schema is not None:
+            numerica = pa.types.is_floating(schema.field(col).type)
+        else:
+            numerica = pd.api.types.is_numeric_dtype(df[col]) and not pd.api.types.is_bool_dtype(df[col])
+        if numerica:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
+        else:
+            df[col] = df[col].astype("string")
+    return df
+
+
+def exportar_parquet(origem: str, destino: str, tamanho_lote: int = 50_000) -> int:
+    """Converte um catálogo em Parquet (colunar) lote a lote. Retorna o número de linhas."""
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    schema = None
+    total = 0
+    try:
+        for lote in iter_lotes(origem, tamanho_lote):
+            df = _tipar(pd.DataFrame.from_records(lote), schema)
+            table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+            if writer is None:
+                schema = table.schema
+                writer = pq.ParquetWriter(destino, schema)
+            writer.write_table(table)
+            total += len(df)
+    finally:
+        if writer is not None:
+            writer.close()
+    return total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Exporta um catálogo raspado para Parquet")
+    parser.add_argument("origem", help="arquivo .jsonl, .jsonl.gz ou .json")
+    parser.add_argument("destino", help="arquivo .parquet")
+    parser.add_argument("--lote", type=int, default=50_000)
+    args = parser.parse_args()
+
+    total = exportar_parquet(args.origem, args.destino, args.lote)
+    print(f"{total} registros exportados para '{args.destino}'")
+
+
+if __name__ == "__main__":
+    main()
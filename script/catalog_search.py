@@ -0,0 +1,170 @@
+import os
+import zlib
+import threading
+from collections import Counter
+
+from price_index import (
+    NOMES_LOJAS,
+    PriceIndex,
+    formatar_ofertas,
+    formatar_preco,
+    get_price_index,
+    trigramas,
+    variantes_da_consulta,
+)
+
+##############################
+# BUSCA LOCAL NO CATÁLOGO
+##############################
+
+# Responde a partir dos livros raspados (título, categoria e preços) antes de
+# recorrer aos agentes. O modo "trigram" usa o índice invertido do
+# price_index, que já tolera erros de digitação; o modo "embedding" compara
+# vetores de trigramas com hashing (NumPy) e pega o top-k com argpartition.
+CATALOG_SEARCH_MODE = os.getenv("CATALOG_SEARCH_MODE", "trigram")
+# Pontuação mínima para responder só com o catálogo, sem chamar o agente:
+# bem mais alta que a das sugestões (buscar, 0.5), porque um falso acerto
+# responde com outro livro; só o título igual ou quase igual (um erro de
+# digitação, uma palavra a menos) passa
+CATALOG_HIT_THRESHOLD = float(os.getenv("CATALOG_HIT_THRESHOLD", "0.85"))
+# Dimensão dos vetores do modo embedding
+CATALOG_EMBEDDING_DIM = int(os.getenv("CATALOG_EMBEDDING_DIM", "512"))
+
+
+def vetorizar(titulos, dim: int = CATALOG_EMBEDDING_DIM):
+    """Matriz (len(titulos) x dim) float32 com os trigramas de cada título, normalizada (L2)."""
+    import numpy as np
+
+    linhas, colunas = [], []
+    for linha, titulo in enumerate(titulos):
+        for gram in trigramas(titulo):
+            linhas.append(linha)
+            colunas.append(zlib.crc32(gram.encode("utf-8")) % dim)
+
+    matriz = np.zeros((len(titulos), dim), dtype=np.float32)
+    np.add.at(matriz, (np.asarray(linhas, dtype=np.intp), np.asarray(colunas, dtype=np.intp)), 1.0)
+    normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+    np.divide(matriz, normas, out=matriz, where=normas > 0)
+    return matriz
+
+
+def top_k(matriz, vetor, k: int, linhas=None):
+    """Índices e similaridades (cosseno) das k linhas mais parecidas com o vetor."""
+    import numpy as np
+
+    if linhas is not None:
+        linhas = np.asarray(linhas, dtype=np.intp)
+        scores = matriz[linhas] @ vetor
+    else:
+        scores = matriz @ vetor
+    k = min(k, len(scores))
+    if k <= 0:
+        return [], []
+    # argpartition separa os k maiores em O(n); só eles são ordenados
+    melhores = np.argpartition(-scores, k - 1)[:k]
+    melhores = melhores[np.argsort(-scores[melhores], kind="stable")]
+    indices = linhas[melhores] if linhas is not None else melhores
+    return indices.tolist(), scores[melhores].tolist()
+
+
+class CatalogSearch:
+    def __init__(self, indice: PriceIndex, modo: str = CATALOG_SEARCH_MODE):
+        self.indice = indice
+        self.modo = modo
+        self.categorias = []    # categoria mais frequente das ofertas de cada livro
+        self._por_categoria = {}
+        for grupo, ofertas in enumerate(indice.ofertas):
+            contagem = Counter(oferta["categoria"] for oferta in ofertas if oferta.get("categoria"))
+            categoria = contagem.most_common(1)[0][0] if contagem else None
+            self.categorias.append(categoria)
+            if categoria:
+                self._por_categoria.setdefault(categoria, []).append(grupo)
+        self._vetores = vetorizar(indice.titulos) if modo == "embedding" and len(indice) else None
+
+    def __len__(self) -> int:
+        return len(self.indice)
+
+    def _resultado(self, grupo: int, score: float) -> dict:
+        return {
+            "grupo": grupo,
+            "titulo": self.indice.titulos[grupo],
+            "categoria": self.categorias[grupo],
+            "score": round(score, 3),
+            "ofertas": sorted(self.indice.ofertas[grupo], key=lambda oferta: oferta["preco"]),
+        }
+
+    def buscar(self, consulta: str, limite: int = 5, minimo: float = 0.5) -> list:
+        if self._vetores is None:
+            return [
+                {**resultado, "categoria": self.categorias[resultado["grupo"]]}
+                for resultado in self.indice.buscar(consulta, limite=limite, minimo=minimo)
+            ]
+
+        for titulo in variantes_da_consulta(consulta):
+            grupos, scores = top_k(self._vetores, vetorizar([titulo], self._vetores.shape[1])[0], limite)
+            resultados = [self._resultado(grupo, score) for grupo, score in zip(grupos, scores) if score >= minimo]
+            if resultados:
+                return resultados
+        return []
+
+    def encontrar(self, consulta: str, minimo: float = CATALOG_HIT_THRESHOLD):
+        """O livro do catálogo que corresponde à consulta, ou None se não houver um bom o bastante."""
+        resultados = self.buscar(consulta, limite=1, minimo=minimo)
+        return resultados[0] if resultados else None
+
+    def recomendar(self, livro: dict, limite: int = 5) -> list:
+        """Outros livros da mesma categoria: os mais parecidos (embedding) ou os com maior desconto."""
+        grupos = [grupo for grupo in self._por_categoria.get(livro.get("categoria"), []) if grupo != livro["grupo"]]
+        if not grupos:
+            return []
+
+        if self._vetores is not None:
+            escolhidos, scores = top_k(self._vetores, self._vetores[livro["grupo"]], limite, grupos)
+            return [self._resultado(grupo, score) for grupo, score in zip(escolhidos, scores)]
+
+        def desconto(grupo):
+            return max(
+                ((oferta["preco_antigo"] - oferta["preco"]) / oferta["preco_antigo"]
+                 for oferta in self.indice.ofertas[grupo]
+                 if oferta["preco_antigo"] and oferta["preco_antigo"] > oferta["preco"]),
+                default=0.0,
+            )
+
+        grupos.sort(key=lambda grupo: (-desconto(grupo), min(o["preco"] for o in self.indice.ofertas[grupo])))
+        return [self._resultado(grupo, 0.0) for grupo in grupos[:limite]]
+
+
+def formatar_livro(resultado: dict, negrito: str = "*") -> str:
+    """Ficha do livro com os dados do catálogo, em Markdown."""
+    linhas = [f"{negrito}{resultado['titulo'].title()}{negrito}"]
+    if resultado.get("categoria"):
+        linhas.append(f"- Gênero: {resultado['categoria'].title()}")
+    linhas.append(formatar_ofertas(resultado, negrito))
+    return "\n".join(linhas)
+
+
+def formatar_recomendacoes(resultados: list, negrito: str = "*") -> str:
+    """Lista numerada com a oferta mais barata de cada livro."""
+    linhas = []
+    for i, resultado in enumerate(resultados, 1):
+        oferta = resultado["ofertas"][0]
+        linha = f"{i}. {negrito}{resultado['titulo'].title()}{negrito}"
+        if resultado.get("categoria"):
+            linha += f" ({resultado['categoria'].title()})"
+        loja = NOMES_LOJAS.get(oferta["loja"], oferta["loja"])
+        linhas.append(f"{linha} — {negrito}{formatar_preco(oferta['preco'])}{negrito} na {loja}")
+    return "\n".join(linhas)
+
+
+_busca = None
+_busca_lock = threading.Lock()
+
+
+def get_catalog_search() -> CatalogSearch:
+    """Busca compartilhada pelo processo; acompanha as reconstruções do índice de preços."""
+    global _busca
+    indice = get_price_index()
+    with _busca_lock:
+        if _busca is None or _busca.indice is not indice:
+            _busca = CatalogSearch(indice)
+        return _busca
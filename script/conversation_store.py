@@ -0,0 +1,231 @@
+import os
+import json
+import time
+import atexit
+import sqlite3
+import asyncio
+import threading
+
+from metrics import registry, medir, observar_etapa
+
+##############################
+# ESTADO DAS CONVERSAS DO TELEGRAM
+##############################
+
+# O que o bot lembra de cada usuário (a ação escolhida no menu e o último
+# livro) fica fora do processo: assim várias réplicas podem atender o mesmo
+# webhook e um restart não esquece as conversas.
+#
+# CONVERSATION_STORE escolhe onde:
+#   redis://... ou rediss://...   Redis (ou compatível: Valkey, Upstash...)
+#   caminho de arquivo            SQLite local (padrão)
+#   vazio                         SQLite em memória (só este processo)
+#
+# As gravações são "write-behind": ficam num buffer (várias mudanças do
+# mesmo usuário viram uma só) e vão em lote para o backend a cada
+# CONVERSATION_FLUSH_INTERVAL segundos, numa thread; o handler nunca espera
+# a gravação. A leitura consulta o buffer antes do backend, então o próprio
+# processo sempre vê o que acabou de escrever.
+CONVERSATION_STORE = os.getenv("CONVERSATION_STORE", "conversas.sqlite3")
+CONVERSATION_TTL = float(os.getenv("CONVERSATION_TTL", str(7 * 24 * 3600)))
+CONVERSATION_FLUSH_INTERVAL = float(os.getenv("CONVERSATION_FLUSH_INTERVAL", "0.2"))
+# Grava antes do intervalo se o buffer juntar esta quantidade de usuários
+CONVERSATION_BATCH_SIZE = int(os.getenv("CONVERSATION_BATCH_SIZE", "200"))
+
+REDIS_PREFIX = "conversa:"
+
+
+def encode_state(state: dict) -> bytes:
+    """{'action': 'diagnostico', 'last_book': 'Duna'} -> b'{"action":"diagnostico","last_book":"Duna"}'"""
+    return json.dumps(state, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def decode_state(data) -> dict:
+    return json.loads(data) if data else {}
+
+
+class SQLiteBackend:
+    def __init__(self, path: str = ":memory:", ttl: float = CONVERSATION_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS conversas ("
+            " user_id INTEGER PRIMARY KEY,"
+            " estado BLOB NOT NULL,"
+            " atualizado REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def get(self, user_id: int):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT estado, atualizado FROM conversas WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        if row and time.time() - row[1] < self.ttl:
+            return row[0]
+        return None
+
+    def write_batch(self, items: dict) -> None:
+        """items: {user_id: bytes serializados ou None para apagar}, numa transação só."""
+        now = time.time()
+        gravar = [(user_id, data, now) for user_id, data in items.items() if data is not None]
+        apagar = [(user_id,) for user_id, data in items.items() if data is None]
+        with self._lock, self._db:
+            if gravar:
+                self._db.executemany("INSERT OR REPLACE INTO conversas (user_id, estado, atualizado) VALUES (?, ?, ?)", gravar)
+            if apagar:
+                self._db.executemany("DELETE FROM conversas WHERE user_id = ?", apagar)
+
+    def purge_expired(self) -> int:
+        with self._lock, self._db:
+            cursor = self._db.execute("DELETE FROM conversas WHERE atualizado < ?", (time.time() - self.ttl,))
+            return cursor.rowcount
+
+
+class RedisBackend:
+    """Usa qualquer cliente com a interface do redis-py (get/set/delete/pipeline)."""
+
+    def __init__(self, client, ttl: float = CONVERSATION_TTL, prefix: str = REDIS_PREFIX):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisBackend":
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("CONVERSATION_STORE aponta para um Redis, mas o pacote 'redis' não está instalado") from e
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def get(self, user_id: int):
+        return self.client.get(f"{self.prefix}{user_id}")
+
+    def write_batch(self, items: dict) -> None:
+        # Um round-trip por lote (pipeline sem MULTI), a expiração vai junto
+        pipe = self.client.pipeline(transaction=False)
+        for user_id, data in items.items():
+            if data is None:
+                pipe.delete(f"{self.prefix}{user_id}")
+            else:
+                pipe.set(f"{self.prefix}{user_id}", data, ex=int(self.ttl))
+        pipe.execute()
+
+    def purge_expired(self) -> int:
+        # O próprio Redis expira as chaves
+        return 0
+
+
+class ConversationStore:
+    def __init__(self, backend, flush_interval: float = CONVERSATION_FLUSH_INTERVAL,
+                 batch_size: int = CONVERSATION_BATCH_SIZE):
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._pending = {}          # user_id -> bytes (ou None para apagar)
+        self._writing = {}          # lote que está indo para o backend agora
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="conversation-store", daemon=True)
+        self._thread.start()
+
+    def _cached(self, user_id: int):
+        with self._lock:
+            for buffer in (self._pending, self._writing):
+                if user_id in buffer:
+                    return True, buffer[user_id]
+        return False, None
+
+    def get(self, user_id: int) -> dict:
+        """Estado atual do usuário (dict novo; alterar não grava, use set)."""
+        found, data = self._cached(user_id)
+        if not found:
+            with medir("estado_leitura"):
+                data = self.backend.get(user_id)
+        return decode_state(data)
+
+    async def load(self, user_id: int) -> dict:
+        """get() sem bloquear o event loop quando precisa ir ao backend."""
+        found, data = self._cached(user_id)
+        if found:
+            return decode_state(data)
+        return await asyncio.get_running_loop().run_in_executor(None, self.get, user_id)
+
+    def set(self, user_id: int, state: dict) -> None:
+        """Agenda a gravação; estado vazio apaga a conversa."""
+        state = {k: v for k, v in state.items() if v is not None}
+        with self._lock:
+            self._pending[user_id] = encode_state(state) if state else None
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def clear(self, user_id: int) -> None:
+        self.set(user_id, {})
+
+    def flush(self) -> int:
+        """Grava o que está no buffer. Retorna quantos usuários foram gravados."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                self._writing, self._pending = self._pending, {}
+                batch = self._writing
+            inicio = time.perf_counter()
+            try:
+                self.backend.write_batch(batch)
+            except Exception as e:
+                # Devolve ao buffer sem passar por cima do que chegou depois
+                with self._lock:
+                    self._pending = {**batch, **self._pending}
+                observar_etapa("estado_gravacao", time.perf_counter() - inicio, type(e).__name__)
+                print(f"Falha ao gravar o estado das conversas ({len(batch)} usuários): {e}")
+                return 0
+            finally:
+                with self._lock:
+                    self._writing = {}
+            observar_etapa("estado_gravacao", time.perf_counter() - inicio)
+            registry.contar("estado_gravacoes_total", len(batch))
+            return len(batch)
+
+    def _run(self) -> None:
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def close(self) -> None:
+        self._closed = True
+        self._wake.set()
+        self._thread.join(timeout=5)
+        self.flush()
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+
+def create_backend(url: str = CONVERSATION_STORE):
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend.from_url(url)
+    return SQLiteBackend(url or ":memory:")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_conversation_store() -> ConversationStore:
+    """Instância única por processo; o buffer é gravado ao sair."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ConversationStore(create_backend())
+            atexit.register(_store.close)
+            registry.adicionar_coletor(lambda: [("estado_pendentes", {}, _store.pending())])
+        return _store
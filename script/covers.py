@@ -0,0 +1,295 @@
+import io
+import os
+import time
+import sqlite3
+import asyncio
+import argparse
+import hashlib
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from http_client import create_client
+from metrics import registry, medir
+
+##############################
+# CAPAS DOS LIVROS (MINIATURAS EM CACHE LOCAL)
+##############################
+
+# Os scrapers guardam a URL da capa (imagem_url / link_imagem). As capas são
+# baixadas uma vez, viram miniaturas JPEG pequenas e ficam num cache em
+# disco com tamanho máximo (sai a menos usada recentemente); o bot e o
+# Streamlit mostram a miniatura local em vez de buscar na loja.
+#
+# - Downloads: um AsyncClient (keep-alive) numa thread com event loop
+#   próprio, usado tanto pelo bot (async) quanto pelo Streamlit (threads).
+#   Pedidos simultâneos da mesma URL viram um download só. A resposta é lida
+#   aos pedaços e o download para assim que passa de COVER_MAX_DOWNLOAD.
+# - Deduplicação: a miniatura é gravada pelo hash SHA-256 do conteúdo, então
+#   a mesma imagem em URLs diferentes (Amazon e Americanas, tamanhos
+#   com parâmetros na URL) ocupa um arquivo só.
+# - Miniaturas: Pillow num pool de threads (decodificar e redimensionar
+#   soltam o GIL); JPEGs são decodificados já reduzidos (draft).
+COVER_CACHE_DIR = os.getenv("COVER_CACHE_DIR", "capas_cache")
+COVER_CACHE_MAX_BYTES = int(os.getenv("COVER_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+COVER_SIZE = int(os.getenv("COVER_SIZE", "320"))
+COVER_WORKERS = int(os.getenv("COVER_WORKERS", "2"))
+COVER_CONCURRENCY = int(os.getenv("COVER_CONCURRENCY", "8"))
+# Quanto as respostas esperam pela capa antes de seguir sem ela
+COVER_TIMEOUT = float(os.getenv("COVER_TIMEOUT", "1.5"))
+# Imagens maiores que isso não são baixadas
+COVER_MAX_DOWNLOAD = int(os.getenv("COVER_MAX_DOWNLOAD", str(5 * 1024 * 1024)))
+# Uma URL que falhou só é tentada de novo depois deste tempo
+COVER_RETRY_AFTER = float(os.getenv("COVER_RETRY_AFTER", "600"))
+
+
+def cover_url(ofertas: list):
+    """A primeira URL de capa entre as ofertas de um livro (ou None)."""
+    return next((oferta["imagem_url"] for oferta in ofertas if oferta.get("imagem_url")), None)
+
+
+def make_thumbnail(data: bytes, size: int = COVER_SIZE) -> bytes:
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        # Para JPEG, decodifica direto numa escala menor (bem mais rápido)
+        image.draft("RGB", (size, size))
+        image = image.convert("RGB")
+        image.thumbnail((size, size))
+        out = io.BytesIO()
+        image.save(out, "JPEG", quality=80, optimize=True)
+    return out.getvalue()
+
+
+class CoverCache:
+    """Miniaturas em disco por hash de conteúdo, com índice SQLite e LRU por tamanho total."""
+
+    def __init__(self, directory: str = COVER_CACHE_DIR, max_bytes: int = COVER_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, "indice.sqlite3"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS arquivos (
+                hash TEXT PRIMARY KEY,
+                tamanho INTEGER NOT NULL,
+                acessado REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY,
+                hash TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS arquivos_por_acesso ON arquivos (acessado);
+            """
+        )
+        self._db.commit()
+        self._total = self._db.execute("SELECT COALESCE(SUM(tamanho), 0) FROM arquivos").fetchone()[0]
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.directory, f"{digest}.jpg")
+
+    def lookup(self, url: str):
+        """Caminho da miniatura da URL, se estiver no cache (e marca o acesso)."""
+        with self._lock:
+            row = self._db.execute("SELECT hash FROM urls WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return None
+            return self._touch(row[0])
+
+    def link(self, url: str, digest: str):
+        """Associa a URL a um conteúdo já em cache (outra URL com a mesma imagem)."""
+        with self._lock:
+            path = self._touch(digest)
+            if path is not None:
+                with self._db:
+                    self._db.execute("INSERT OR REPLACE INTO urls (url, hash) VALUES (?, ?)", (url, digest))
+            return path
+
+    def _touch(self, digest: str):
+        path = self.path(digest)
+        if not os.path.exists(path):
+            # Apagado por fora: esquece e deixa baixar de novo
+            with self._db:
+                self._forget(digest)
+            return None
+        with self._db:
+            self._db.execute("UPDATE arquivos SET acessado = ? WHERE hash = ?", (time.time(), digest))
+        return path
+
+    def store(self, url: str, digest: str, thumbnail: bytes) -> str:
+        path = self.path(digest)
+        temporary = f"{path}.{threading.get_ident()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(thumbnail)
+        os.replace(temporary, path)
+        with self._lock, self._db:
+            antigo = self._db.execute("SELECT tamanho FROM arquivos WHERE hash = ?", (digest,)).fetchone()
+            self._total += len(thumbnail) - (antigo[0] if antigo else 0)
+            self._db.execute("INSERT OR REPLACE INTO arquivos (hash, tamanho, acessado) VALUES (?, ?, ?)",
+                             (digest, len(thumbnail), time.time()))
+            self._db.execute("INSERT OR REPLACE INTO urls (url, hash) VALUES (?, ?)", (url, digest))
+            self._evict(keep=digest)
+        return path
+
+    def _forget(self, digest: str) -> None:
+        row = self._db.execute("SELECT tamanho FROM arquivos WHERE hash = ?", (digest,)).fetchone()
+        if row:
+            self._total -= row[0]
+        self._db.execute("DELETE FROM arquivos WHERE hash = ?", (digest,))
+        self._db.execute("DELETE FROM urls WHERE hash = ?", (digest,))
+
+    def _evict(self, keep: str) -> None:
+        # As menos acessadas saem primeiro até o total caber no limite
+        while self._total > self.max_bytes:
+            row = self._db.execute(
+                "SELECT hash FROM arquivos WHERE hash != ? ORDER BY acessado LIMIT 1", (keep,)
+            ).fetchone()
+            if row is None:
+                break
+            self._forget(row[0])
+            try:
+                os.remove(self.path(row[0]))
+            except FileNotFoundError:
+                pass
+            registry.contar("capas_removidas_total")
+
+    def hashes(self) -> set:
+        with self._lock:
+            return {row[0] for row in self._db.execute("SELECT hash FROM arquivos")}
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return self._total
+
+
+class CoverStore:
+    def __init__(self, cache: CoverCache = None, concurrency: int = COVER_CONCURRENCY, workers: int = COVER_WORKERS):
+        self.cache = cache or CoverCache()
+        self.concurrency = concurrency
+        self._thumbnails = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="capas")
+        self._failures = {}     # url -> quando falhou
+        self._in_flight = {}    # url -> asyncio.Future (no loop das capas)
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="capas-http", daemon=True).start()
+        self._client = None
+        self._limit = None
+
+    async def _download(self, url: str):
+        if self._client is None:
+            self._client = create_client(self.concurrency, timeout=10.0)
+            self._limit = asyncio.Semaphore(self.concurrency)
+        async with self._limit:
+            with medir("capa_download"):
+                async with self._client.stream("GET", url) as response:
+                    response.raise_for_status()
+                    tamanho = response.headers.get("Content-Length", "")
+                    if tamanho.isdigit() and int(tamanho) > COVER_MAX_DOWNLOAD:
+                        raise ValueError(f"imagem grande demais ({tamanho} bytes)")
+                    data = bytearray()
+                    # Content-Length pode faltar (ou mentir): conta o que chega
+                    async for chunk in response.aiter_bytes():
+                        data += chunk
+                        if len(data) > COVER_MAX_DOWNLOAD:
+                            raise ValueError(f"imagem grande demais (mais de {COVER_MAX_DOWNLOAD} bytes)")
+        return bytes(data)
+
+    async def _fetch(self, url: str):
+        try:
+            data = await self._download(url)
+            digest = hashlib.sha256(data).hexdigest()
+            path = self.cache.link(url, digest)
+            if path is not None:
+                registry.contar("capas_total", resultado="duplicada")
+                return path
+            with medir("capa_miniatura"):
+                thumbnail = await self._loop.run_in_executor(self._thumbnails, make_thumbnail, data)
+            registry.contar("capas_total", resultado="baixada")
+            return await self._loop.run_in_executor(self._thumbnails, self.cache.store, url, digest, thumbnail)
+        except Exception as e:
+            self._failures[url] = time.monotonic()
+            registry.contar("capas_total", resultado="falha")
+            print(f"Falha ao obter a capa {url}: {type(e).__name__}: {e}")
+            return None
+        finally:
+            self._in_flight.pop(url, None)
+
+    async def _get(self, url: str):
+        # Roda no loop das capas: o dicionário de downloads em andamento só é mexido aqui
+        future = self._in_flight.get(url)
+        if future is None:
+            future = self._in_flight[url] = asyncio.ensure_future(self._fetch(url))
+        return await asyncio.shield(future)
+
+    def submit(self, url: str):
+        """concurrent.futures.Future com o caminho da miniatura (ou None se não der)."""
+        path = self.cache.lookup(url) if url else None
+        if path is not None or not url or time.monotonic() - self._failures.get(url, -COVER_RETRY_AFTER) < COVER_RETRY_AFTER:
+            registry.contar("capas_total", resultado="cache" if path else "sem_capa")
+            future = Future()
+            future.set_result(path)
+            return future
+        return asyncio.run_coroutine_threadsafe(self._get(url), self._loop)
+
+    def get(self, url: str, timeout: float = COVER_TIMEOUT):
+        """Caminho da miniatura, esperando no máximo timeout (o download continua em segundo plano)."""
+        try:
+            return self.submit(url).result(timeout)
+        except FutureTimeoutError:
+            return None
+
+    async def aget(self, url: str, timeout: float = COVER_TIMEOUT):
+        """get() para código async (ex.: handlers do bot)."""
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(self.submit(url))), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def prefetch(self, urls, progress=None) -> int:
+        """Baixa as capas que ainda não estão no cache (job de aquecimento)."""
+        futures = [asyncio.wrap_future(self.submit(url)) for url in dict.fromkeys(urls) if url]
+        done = 0
+        for future in asyncio.as_completed(futures):
+            if await future is not None:
+                done += 1
+            if progress is not None:
+                progress(done, len(futures))
+        return done
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_cover_store() -> CoverStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = CoverStore()
+            registry.adicionar_coletor(lambda: [("capas_cache_bytes", {}, _store.cache.total_bytes())])
+        return _store
+
+
+def main() -> None:
+    # Aquece o cache com as capas do catálogo raspado (opcional: o bot e o
+    # Streamlit também baixam sob demanda)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--limite", type=int, default=500, help="quantos livros do catálogo")
+    args = parser.parse_args()
+
+    from price_index import get_price_index
+
+    indice = get_price_index()
+    urls = [cover_url(ofertas) for ofertas in indice.ofertas[:args.limite]]
+
+    def progress(done, total):
+        if done and done % 50 == 0:
+            print(f"{done}/{total} capas")
+
+    total = asyncio.run(get_cover_store().prefetch(urls, progress))
+    print(f"{total} capas no cache ({get_cover_store().cache.total_bytes() / 1024 / 1024:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
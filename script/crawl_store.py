@@ -0,0 +1,145 @@
+import os
+import time
+import sqlite3
+
+##############################
+# ESTADO DOS CRAWLERS (MODO INCREMENTAL)
+##############################
+
+# Guarda o último preço conhecido de cada produto, o histórico de mudanças,
+# os validadores HTTP (ETag/Last-Modified) de cada URL e as páginas já
+# concluídas de um crawl em andamento (checkpoint).
+CRAWL_DB = os.getenv("CRAWL_DB", "crawl_state.sqlite3")
+
+CAMPOS_PRECO = ("preco_antigo", "preco_novo")
+
+
+class CrawlStore:
+    def __init__(self, path: str = CRAWL_DB):
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS produtos (
+                loja TEXT NOT NULL,
+                produto_id TEXT NOT NULL,
+                nome_livro TEXT,
+                categoria TEXT,
+                preco_antigo TEXT,
+                preco_novo TEXT,
+                imagem_url TEXT,
+                atualizado_em REAL NOT NULL,
+                PRIMARY KEY (loja, produto_id)
+            );
+            CREATE TABLE IF NOT EXISTS historico_precos (
+                loja TEXT NOT NULL,
+                produto_id TEXT NOT NULL,
+                preco_antigo TEXT,
+                preco_novo TEXT,
+                coletado_em REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS validadores_http (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT
+            );
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                crawl_id TEXT NOT NULL,
+                unidade TEXT NOT NULL,
+                PRIMARY KEY (crawl_id, unidade)
+            );
+            """
+        )
+        self._db.commit()
+
+    def close(self) -> None:
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    ########## Produtos ##########
+
+    def salvar_produto(self, loja: str, produto_id: str, livro: dict) -> bool:
+        """Grava o produto se ele for novo ou se o preço mudou. Retorna True nesses casos."""
+        precos = tuple(None if livro.get(campo) is None else str(livro[campo]) for campo in CAMPOS_PRECO)
+        atual = self._db.execute(
+            "SELECT preco_antigo, preco_novo FROM produtos WHERE loja = ? AND produto_id = ?",
+            (loja, produto_id),
+        ).fetchone()
+        if atual is not None and tuple(atual) == precos:
+            return False
+
+        agora = time.time()
+        self._db.execute(
+            "INSERT OR REPLACE INTO produtos"
+            " (loja, produto_id, nome_livro, categoria, preco_antigo, preco_novo, imagem_url, atualizado_em)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (loja, produto_id, livro.get("nome_livro"), livro.get("categoria"), *precos,
+             livro.get("imagem_url") or livro.get("link_imagem"), agora),
+        )
+        self._db.execute(
+            "INSERT INTO historico_precos (loja, produto_id, preco_antigo, preco_novo, coletado_em)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (loja, produto_id, *precos, agora),
+        )
+        return True
+
+    def produtos(self, loja: str):
+        for row in self._db.execute("SELECT * FROM produtos WHERE loja = ? ORDER BY produto_id", (loja,)):
+            yield dict(row)
+
+    ########## Requisições condicionais ##########
+
+    def cabecalhos_condicionais(self, url: str) -> dict:
+        row = self._db.execute(
+            "SELECT etag, last_modified FROM validadores_http WHERE url = ?", (url,)
+        ).fetchone()
+        headers = {}
+        if row is not None:
+            if row["etag"]:
+                headers["If-None-Match"] = row["etag"]
+            if row["last_modified"]:
+                headers["If-Modified-Since"] = row["last_modified"]
+        return headers
+
+    def salvar_validadores(self, url: str, headers) -> None:
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+        if etag or last_modified:
+            self._db.execute(
+                "INSERT OR REPLACE INTO validadores_http (url, etag, last_modified) VALUES (?, ?, ?)",
+                (url, etag, last_modified),
+            )
+
+    ########## Checkpoints ##########
+
+    def unidades_concluidas(self, crawl_id: str) -> set:
+        rows = self._db.execute("SELECT unidade FROM checkpoints WHERE crawl_id = ?", (crawl_id,))
+        return {row["unidade"] for row in rows}
+
+    def concluir_unidade(self, crawl_id: str, unidade, url: str = None, headers=None) -> None:
+        """Marca a unidade (página) como concluída e grava tudo o que foi feito nela.
+
+        Os validadores HTTP da página (headers da resposta) entram no mesmo
+        commit que os produtos e o checkpoint: um 304 na próxima execução só
+        acontece se os produtos daquela resposta já estiverem gravados.
+        """
+        if url is not None and headers is not None:
+            self.salvar_validadores(url, headers)
+        self._db.execute(
+            "INSERT OR IGNORE INTO checkpoints (crawl_id, unidade) VALUES (?, ?)", (crawl_id, str(unidade))
+        )
+        self._db.commit()
+
+    def finalizar_crawl(self, crawl_id: str) -> None:
+        self._db.execute("DELETE FROM checkpoints WHERE crawl_id = ?", (crawl_id,))
+        self._db.commit()
+
+    def commit(self) -> None:
+        self._db.commit()
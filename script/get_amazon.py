@@ -1,38 +1,90 @@
-from playwright.sync_api import sync_playwright
-import json
-from time import sleep
+from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
+import re
+import sys
+from crawl_store import CrawlStore
+from catalog_io import JsonlWriter
 
-def pegar_livros_com_playwright():
-    url = "https://www.amazon.com.br/b?node=13130368011"
-    
+# Tipos de recurso que não precisamos baixar para ler os preços
+RECURSOS_BLOQUEADOS = {"image", "font", "stylesheet", "media"}
+
+SELETOR_CARD = "li.a-carousel-card"
+SELETOR_CARD_NOVO = "li.a-carousel-card:not([data-coletado])"
+
+# Lê todos os cards ainda não coletados numa única ida ao navegador e marca
+# cada um como coletado, para que o próximo lote traga só os novos
+EXTRAIR_CARDS_NOVOS = """
+(seletor) => Array.from(document.querySelectorAll(seletor)).map((item) => {
+    item.setAttribute("data-coletado", "1");
+    const texto = (sel) => {
+        const el = item.querySelector(sel);
+        return el ? el.textContent.trim() : null;
+    };
+    const img = item.querySelector("img");
+    const link = item.querySelector("a[href*='/dp/']");
+    return {
+        nome: texto("span.dcl-truncate span"),
+        link_img: img ? img.getAttribute("src") : null,
+        preco_novo: texto("span.a-price .a-offscreen"),
+        preco_antigo: texto("div.dcl-product-old-price-section .a-text-price .a-offscreen"),
+        href: link ? link.getAttribute("href") : null,
+    };
+})
+"""
+
+def extrair_asin(link):
+    # Links de produto da Amazon têm o ASIN (id estável) depois de /dp/
+    match = re.search(r"/dp/([A-Z0-9]{10})", link or "")
+    return match.group(1) if match else None
+
+def bloquear_recursos(route):
+    if route.request.resource_type in RECURSOS_BLOQUEADOS:
+        route.abort()
+    else:
+        route.continue_()
+
+def extrair_lote(page):
+    """Devolve os livros dos cards que apareceram desde o último lote."""
     livros = []
+    for card in page.evaluate(EXTRAIR_CARDS_NOVOS, SELETOR_CARD_NOVO):
+        if not card["nome"] or not card["preco_novo"]:
+            continue
+        livros.append({
+            "produto_id": extrair_asin(card["href"]) or card["nome"],
+            "nome_livro": card["nome"],
+            "link_imagem": card["link_img"],
+            "preco_novo": card["preco_novo"],
+            "preco_antigo": card["preco_antigo"]
+        })
+    return livros
+
+def pegar_livros_com_playwright(writer, store=None, headless=True, espera_ms=10000):
+    url = "https://www.amazon.com.br/b?node=13130368011"
+
+    # Com store (modo incremental), só são gravados os livros novos ou com preço alterado
+    ja_vistos = set()
     with sync_playwright() as p:
-        browser = p.chromium.launch(headless=False)  # headless=False para ver o que acontece no navegador
+        browser = p.chromium.launch(headless=headless)  # headless=False para ver o que acontece no navegador
         page = browser.new_page()
-        # # Desabilitar o carregamento de imagens e fontes para melhorar o desempenho
-        page.route("**/*.{png,jpg,jpeg}", lambda route: route.abort())
+        # Desabilitar o carregamento de imagens, fontes, CSS e mídia para melhorar o desempenho
+        page.route("**/*", bloquear_recursos)
         page.goto(url)
 
         # Aguarda a página carregar inicialmente
-        page.wait_for_selector("li.a-carousel-card")
-        
+        page.wait_for_selector(SELETOR_CARD)
+
         # Rola a página e clica no botão "Ver mais" se necessário
+        lote, na_pagina = 0, 0
         while True:
-            # Extrai os livros da página
-            livros_na_pagina = page.query_selector_all("li.a-carousel-card")
-            for item in livros_na_pagina:
-                nome = item.query_selector("span.dcl-truncate span").inner_text().strip()
-                link_img = item.query_selector("img").get_attribute("src")
-                preco_novo = item.query_selector("span.a-price .a-offscreen").inner_text().strip()
-                preco_antigo_tag = item.query_selector("div.dcl-product-old-price-section .a-text-price .a-offscreen")
-                preco_antigo = preco_antigo_tag.inner_text().strip() if preco_antigo_tag else None
-
-                livros.append({
-                    "nome_livro": nome,
-                    "link_imagem": link_img,
-                    "preco_novo": preco_novo,
-                    "preco_antigo": preco_antigo
-                })
+            # Extrai só os livros que ainda não foram lidos
+            for livro in extrair_lote(page):
+                if livro["produto_id"] in ja_vistos:
+                    continue
+                # Ordem na listagem (mais vendidos primeiro): cada "Ver mais" é uma página
+                livro["pagina"], livro["posicao_na_pagina"] = lote, na_pagina
+                na_pagina += 1
+                ja_vistos.add(livro["produto_id"])
+                if store is None or store.salvar_produto("amazon", livro["produto_id"], livro):
+                    writer.write(livro)
 
             # Verifica se o botão "Ver mais" está presente usando XPath
             try:
@@ -40,20 +92,37 @@ def pegar_livros_com_playwright():
                 if botao_ver_mais:
                     print("Clicando no botão 'Ver mais' para carregar mais livros...")
                     botao_ver_mais.click()
-                    sleep(3)  # Aguarda um pouco para os novos itens carregarem
+                    lote, na_pagina = lote + 1, 0
+                    # Espera aparecerem cards novos em vez de um tempo fixo
+                    page.wait_for_function(
+                        "(seletor) => document.querySelector(seletor) !== null",
+                        arg=SELETOR_CARD_NOVO,
+                        timeout=espera_ms,
+                    )
                 else:
                     print("Não há mais livros para carregar.")
                     break
+            except PlaywrightTimeoutError:
+                print("Nenhum livro novo apareceu depois do clique.")
+                break
             except Exception as e:
                 print(f"Erro ao tentar clicar no botão: {e}")
                 break
 
-        # Salva os dados extraídos em JSON
-        with open("livros_appday_completo.json", "w", encoding="utf-8") as f_out:
-            json.dump(livros, f_out, indent=2, ensure_ascii=False)
+        if store is not None:
+            store.commit()
 
-        print(f"{len(livros)} livros extraídos e salvos em 'livros_appday_completo.json'.")
+        print(f"{writer.count} livros extraídos e salvos em '{writer.path}'.")
         browser.close()
 
 if __name__ == "__main__":
-    pegar_livros_com_playwright()
+    # --com-janela abre o navegador visível (útil para depurar os seletores)
+    headless = "--com-janela" not in sys.argv
+    # Os livros vão para o disco (JSON Lines) assim que são extraídos
+    if "--incremental" in sys.argv:
+        # Salva só o que mudou desde a última execução
+        with CrawlStore() as store, JsonlWriter("livros_appday_alteracoes.jsonl") as writer:
+            pegar_livros_com_playwright(writer, store, headless=headless)
+    else:
+        with JsonlWriter("livros_appday_completo.jsonl") as writer:
+            pegar_livros_com_playwright(writer, headless=headless)
@@ -1,77 +1,266 @@
-import requests
-from bs4 import BeautifulSoup
+import re
+import argparse
+import asyncio
 import json
-import time
 
-# Lista para armazenar todos os livros
-livros = []
+import httpx
 
-# Conjunto para armazenar nomes dos livros já adicionados (evita duplicatas)
-titulos_ja_processados = set()
+from http_client import AdaptiveRateLimiter, create_client, fetch
+from crawl_store import CrawlStore
+from catalog_io import JsonlWriter
 
-# Loop de páginas (ajuste o range se quiser mais páginas)
-for page in range(5):
-    url = f"https://www.americanas.com.br/livros?page={page}"
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
 
-    headers = {
-        "User-Agent": "Mozilla/5.0"
-    }
+BASE_URL = "https://www.americanas.com.br/livros"
+
+_NEXT_DATA_TAG = re.compile(rb"<script[^>]*\bid=[\"']?__NEXT_DATA__[\"']?[^>]*>")
+
+
+def extrair_next_data_rapido(html):
+    """Acha o <script id="__NEXT_DATA__"> direto nos bytes, sem montar a árvore HTML.
+
+    O Next.js escapa '</' dentro do JSON, então o primeiro '</script>' depois
+    da tag fecha o bloco. Devolve None se não encontrar a tag.
+    """
+    data = html.encode("utf-8") if isinstance(html, str) else html
+    tag = _NEXT_DATA_TAG.search(data)
+    if not tag:
+        return None
+    end = data.find(b"</script>", tag.end())
+    if end == -1:
+        return None
+    return json_loads(data[tag.end():end])
+
+
+def extrair_next_data_bs4(html):
+    from bs4 import BeautifulSoup
 
-    response = requests.get(url, headers=headers)
-    soup = BeautifulSoup(response.text, "html.parser")
+    soup = BeautifulSoup(html, "html.parser")
 
     # Pega o script com o JSON bruto da aplicação
     next_data_script = soup.find("script", id="__NEXT_DATA__")
-    
-    if next_data_script:
-        json_data = json.loads(next_data_script.string)
-        
-        # Navegar na estrutura até os produtos
-        produtos = json_data["props"]["pageProps"]["data"]["search"]["products"]["edges"]
-
-        for item in produtos:
-            node = item["node"]
-            nome = node.get("isVariantOf", {}).get("name", None)
-
-            if not nome or nome.upper() in titulos_ja_processados:
-                continue  # Pula se o nome estiver ausente ou já processado
-            
-            nome = nome.upper()
-            titulos_ja_processados.add(nome)
-
-            categorias = node.get("categories", [])
+    if not next_data_script:
+        return None
+    return json.loads(next_data_script.string)
+
+
+def extrair_next_data(html):
+    try:
+        json_data = extrair_next_data_rapido(html)
+        if json_data is not None:
+            return json_data
+    except ValueError:
+        pass
+    # HTML fora do padrão esperado: cai para o parse completo
+    return extrair_next_data_bs4(html)
+
+
+def extrair_produtos(html) -> list:
+    """Devolve os nós de produto do JSON __NEXT_DATA__ de uma página de listagem."""
+    json_data = extrair_next_data(html)
+    if not json_data:
+        return []
+
+    # Navegar na estrutura até os produtos
+    produtos = json_data["props"]["pageProps"]["data"]["search"]["products"]["edges"]
+    return [item["node"] for item in produtos]
+
+
+def montar_livro(node: dict, pagina: int = None, posicao: int = None):
+    """Registro do livro; pagina/posicao (ordem na listagem, mais vendidos primeiro) vão junto se informadas."""
+    nome = node.get("isVariantOf", {}).get("name", None)
+    if not nome:
+        return None
+
+    categorias = node.get("categories", [])
+    categoria_tratada = None
+    if categorias:
+        try:
+            categoria_tratada = categorias[0].split("/")[2].replace("-", " ").upper()
+        except IndexError:
             categoria_tratada = None
-            if categorias:
-                try:
-                    categoria_tratada = categorias[0].split("/")[2].replace("-", " ").upper()
-                except IndexError:
-                    categoria_tratada = None
-
-            offers = node.get("offers", {}).get("offers", [])
-            preco_antigo = None
-            preco_novo = None
-            if offers:
-                preco_antigo = offers[0].get("listPrice", None)
-                preco_novo = offers[0].get("price", preco_antigo)
-
-            imagem_url = node.get("image", [{}])[0].get("url", None)
-
-            livro = {
-                "nome_livro": nome,
-                "categoria": categoria_tratada,
-                "preco_antigo": preco_antigo,
-                "preco_novo": preco_novo,
-                "imagem_url": imagem_url
-            }
-
-            livros.append(livro)
-
-    print(f"Página {page} processada.")
-    print(f"Total de livros coletados: {len(livros)}")
-    time.sleep(1)  # Delay entre as páginas
-
-# Salvar os livros em JSON
-with open("livros_americanas.json", "w", encoding="utf-8") as file:
-    json.dump(livros, file, ensure_ascii=False, indent=4)
-
-print("Dados salvos em 'livros_americanas.json'")
+
+    offers = node.get("offers", {}).get("offers", [])
+    preco_antigo = None
+    preco_novo = None
+    if offers:
+        preco_antigo = offers[0].get("listPrice", None)
+        preco_novo = offers[0].get("price", preco_antigo)
+
+    imagem_url = node.get("image", [{}])[0].get("url", None)
+
+    # Identificador estável do produto (o nome fica como último recurso)
+    produto_id = node.get("id") or node.get("sku") or nome.upper()
+
+    return {
+        "produto_id": str(produto_id),
+        "nome_livro": nome.upper(),
+        "categoria": categoria_tratada,
+        "preco_antigo": preco_antigo,
+        "preco_novo": preco_novo,
+        "imagem_url": imagem_url,
+        # As páginas são gravadas na ordem em que terminam de baixar, não na da listagem
+        "pagina": pagina,
+        "posicao_na_pagina": posicao,
+    }
+
+
+def url_da_pagina(base_url: str, page: int) -> str:
+    return f"{base_url}?page={page}"
+
+
+async def buscar_pagina(client, limiter, semaphore, page: int, base_url: str, store: CrawlStore = None):
+    """Devolve (status HTTP, produtos da página, headers da resposta). Em 304 a página não mudou e vem sem produtos.
+
+    Se a rede falhar em todas as tentativas, o status é None (a página conta como falha).
+    Os headers (ETag/Last-Modified) só vêm em 200 e são gravados junto com o
+    checkpoint da página (CrawlStore.concluir_unidade).
+    """
+    url = url_da_pagina(base_url, page)
+    headers = store.cabecalhos_condicionais(url) if store else {}
+    try:
+        async with semaphore:
+            response = await fetch(client, url, limiter, headers=headers)
+    except httpx.TransportError as e:
+        print(f"Página {page} com erro de rede ({type(e).__name__}: {e}).")
+        return None, [], None
+    if response.status_code == 304:
+        print(f"Página {page} sem alterações (HTTP 304).")
+        return response.status_code, [], None
+    if response.status_code != 200:
+        print(f"Página {page} ignorada (HTTP {response.status_code}).")
+        return response.status_code, [], None
+    produtos = extrair_produtos(response.content)
+    print(f"Página {page} processada ({len(produtos)} produtos).")
+    return response.status_code, produtos, response.headers
+
+
+async def paginas_concluidas(client, limiter, semaphore, pages, base_url: str, store: CrawlStore = None):
+    """Gera (página, status, produtos, headers) na ordem em que as páginas terminam."""
+    tarefas = {
+        asyncio.ensure_future(buscar_pagina(client, limiter, semaphore, page, base_url, store)): page
+        for page in pages
+    }
+    try:
+        while tarefas:
+            prontas, _ = await asyncio.wait(tarefas, return_when=asyncio.FIRST_COMPLETED)
+            for tarefa in prontas:
+                page = tarefas.pop(tarefa)
+                status, produtos, headers = tarefa.result()
+                yield page, status, produtos, headers
+    finally:
+        for tarefa in tarefas:
+            tarefa.cancel()
+
+
+async def iterar_livros(pages=range(5), concurrency: int = 8, base_url: str = BASE_URL,
+                        min_interval: float = 0.2):
+    """Gera os livros (sem duplicatas) assim que cada página é processada."""
+    limiter = AdaptiveRateLimiter(min_interval=min_interval)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    # Conjunto para armazenar nomes dos livros já adicionados (evita duplicatas)
+    titulos_ja_processados = set()
+    async with create_client(concurrency) as client:
+        async for page, _, produtos, _ in paginas_concluidas(client, limiter, semaphore, pages, base_url):
+            for posicao, node in enumerate(produtos):
+                livro = montar_livro(node, page, posicao)
+                if not livro or livro["nome_livro"] in titulos_ja_processados:
+                    continue  # Pula se o nome estiver ausente ou já processado
+                titulos_ja_processados.add(livro["nome_livro"])
+                yield livro
+
+
+async def raspar_americanas(pages=range(5), concurrency: int = 8, base_url: str = BASE_URL,
+                            min_interval: float = 0.2) -> list:
+    return [livro async for livro in iterar_livros(pages, concurrency, base_url, min_interval)]
+
+
+def crawl_id_americanas(base_url: str, pages: range) -> str:
+    return f"americanas:{base_url}:{pages.start}-{pages.stop}"
+
+
+async def iterar_alteracoes(store: CrawlStore, pages=range(5), concurrency: int = 8,
+                            base_url: str = BASE_URL, min_interval: float = 0.2):
+    """Busca só o que falta do crawl atual e gera apenas os livros novos ou com preço alterado.
+
+    Cada página concluída vira um checkpoint (depois que os livros dela foram
+    entregues): se o processo cair, a próxima execução com as mesmas páginas
+    retoma de onde parou.
+    """
+    crawl_id = crawl_id_americanas(base_url, pages)
+    concluidas = store.unidades_concluidas(crawl_id)
+    faltando = [page for page in pages if str(page) not in concluidas]
+    if concluidas:
+        print(f"Retomando crawl: {len(concluidas)} páginas já concluídas, {len(faltando)} restantes.")
+
+    limiter = AdaptiveRateLimiter(min_interval=min_interval)
+    semaphore = asyncio.Semaphore(concurrency)
+    falhas = []
+
+    async with create_client(concurrency) as client:
+        async for page, status, produtos, headers in paginas_concluidas(client, limiter, semaphore, faltando, base_url, store):
+            if status not in (200, 304):
+                falhas.append(page)
+                continue
+            for posicao, node in enumerate(produtos):
+                livro = montar_livro(node, page, posicao)
+                if livro and store.salvar_produto("americanas", livro["produto_id"], livro):
+                    yield livro
+            store.concluir_unidade(crawl_id, page, url_da_pagina(base_url, page), headers)
+
+    # Páginas com erro ficam pendentes para a próxima execução
+    if falhas:
+        print(f"Páginas com erro (serão retomadas): {sorted(falhas)}")
+    else:
+        store.finalizar_crawl(crawl_id)
+
+
+async def gravar(livros, writer: JsonlWriter) -> int:
+    async for livro in livros:
+        writer.write(livro)
+    return writer.count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Coleta os livros da Americanas")
+    parser.add_argument("--inicio", type=int, default=0, help="primeira página")
+    parser.add_argument("--fim", type=int, default=5, help="página final (exclusiva)")
+    parser.add_argument("--concorrencia", type=int, default=8)
+    parser.add_argument("--intervalo", type=float, default=0.2, help="intervalo mínimo entre requisições (s)")
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--saida", default="livros_americanas.jsonl",
+                        help="arquivo JSON Lines (use .jsonl.gz para comprimir)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="grava só os livros novos ou com preço alterado (estado em CRAWL_DB)")
+    args = parser.parse_args()
+
+    pages = range(args.inicio, args.fim)
+    if args.incremental:
+        if args.saida == parser.get_default("saida"):
+            args.saida = "livros_americanas_alteracoes.jsonl"
+        with CrawlStore() as store:
+            # Ao retomar um crawl interrompido, continua o mesmo arquivo de saída
+            retomando = bool(store.unidades_concluidas(crawl_id_americanas(args.base_url, pages)))
+            with JsonlWriter(args.saida, append=retomando) as writer:
+                total = asyncio.run(gravar(iterar_alteracoes(
+                    store, pages, args.concorrencia, args.base_url, args.intervalo
+                ), writer))
+        print(f"Livros novos ou com preço alterado: {total}")
+    else:
+        # Cada livro vai para o disco assim que é extraído
+        with JsonlWriter(args.saida) as writer:
+            total = asyncio.run(gravar(iterar_livros(
+                pages, args.concorrencia, args.base_url, args.intervalo
+            ), writer))
+        print(f"Total de livros coletados: {total}")
+
+    print(f"Dados salvos em '{args.saida}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,392 @@
+import os
+import time
+import heapq
+import random
+import sqlite3
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from metrics import contar_tokens, medir, registry
+
+##############################
+# AGENDADOR DAS CHAMADAS À GROQ
+##############################
+
+# Todas as chamadas de modelo (bot, Streamlit e jobs em lote) passam por um
+# agendador único por processo. Ele respeita os limites da conta (pedidos e
+# tokens por minuto, com token buckets), atende primeiro os pedidos
+# interativos, recusa pedidos quando a fila está cheia e, em caso de 429,
+# tenta de novo com backoff e jitter.
+#
+# Os limites são da conta, não do processo: os baldes da conta ficam num
+# SQLite (GROQ_LIMITS_STORE) que o bot, o Streamlit e o precompute rodando
+# na mesma máquina dividem, assim como as pausas depois de um 429. Cada
+# processo pode ainda se limitar a uma fração da conta (GROQ_PROCESS_SHARE,
+# ex.: o precompute deixa o resto para o bot). Com GROQ_LIMITS_STORE vazio
+# (ou réplicas em máquinas diferentes) cada processo só enxerga a própria
+# fração, e a soma das frações tem de caber em GROQ_RPM/GROQ_TPM.
+GROQ_RPM = float(os.getenv("GROQ_RPM", "30"))
+GROQ_TPM = float(os.getenv("GROQ_TPM", "6000"))
+GROQ_LIMITS_STORE = os.getenv("GROQ_LIMITS_STORE", "groq_limites.sqlite3")
+GROQ_PROCESS_SHARE = float(os.getenv("GROQ_PROCESS_SHARE", "1"))
+GROQ_QUEUE_MAX = int(os.getenv("GROQ_QUEUE_MAX", "20"))
+# Tempo máximo esperando na fila antes de desistir
+GROQ_MAX_WAIT = float(os.getenv("GROQ_MAX_WAIT", os.getenv("AGENT_TIMEOUT", "90")))
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "3"))
+# Estimativa de tokens de saída quando o modelo não define max_tokens
+GROQ_OUTPUT_ESTIMATE = int(os.getenv("GROQ_OUTPUT_ESTIMATE", "800"))
+
+# Prioridades (menor = atendido antes)
+PRIORIDADE_INTERATIVA = 0     # diagnóstico pedido pelo usuário
+PRIORIDADE_RECOMENDACAO = 1   # recomendações (respostas mais longas)
+PRIORIDADE_LOTE = 2           # pré-cálculo e outros jobs em segundo plano
+
+# Definidas por quem originou o pedido; chegam às threads dos agentes porque
+# o agent_runner copia o contexto ao agendar
+prioridade_atual = contextvars.ContextVar("prioridade_groq", default=PRIORIDADE_INTERATIVA)
+# Chamado (da thread do agente) com a posição na fila quando o pedido precisa esperar
+aviso_de_fila = contextvars.ContextVar("aviso_de_fila", default=None)
+
+
+class SchedulerBusyError(Exception):
+    """Fila cheia, espera maior que GROQ_MAX_WAIT ou 429 mesmo depois das novas tentativas."""
+
+
+@contextmanager
+def agendamento(prioridade: int, aviso=None):
+    tokens = (prioridade_atual.set(prioridade), aviso_de_fila.set(aviso))
+    try:
+        yield
+    finally:
+        prioridade_atual.reset(tokens[0])
+        aviso_de_fila.reset(tokens[1])
+
+
+class TokenBucket:
+    def __init__(self, capacidade: float, por_segundo: float, nivel: float = None, ultimo: float = None):
+        self.capacidade = capacidade
+        self.por_segundo = por_segundo
+        self.nivel = capacidade if nivel is None else nivel
+        self._ultimo = time.monotonic() if ultimo is None else ultimo
+
+    def _repor(self, agora: float) -> None:
+        self.nivel = min(self.capacidade, self.nivel + (agora - self._ultimo) * self.por_segundo)
+        self._ultimo = agora
+
+    def espera(self, quantidade: float, agora: float) -> float:
+        """Segundos até haver `quantidade` disponível (0 se já houver)."""
+        self._repor(agora)
+        # Um pedido maior que a capacidade passa quando o balde estiver cheio
+        falta = min(quantidade, self.capacidade) - self.nivel
+        return max(falta / self.por_segundo, 0.0)
+
+    def consumir(self, quantidade: float) -> None:
+        # Pode ficar negativo (acerto com o uso real): os próximos esperam mais
+        self.nivel -= quantidade
+
+
+class LimitesDaConta:
+    """Baldes de pedidos e tokens da conta num SQLite, divididos entre processos.
+
+    Usa o relógio de parede (o monotonic é de cada processo) e cada operação
+    é uma transação IMMEDIATE: ler, repor, consumir e gravar sem corrida.
+    """
+
+    def __init__(self, path: str, rpm: float = GROQ_RPM, tpm: float = GROQ_TPM):
+        self._taxas = {"pedidos": (rpm, rpm / 60), "tokens": (tpm, tpm / 60)}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS baldes ("
+            " nome TEXT PRIMARY KEY,"
+            " nivel REAL NOT NULL,"
+            " atualizado REAL NOT NULL)"
+        )
+
+    @contextmanager
+    def _transacao(self):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def _ler(self, agora: float):
+        linhas = {nome: (nivel, atualizado) for nome, nivel, atualizado in self._db.execute("SELECT * FROM baldes")}
+        baldes = {
+            nome: TokenBucket(capacidade, por_segundo, *linhas.get(nome, (capacidade, agora)))
+            for nome, (capacidade, por_segundo) in self._taxas.items()
+        }
+        return baldes, linhas.get("pausa", (0.0, 0.0))[0]
+
+    def _gravar(self, baldes: dict) -> None:
+        self._db.executemany(
+            "INSERT OR REPLACE INTO baldes (nome, nivel, atualizado) VALUES (?, ?, ?)",
+            [(nome, balde.nivel, balde._ultimo) for nome, balde in baldes.items()],
+        )
+
+    def reservar(self, custo: float) -> float:
+        """Consome um pedido e `custo` tokens se houver; senão devolve quantos segundos esperar."""
+        agora = time.time()
+        with self._transacao():
+            baldes, pausa_ate = self._ler(agora)
+            espera = max(pausa_ate - agora, baldes["pedidos"].espera(1, agora), baldes["tokens"].espera(custo, agora))
+            if espera <= 0:
+                baldes["pedidos"].consumir(1)
+                baldes["tokens"].consumir(custo)
+            self._gravar(baldes)
+        return espera
+
+    def acertar(self, diferenca: float) -> None:
+        agora = time.time()
+        with self._transacao():
+            baldes, _ = self._ler(agora)
+            baldes["tokens"].consumir(diferenca)
+            self._gravar(baldes)
+
+    def pausar(self, segundos: float) -> None:
+        agora = time.time()
+        with self._transacao():
+            self._db.execute(
+                "INSERT INTO baldes (nome, nivel, atualizado) VALUES ('pausa', ?, ?)"
+                " ON CONFLICT (nome) DO UPDATE SET nivel = MAX(nivel, excluded.nivel), atualizado = excluded.atualizado",
+                (agora + segundos, agora),
+            )
+
+
+class GroqScheduler:
+    def __init__(self, rpm: float = GROQ_RPM * GROQ_PROCESS_SHARE, tpm: float = GROQ_TPM * GROQ_PROCESS_SHARE,
+                 max_fila: int = GROQ_QUEUE_MAX, max_espera: float = GROQ_MAX_WAIT, conta: LimitesDaConta = None):
+        # Fração do processo; a conta inteira (se houver) é conferida depois
+        self.pedidos = TokenBucket(rpm, rpm / 60)
+        self.tokens = TokenBucket(tpm, tpm / 60)
+        self.conta = conta
+        self.max_fila = max_fila
+        self.max_espera = max_espera
+        self._cond = threading.Condition()
+        self._fila = []
+        self._seq = itertools.count()
+        self._pausa_ate = 0.0
+        self.stats = {"liberados": 0, "recusados": 0, "esperaram": 0, "tempo_espera": 0.0, "retentativas": 0}
+
+    def tamanho_fila(self) -> int:
+        with self._cond:
+            return len(self._fila)
+
+    def _espera(self, custo: float, agora: float) -> float:
+        # Quando devolve 0 o pedido já foi descontado da conta (quem chama libera na hora)
+        espera = max(self._pausa_ate - agora, self.pedidos.espera(1, agora), self.tokens.espera(custo, agora))
+        if espera > 0 or self.conta is None:
+            return espera
+        try:
+            return self.conta.reservar(custo)
+        except sqlite3.Error as e:
+            # Sem o arquivo compartilhado, vale só o limite do processo
+            print(f"Falha ao consultar os limites da conta: {e}")
+            return 0.0
+
+    def _na_conta(self, operacao: str, *args) -> None:
+        if self.conta is None:
+            return
+        try:
+            getattr(self.conta, operacao)(*args)
+        except sqlite3.Error as e:
+            print(f"Falha ao atualizar os limites da conta: {e}")
+
+    def adquirir(self, custo: float, prioridade: int = None, aviso=None) -> None:
+        """Bloqueia até o pedido poder ser enviado; levanta SchedulerBusyError se não der."""
+        prioridade = prioridade_atual.get() if prioridade is None else prioridade
+        aviso = aviso_de_fila.get() if aviso is None else aviso
+        inicio = time.monotonic()
+        with self._cond:
+            if len(self._fila) >= self.max_fila:
+                self.stats["recusados"] += 1
+                raise SchedulerBusyError("Fila de pedidos ao modelo cheia")
+
+            entrada = (prioridade, next(self._seq))
+            heapq.heappush(self._fila, entrada)
+            ultima_posicao = None
+            try:
+                while True:
+                    agora = time.monotonic()
+                    if self._fila[0] == entrada:
+                        espera = self._espera(custo, agora)
+                        if espera <= 0:
+                            heapq.heappop(self._fila)
+                            self.pedidos.consumir(1)
+                            self.tokens.consumir(custo)
+                            break
+                    else:
+                        espera = self.max_espera
+
+                    posicao = 1 + sum(1 for outra in self._fila if outra < entrada)
+                    if aviso is not None and posicao != ultima_posicao:
+                        ultima_posicao = posicao
+                        try:
+                            aviso(posicao)
+                        except Exception as e:
+                            print(f"Falha ao avisar a posição na fila: {e}")
+
+                    restante = inicio + self.max_espera - agora
+                    if restante <= 0:
+                        self.stats["recusados"] += 1
+                        raise SchedulerBusyError(f"Pedido esperou mais de {self.max_espera:.0f}s na fila")
+                    self._cond.wait(min(espera, restante))
+            except BaseException:
+                if entrada in self._fila:
+                    self._fila.remove(entrada)
+                    heapq.heapify(self._fila)
+                raise
+            finally:
+                # A cabeça da fila mudou: quem estava atrás recalcula a espera
+                self._cond.notify_all()
+
+            self.stats["liberados"] += 1
+            if ultima_posicao is not None:
+                self.stats["esperaram"] += 1
+            self.stats["tempo_espera"] += time.monotonic() - inicio
+
+    def acertar(self, estimado: float, real: float) -> None:
+        """Corrige o balde de tokens com o uso informado pela API."""
+        with self._cond:
+            self.tokens.consumir(real - estimado)
+            self._na_conta("acertar", real - estimado)
+
+    def pausar(self, segundos: float) -> None:
+        """Depois de um 429 (ou erro 5xx), ninguém sai da fila até a pausa acabar."""
+        with self._cond:
+            self._pausa_ate = max(self._pausa_ate, time.monotonic() + segundos)
+            self._na_conta("pausar", segundos)
+            self.stats["retentativas"] += 1
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> GroqScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = GroqScheduler(conta=LimitesDaConta(GROQ_LIMITS_STORE) if GROQ_LIMITS_STORE else None)
+            registry.adicionar_coletor(_coletar_metricas)
+        return _scheduler
+
+
+def _coletar_metricas():
+    scheduler = get_scheduler()
+    yield "groq_fila_tamanho", {}, scheduler.tamanho_fila()
+    for nome in ("liberados", "recusados", "esperaram", "retentativas"):
+        yield "groq_agendador_pedidos", {"situacao": nome}, scheduler.stats[nome]
+    yield "groq_agendador_espera_segundos", {}, round(scheduler.stats["tempo_espera"], 3)
+
+
+def estimar_tokens(model, messages) -> int:
+    # ~4 caracteres por token, mais a resposta esperada
+    caracteres = sum(len(str(m.content or "")) for m in messages)
+    if model.tools:
+        caracteres += len(str(model.tools))
+    return caracteres // 4 + (model.max_tokens or GROQ_OUTPUT_ESTIMATE)
+
+
+def _espera_retentativa(erro, tentativa: int) -> float:
+    response = getattr(erro, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        base = float(retry_after)
+    except (TypeError, ValueError):
+        base = 2.0 ** tentativa
+    # Jitter para os pedidos que falharam juntos não voltarem juntos
+    return base * random.uniform(1.0, 1.5)
+
+
+def _retentavel(erro) -> bool:
+    from groq import APIConnectionError, InternalServerError, RateLimitError
+
+    return isinstance(erro, (RateLimitError, InternalServerError, APIConnectionError))
+
+
+def _desistir(erro):
+    """Levanta o erro da última tentativa; um 429 que persiste vira SchedulerBusyError."""
+    from groq import RateLimitError
+
+    if isinstance(erro, RateLimitError):
+        raise SchedulerBusyError("Limite de pedidos da Groq atingido") from erro
+    raise erro
+
+
+def _criar_scheduled_groq():
+    # O phi (e o SDK da Groq) só são importados quando o modelo é usado pela
+    # primeira vez: o bot sobe e responde ao health check sem eles
+    from phi.model.groq import Groq
+
+    class ScheduledGroq(Groq):
+        """Modelo Groq do phi cujas chamadas passam pelo agendador do processo."""
+
+        def invoke(self, messages):
+            scheduler = get_scheduler()
+            estimado = estimar_tokens(self, messages)
+            for tentativa in range(GROQ_MAX_RETRIES + 1):
+                with medir("groq_fila"):
+                    scheduler.adquirir(estimado)
+                try:
+                    with medir("groq", modelo=self.id):
+                        response = super().invoke(messages)
+                except Exception as e:
+                    if not _retentavel(e):
+                        raise
+                    if tentativa == GROQ_MAX_RETRIES:
+                        _desistir(e)
+                    scheduler.pausar(_espera_retentativa(e, tentativa))
+                    continue
+                if response.usage is not None:
+                    scheduler.acertar(estimado, response.usage.total_tokens)
+                    contar_tokens(self.id, response.usage)
+                return response
+
+        def invoke_stream(self, messages):
+            scheduler = get_scheduler()
+            estimado = estimar_tokens(self, messages)
+            for tentativa in range(GROQ_MAX_RETRIES + 1):
+                with medir("groq_fila"):
+                    scheduler.adquirir(estimado)
+                recebeu = False
+                try:
+                    # Mede até o último pedaço (inclui o tempo de quem consome o stream)
+                    with medir("groq_stream", modelo=self.id):
+                        for chunk in super().invoke_stream(messages):
+                            recebeu = True
+                            usage = getattr(getattr(chunk, "x_groq", None), "usage", None)
+                            if usage is not None:
+                                scheduler.acertar(estimado, usage.total_tokens)
+                                contar_tokens(self.id, usage)
+                            yield chunk
+                    return
+                except Exception as e:
+                    # Depois do primeiro pedaço não dá para repetir sem duplicar o texto
+                    if recebeu or not _retentavel(e):
+                        raise
+                    if tentativa == GROQ_MAX_RETRIES:
+                        _desistir(e)
+                    scheduler.pausar(_espera_retentativa(e, tentativa))
+
+    ScheduledGroq.__qualname__ = "ScheduledGroq"
+    return ScheduledGroq
+
+
+_classe_lock = threading.Lock()
+
+
+def __getattr__(name):
+    if name == "ScheduledGroq":
+        with _classe_lock:
+            if "ScheduledGroq" not in globals():
+                globals()["ScheduledGroq"] = _criar_scheduled_groq()
+        return globals()["ScheduledGroq"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,96 @@
+import time
+import random
+import asyncio
+
+import httpx
+
+##############################
+# CLIENTE HTTP ASSÍNCRONO PARA OS SCRAPERS
+##############################
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0"
+}
+
+# Respostas que valem uma nova tentativa
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def create_client(concurrency: int = 8, headers: dict = None, timeout: float = 30.0) -> httpx.AsyncClient:
+    """Cliente com pool de conexões (keep-alive) dimensionado pela concorrência."""
+    return httpx.AsyncClient(
+        headers=headers or HEADERS,
+        limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+        timeout=timeout,
+        follow_redirects=True,
+    )
+
+
+class AdaptiveRateLimiter:
+    """Espaça as requisições ao mesmo host.
+
+    O intervalo começa em min_interval, é multiplicado a cada 429/5xx e volta
+    a cair aos poucos conforme as respostas dão certo. Um Retry-After do
+    servidor pausa todas as requisições até o horário indicado.
+    """
+
+    def __init__(self, min_interval: float = 0.0, max_interval: float = 30.0,
+                 increase: float = 2.0, decrease: float = 0.9):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.increase = increase
+        self.decrease = decrease
+        self.interval = min_interval
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def success(self) -> None:
+        self.interval = max(self.min_interval, self.interval * self.decrease)
+
+    def throttle(self, retry_after: float = None) -> None:
+        self.interval = min(self.max_interval, max(self.interval * self.increase, 0.5))
+        if retry_after:
+            self._next_slot = max(self._next_slot, time.monotonic() + retry_after)
+
+
+def retry_after_seconds(response: httpx.Response):
+    value = response.headers.get("Retry-After")
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+async def fetch(client: httpx.AsyncClient, url: str, limiter: AdaptiveRateLimiter = None,
+                retries: int = 4, backoff: float = 1.0, **kwargs) -> httpx.Response:
+    """GET com novas tentativas (backoff exponencial com jitter) em 429/5xx e erros de rede.
+
+    Se todas as tentativas falharem, devolve a última resposta ou relança o
+    último erro de rede.
+    """
+    for attempt in range(retries + 1):
+        if limiter is not None:
+            await limiter.wait()
+        try:
+            response = await client.get(url, **kwargs)
+        except httpx.TransportError:
+            if attempt == retries:
+                raise
+        else:
+            if response.status_code not in RETRY_STATUS:
+                if limiter is not None:
+                    limiter.success()
+                return response
+            if limiter is not None:
+                limiter.throttle(retry_after_seconds(response))
+            if attempt == retries:
+                return response
+        await asyncio.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))
@@ -0,0 +1,273 @@
+import os
+import sys
+import json
+import time
+import bisect
+import threading
+import functools
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from uuid import uuid4
+
+##############################
+# MÉTRICAS E TRACING
+##############################
+
+# Cada etapa de uma resposta (fila e inferência da Groq, ferramentas de
+# busca, limpeza do texto, envio/edição no Telegram) é cronometrada com
+# medir(). As durações vão para histogramas (expostos no formato do
+# Prometheus em /metrics) e, evento a evento, para um log JSON Lines com o
+# trace_id do pedido, que permite reconstruir uma resposta lenta.
+METRICS_LOG = os.getenv("METRICS_LOG", "metricas.jsonl")
+# Amostras recentes guardadas por série para calcular p50/p95/p99
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", "2048"))
+
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+trace_id = contextvars.ContextVar("trace_id", default=None)
+
+
+def _chave(nome: str, labels: dict):
+    return nome, tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def _formatar_labels(labels) -> str:
+    if not labels:
+        return ""
+    pares = ",".join(f'{k}="{v}"'.replace("\n", " ") for k, v in labels)
+    return "{" + pares + "}"
+
+
+class Registry:
+    def __init__(self, janela: int = METRICS_WINDOW):
+        self.janela = janela
+        self._lock = threading.Lock()
+        self._contadores = {}
+        self._histogramas = {}   # chave -> [contagem por bucket, soma, total]
+        self._recentes = {}      # chave -> deque com as últimas amostras
+        self._coletores = []
+
+    def contar(self, nome: str, valor: float = 1, **labels) -> None:
+        chave = _chave(nome, labels)
+        with self._lock:
+            self._contadores[chave] = self._contadores.get(chave, 0) + valor
+
+    def observar(self, nome: str, valor: float, **labels) -> None:
+        chave = _chave(nome, labels)
+        with self._lock:
+            hist = self._histogramas.get(chave)
+            if hist is None:
+                hist = self._histogramas[chave] = [[0] * len(BUCKETS), 0.0, 0]
+                self._recentes[chave] = deque(maxlen=self.janela)
+            i = bisect.bisect_left(BUCKETS, valor)
+            if i < len(BUCKETS):
+                hist[0][i] += 1
+            hist[1] += valor
+            hist[2] += 1
+            self._recentes[chave].append(valor)
+
+    def adicionar_coletor(self, coletor) -> None:
+        """coletor() devolve [(nome, labels, valor)] lidos na hora (gauges)."""
+        self._coletores.append(coletor)
+
+    def _gauges(self):
+        for coletor in self._coletores:
+            try:
+                yield from coletor()
+            except Exception as e:
+                print(f"Falha ao coletar métricas: {e}")
+
+    def percentis(self, quantis=(0.5, 0.95, 0.99)) -> dict:
+        with self._lock:
+            amostras = {chave: sorted(valores) for chave, valores in self._recentes.items()}
+        resumo = {}
+        for (nome, labels), valores in amostras.items():
+            if not valores:
+                continue
+            serie = nome + _formatar_labels(labels)
+            resumo[serie] = {"n": len(valores)}
+            for q in quantis:
+                resumo[serie][f"p{round(q * 100)}"] = round(valores[min(int(q * len(valores)), len(valores) - 1)], 4)
+        return resumo
+
+    def resumo(self) -> dict:
+        with self._lock:
+            contadores = {nome + _formatar_labels(labels): valor for (nome, labels), valor in self._contadores.items()}
+        gauges = {nome + _formatar_labels(_chave(nome, labels)[1]): valor for nome, labels, valor in self._gauges()}
+        return {"contadores": contadores, "gauges": gauges, "latencias": self.percentis()}
+
+    def prometheus(self) -> str:
+        linhas = []
+        with self._lock:
+            contadores = sorted(self._contadores.items())
+            histogramas = sorted((chave, (list(h[0]), h[1], h[2])) for chave, h in self._histogramas.items())
+
+        tipos = set()
+        for (nome, labels), valor in contadores:
+            if nome not in tipos:
+                tipos.add(nome)
+                linhas.append(f"# TYPE {nome} counter")
+            linhas.append(f"{nome}{_formatar_labels(labels)} {valor}")
+
+        for (nome, labels), (buckets, soma, total) in histogramas:
+            if nome not in tipos:
+                tipos.add(nome)
+                linhas.append(f"# TYPE {nome} histogram")
+            acumulado = 0
+            for limite, contagem in zip(BUCKETS, buckets):
+                acumulado += contagem
+                linhas.append(f"{nome}_bucket{_formatar_labels(labels + (('le', str(limite)),))} {acumulado}")
+            linhas.append(f"{nome}_bucket{_formatar_labels(labels + (('le', '+Inf'),))} {total}")
+            linhas.append(f"{nome}_sum{_formatar_labels(labels)} {soma:.6f}")
+            linhas.append(f"{nome}_count{_formatar_labels(labels)} {total}")
+
+        for nome, labels, valor in self._gauges():
+            if nome not in tipos:
+                tipos.add(nome)
+                linhas.append(f"# TYPE {nome} gauge")
+            linhas.append(f"{nome}{_formatar_labels(_chave(nome, labels)[1])} {valor}")
+        return "\n".join(linhas) + "\n"
+
+
+registry = Registry()
+
+_log_lock = threading.Lock()
+_log_file = None
+
+
+def registrar_evento(evento: str, **dados) -> None:
+    """Acrescenta uma linha ao log JSON (METRICS_LOG vazio desliga o log)."""
+    global _log_file
+    if not METRICS_LOG:
+        return
+    linha = {"ts": round(time.time(), 3), "evento": evento, "trace_id": trace_id.get(), **dados}
+    texto = json.dumps(linha, ensure_ascii=False, default=str) + "\n"
+    with _log_lock:
+        if _log_file is None:
+            _log_file = open(METRICS_LOG, "a", encoding="utf-8", buffering=1)
+        _log_file.write(texto)
+
+
+def novo_trace(origem: str, **dados) -> str:
+    """Abre um trace para o pedido atual; as etapas seguintes (inclusive nas
+    threads dos agentes, que copiam o contexto) levam o mesmo trace_id."""
+    novo = uuid4().hex[:12]
+    trace_id.set(novo)
+    registrar_evento("pedido", origem=origem, **dados)
+    return novo
+
+
+def observar_etapa(etapa: str, duracao: float, erro: str = None, **labels) -> None:
+    registry.observar("etapa_duracao_segundos", duracao, etapa=etapa, **labels)
+    if erro:
+        registry.contar("etapa_erros_total", etapa=etapa, erro=erro)
+    registrar_evento("etapa", etapa=etapa, duracao_ms=round(duracao * 1000, 1), erro=erro, **labels)
+
+
+@contextmanager
+def medir(etapa: str, **labels):
+    """Cronometra o bloco como uma etapa (funciona também em código async)."""
+    inicio = time.perf_counter()
+    erro = None
+    try:
+        yield
+    except GeneratorExit:
+        # Stream interrompido por quem consumia: não é erro da etapa
+        raise
+    except BaseException as e:
+        erro = type(e).__name__
+        raise
+    finally:
+        observar_etapa(etapa, time.perf_counter() - inicio, erro, **labels)
+
+
+def cronometrar(etapa: str, **labels):
+    """Decorador de medir() para funções async (ex.: handlers inteiros)."""
+    def decorador(fn):
+        @functools.wraps(fn)
+        async def medido(*args, **kwargs):
+            with medir(etapa, **labels):
+                return await fn(*args, **kwargs)
+        return medido
+    return decorador
+
+
+def contar_tokens(modelo: str, usage) -> None:
+    if usage is None:
+        return
+    registry.contar("groq_tokens_total", usage.prompt_tokens or 0, modelo=modelo, tipo="prompt")
+    registry.contar("groq_tokens_total", usage.completion_tokens or 0, modelo=modelo, tipo="completion")
+    registrar_evento("tokens", modelo=modelo, prompt=usage.prompt_tokens, completion=usage.completion_tokens)
+
+
+def contar_cache(agent_type: str, hit: bool) -> None:
+    registry.contar("cache_consultas_total", origem=agent_type, resultado="hit" if hit else "miss")
+
+
+########## Tempo de import ##########
+
+@contextmanager
+def medir_imports():
+    """Cronometra os módulos importados pela primeira vez dentro do bloco.
+
+    Preenche {módulo: (segundos, nível)} com o tempo acumulado de cada import
+    (incluindo os que ele puxa), como a coluna "cumulative" do -X importtime.
+    """
+    import builtins
+
+    original = builtins.__import__
+    tempos = {}
+    pilha = threading.local()
+
+    def importar(name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return original(name, globals, locals, fromlist, level)
+        nivel = getattr(pilha, "nivel", 0)
+        pilha.nivel = nivel + 1
+        inicio = time.perf_counter()
+        try:
+            return original(name, globals, locals, fromlist, level)
+        finally:
+            pilha.nivel = nivel
+            tempos.setdefault(name, (time.perf_counter() - inicio, nivel))
+
+    builtins.__import__ = importar
+    try:
+        yield tempos
+    finally:
+        builtins.__import__ = original
+
+
+def relatorio_de_imports(tempos: dict, limite: int = 15, nivel_maximo: int = 2) -> str:
+    mais_lentos = sorted(((t, n, nome) for nome, (t, n) in tempos.items() if n <= nivel_maximo), reverse=True)
+    registrar_evento("imports", modulos={nome: round(t * 1000, 1) for t, _, nome in mais_lentos[:limite]})
+    linhas = [f"{t * 1000:8.1f} ms  {'  ' * n}{nome}" for t, n, nome in mais_lentos[:limite]]
+    return "Imports mais lentos (acumulado):\n" + "\n".join(linhas)
+
+
+########## Ferramentas dos agentes ##########
+
+_inicio_ferramentas = {}
+_ferramentas_lock = threading.Lock()
+
+
+def _antes_da_ferramenta(fc) -> None:
+    with _ferramentas_lock:
+        _inicio_ferramentas[id(fc)] = time.perf_counter()
+
+
+def _depois_da_ferramenta(fc) -> None:
+    with _ferramentas_lock:
+        inicio = _inicio_ferramentas.pop(id(fc), None)
+    if inicio is not None:
+        observar_etapa("ferramenta", time.perf_counter() - inicio, ferramenta=fc.function.name)
+
+
+def instrumentar_ferramentas(toolkits):
+    """Cronometra cada chamada de ferramenta (busca na web, leitura de artigos) via pre/post hooks do phi."""
+    for toolkit in toolkits:
+        for function in toolkit.functions.values():
+            function.pre_hook = _antes_da_ferramenta
+            function.post_hook = _depois_da_ferramenta
+    return toolkits
@@ -0,0 +1,98 @@
+# Análise de preços dos livros raspados (Americanas e Amazon)
+
+import os
+import streamlit as st
+from crawl_store import CRAWL_DB
+from price_index import fontes_configuradas
+import price_analytics as pa
+
+st.set_page_config(page_title="Análise de Preços", page_icon="💰", layout="wide")
+
+
+# A versão (mtime dos arquivos) entra na chave do cache: os dados só são
+# relidos quando um scraper grava um arquivo novo. As chaves são pequenas de
+# propósito; passar os DataFrames como argumento obrigaria o Streamlit a
+# calcular o hash deles a cada rerun.
+def versao_dos_arquivos(paths):
+    return tuple(os.path.getmtime(path) if os.path.exists(path) else None for path in paths)
+
+
+@st.cache_data(show_spinner="Carregando ofertas...")
+def carregar_ofertas(fontes, versao):
+    return pa.com_desconto(pa.carregar_ofertas(list(fontes)))
+
+
+@st.cache_data
+def mais_barato_por_titulo(fontes, versao, categorias):
+    ofertas = carregar_ofertas(fontes, versao)
+    if categorias:
+        ofertas = ofertas[ofertas["categoria"].isin(categorias)]
+    return pa.mais_barato_por_titulo(ofertas)
+
+
+@st.cache_data(show_spinner="Carregando histórico de preços...")
+def carregar_historico(path, versao):
+    return pa.carregar_historico(path)
+
+
+@st.cache_data
+def variacao_de_precos(path, versao):
+    return pa.variacao_de_precos(carregar_historico(path, versao))
+
+
+fontes = tuple(fontes_configuradas())
+versao = versao_dos_arquivos([path for _, path in fontes])
+ofertas = carregar_ofertas(fontes, versao)
+
+st.title("💰 Análise de Preços")
+
+if ofertas.empty:
+    st.info("Nenhum catálogo raspado encontrado. Rode os scrapers (get_americanas.py / get_amazon.py) primeiro.")
+    st.stop()
+
+categorias = sorted(ofertas["categoria"].dropna().unique())
+escolhidas = tuple(st.sidebar.multiselect("Categorias", categorias))
+if escolhidas:
+    ofertas = ofertas[ofertas["categoria"].isin(escolhidas)]
+
+col1, col2, col3 = st.columns(3)
+col1.metric("Ofertas", f"{len(ofertas):,}".replace(",", "."))
+col2.metric("Títulos", f"{ofertas['livro'].nunique():,}".replace(",", "."))
+col3.metric("Desconto médio", f"{ofertas['desconto_pct'].mean():.1f}%")
+
+st.markdown("### 🏪 Resumo por loja")
+st.dataframe(pa.resumo_por_loja(ofertas))
+
+st.markdown("### 🔥 Maiores descontos")
+st.dataframe(
+    ofertas.nlargest(20, "desconto_pct")[["titulo", "loja", "categoria", "preco_antigo", "preco_novo", "desconto_pct"]],
+    hide_index=True,
+)
+
+st.markdown("### 🏷️ Loja mais barata por título")
+baratas = mais_barato_por_titulo(fontes, versao, escolhidas)
+so_comparaveis = st.checkbox("Só títulos vendidos em mais de uma loja", value=True)
+if so_comparaveis:
+    baratas = baratas[baratas["lojas"] > 1]
+st.dataframe(
+    baratas.sort_values("economia", ascending=False)[["titulo", "loja", "preco_novo", "preco_max", "economia", "lojas"]],
+    hide_index=True,
+)
+
+st.markdown("### 📈 Histórico de preços")
+versao_historico = versao_dos_arquivos([CRAWL_DB])
+historico = carregar_historico(CRAWL_DB, versao_historico)
+if historico.empty:
+    st.info("Sem histórico ainda: ele é gravado pelos scrapers no modo --incremental.")
+else:
+    variacao = variacao_de_precos(CRAWL_DB, versao_historico)
+    st.dataframe(
+        variacao[variacao["mudancas"] > 0].sort_values("variacao_pct"),
+        hide_index=True,
+    )
+    opcoes = variacao.drop_duplicates("produto_id").set_index("produto_id")["titulo"]
+    opcoes = opcoes.fillna(opcoes.index.to_series())
+    selecionados = st.multiselect("Produtos", opcoes.index.tolist()[:5000], format_func=lambda pid: opcoes[pid])
+    if selecionados:
+        serie = pa.serie_de_precos(historico, selecionados)
+        st.line_chart(serie.rename(columns=opcoes.to_dict()))
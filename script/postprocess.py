@@ -0,0 +1,453 @@
+import re
+
+##############################
+# LIMPEZA DAS RESPOSTAS DOS AGENTES
+##############################
+
+# Uma passada só, com os padrões compilados uma vez: remove os rastros das
+# ferramentas do phi ("Running: ...") e o raciocínio do deepseek-r1
+# (<think>...</think>), converte o Markdown do modelo para o Markdown do
+# Telegram (escapando o que ficaria sem par) e divide textos longos no limite
+# de 4096 caracteres sem quebrar a formatação.
+#
+# Tudo funciona pedaço a pedaço (stream) em tempo linear: cada caractere é
+# examinado um número constante de vezes e só fica retido o que ainda pode
+# mudar (um marcador pela metade, um '**' sem par na linha atual).
+
+TELEGRAM_MAX_LENGTH = 4096
+
+# Blocos removidos por inteiro: marcador de início -> marcador de fim
+BLOCKS = {"Running:": "\n\n", "<think>": "</think>"}
+_BLOCK_START = re.compile("|".join(map(re.escape, BLOCKS)))
+# Caracteres que podem mudar a formatação no Markdown do Telegram
+_SPECIAL = re.compile(r"[\\*_`\[]")
+_HEADING = re.compile(r"#{1,6}[ \t]+")
+_BULLET = re.compile(r"[ \t]*[*+][ \t]")
+_MAYBE_BULLET = re.compile(r"[ \t]*[*+]?")
+_FENCE_INFO = re.compile(r"[\w+-]*[ \t]*")
+_ESCAPABLE = "*_`["
+# Um negrito/itálico que não fecha depois de tantos caracteres vira texto comum
+MAX_ENTITY = 1000
+# Idem para um 'Running:' sem o fim do rastro (os do phi têm poucas linhas)
+MAX_TOOL_TRACE = 2000
+
+
+def _pending_marker(text: str, start: int, markers) -> int:
+    """Tamanho do maior final de text[start:] que é começo de algum marcador."""
+    longest = max(map(len, markers)) - 1
+    for size in range(min(longest, len(text) - start), 0, -1):
+        tail = text[-size:]
+        if any(marker.startswith(tail) for marker in markers):
+            return size
+    return 0
+
+
+class _BlockFilter:
+    """Remove os blocos de BLOCKS. Um 'Running:' sem fim é mantido (não era
+    rastro de ferramenta); um <think> sem fim é descartado."""
+
+    def __init__(self):
+        self._buf = ""
+        self._end = None    # marcador que fecha o bloco aberto
+        self._from = 0      # onde continuar procurando esse marcador em _buf
+
+    def feed(self, chunk: str, final: bool = False) -> str:
+        buf = self._buf + chunk
+        out = []
+        pos = 0
+        while True:
+            if self._end is None:
+                match = _BLOCK_START.search(buf, pos)
+                if match is None:
+                    keep = 0 if final else _pending_marker(buf, pos, BLOCKS)
+                    out.append(buf[pos:len(buf) - keep])
+                    pos = len(buf) - keep
+                    break
+                out.append(buf[pos:match.start()])
+                pos = match.start()
+                self._end = BLOCKS[match.group()]
+                self._from = match.end()
+
+            end = buf.find(self._end, self._from)
+            if end != -1:
+                pos = end + len(self._end)
+                self._end = None
+                continue
+
+            if final:
+                if self._end == BLOCKS["Running:"]:
+                    out.append(buf[pos:])
+                pos = len(buf)
+                self._end = None
+            elif self._end == BLOCKS["<think>"]:
+                # O raciocínio é descartado conforme chega
+                pos = self._from = max(len(buf) - len(self._end) + 1, self._from)
+            elif len(buf) - pos > MAX_TOOL_TRACE:
+                out.append(buf[pos:self._from])
+                pos = self._from
+                self._end = None
+                continue
+            else:
+                self._from = max(len(buf) - len(self._end) + 1, self._from)
+            break
+
+        self._buf = buf[pos:]
+        if self._end is not None:
+            self._from -= pos
+        return "".join(out)
+
+
+class _TelegramMarkdown:
+    """Markdown do modelo -> Markdown (legado) do Telegram, linha a linha.
+
+    **negrito** e __negrito__ viram *negrito*; *itálico* vira _itálico_;
+    títulos (#) viram negrito; '* item' vira '• item'; código e links passam
+    como estão. Marcadores sem par (e '_' no meio de palavras) são escapados.
+    A formatação nunca atravessa linhas, exceto em blocos ```.
+    """
+
+    def __init__(self):
+        self._line = ""          # parte ainda não convertida da linha atual
+        self._line_start = True  # _line começa no início de uma linha
+        self._prev = "\n"        # caractere anterior a _line
+        self._in_pre = False
+        # Buscas já feitas na linha atual: texto procurado -> (de, até, achado
+        # ou -1). Um '[' ou '**' sem par não faz a linha ser relida a cada
+        # marcador ou a cada pedaço que chega.
+        self._found = {}
+
+    def feed(self, text: str, final: bool = False) -> str:
+        data = self._line + text
+        out = []
+        pos = 0
+        # O trecho retido nunca tem quebra de linha
+        scanned = len(self._line)
+        while True:
+            newline = data.find("\n", max(pos, scanned))
+            if newline == -1:
+                break
+            self._convert(data, pos, newline, True, out)
+            out.append("\n")
+            pos = newline + 1
+            self._line_start, self._prev, self._found = True, "\n", {}
+
+        if final:
+            self._convert(data, pos, len(data), True, out)
+            if self._in_pre:
+                out.append("```")
+                self._in_pre = False
+            self._line, self._found = "", {}
+        else:
+            held = self._convert(data, pos, len(data), False, out)
+            self._line = data[held:]
+            # As posições passam a contar a partir do trecho retido
+            self._found = {needle: (lo - held, hi - held, at - held if at != -1 else -1)
+                           for needle, (lo, hi, at) in self._found.items() if at == -1 or at >= held}
+        return "".join(out)
+
+    def _find(self, data: str, needle: str, i: int, end: int) -> int:
+        """data.find(needle, i, end) reaproveitando as buscas anteriores na mesma linha."""
+        lo, hi, at = self._found.get(needle, (i + 1, i, -1))
+        if lo <= i:
+            if at >= i:
+                return at
+            if at == -1 and hi >= end:
+                return -1
+        if at == -1 and lo <= i:
+            # Nada até hi: continua de lá (a linha cresceu desde a última busca)
+            at = data.find(needle, max(i, hi - len(needle) + 1), end)
+            self._found[needle] = (lo, end, at)
+        else:
+            at = data.find(needle, i, end)
+            self._found[needle] = (i, end, at)
+        return at
+
+    def _convert(self, data: str, start: int, end: int, complete: bool, out: list) -> int:
+        """Converte data[start:end]; devolve até onde foi (o resto fica retido)."""
+        i = start
+        if self._line_start and not self._in_pre:
+            rest = data[i:end]
+            heading = _HEADING.match(rest)
+            if not complete and rest[:1] == "#" and len(rest) < MAX_ENTITY:
+                return i
+            if not complete and len(rest) < MAX_ENTITY and _MAYBE_BULLET.fullmatch(rest):
+                return i
+            if heading:
+                title = rest[heading.end():].replace("**", "").replace("__", "").strip()
+                if title and not _SPECIAL.search(title):
+                    out.append(f"*{title}*")
+                    self._line_start = False
+                    return end
+                i += heading.end()
+            else:
+                bullet = _BULLET.match(rest)
+                if bullet:
+                    out.append(bullet.group()[:-2].replace("\t", "  ") + "• ")
+                    i += bullet.end()
+        # Título e lista só valem no começo da linha (nem depois de um ``` fechado nela)
+        self._line_start = False
+
+        while i < end:
+            if self._in_pre:
+                close = data.find("```", i, end)
+                if close == -1:
+                    # Segura um possível '``' do fechamento
+                    keep = 0
+                    while not complete and keep < 2 and end - keep > i and data[end - keep - 1] == "`":
+                        keep += 1
+                    out.append(data[i:end - keep])
+                    return end - keep
+                out.append(data[i:close + 3])
+                self._in_pre = False
+                i = close + 3
+                continue
+
+            match = _SPECIAL.search(data, i, end)
+            if match is None:
+                out.append(data[i:end])
+                self._prev = data[end - 1]
+                return end
+            j = match.start()
+            out.append(data[i:j])
+            prev = data[j - 1] if j > start else self._prev
+            char = data[j]
+
+            if char == "\\":
+                if j + 1 >= end and not complete:
+                    return self._hold(data, j, start)
+                step = 2 if j + 1 < end and data[j + 1] in _ESCAPABLE else 1
+                out.append(data[j:j + step])
+                i = j + step
+                continue
+
+            if char == "`" and data.startswith("```", j, end):
+                info = _FENCE_INFO.fullmatch(data, j + 3, end)
+                if info and not complete and end - j < 32:
+                    return self._hold(data, j, start)
+                out.append("```")
+                self._in_pre = True
+                # Descarta a linguagem de uma cerca (```python), que o Telegram não usa
+                i = end if info else j + 3
+                continue
+
+            if char == "[":
+                resolved = self._link(data, j, start, end, complete, out)
+                if resolved is None:
+                    return self._hold(data, j, start)
+                i = resolved
+                continue
+
+            if not complete and end - j < 3 and data[j:end] == char * (end - j):
+                # Ainda não dá para saber se é '*' ou '**' (ou '`' ou '```')
+                return self._hold(data, j, start)
+
+            if char == "`":
+                opener, telegram = "`", "`"
+            elif data.startswith(char * 2, j, end):
+                opener, telegram = char * 2, "*"
+            elif char == "_" and prev.isalnum():
+                out.append("\\_")
+                i = j + 1
+                continue
+            else:
+                opener, telegram = char, "_" if char == "*" else char
+
+            body = j + len(opener)
+            close = -1
+            if body < end and not data[body].isspace():
+                close = self._find(data, opener, body, end)
+                if close == -1 and not complete and end - j < MAX_ENTITY:
+                    return self._hold(data, j, start)
+
+            content = data[body:close] if close != -1 else ""
+            if content and (telegram == "`" or (telegram not in content and not content[-1].isspace())):
+                out.append(f"{telegram}{content}{telegram}")
+                i = close + len(opener)
+                self._prev = data[i - 1]
+            else:
+                out.append("\\" + "\\".join(opener))
+                i = j + len(opener)
+
+        if i > start:
+            self._prev = data[i - 1]
+        return i
+
+    def _hold(self, data: str, j: int, start: int) -> int:
+        """Retém data[j:] até chegar mais texto."""
+        if j > start:
+            self._prev = data[j - 1]
+        return j
+
+    def _link(self, data: str, j: int, start: int, end: int, complete: bool, out: list):
+        """[texto](url) passa como está; '[' sem link é escapado. None = ainda incompleto."""
+        middle = self._find(data, "](", j + 1, end)
+        close = self._find(data, ")", middle + 2, end) if middle != -1 else -1
+        if close == -1 and not complete and end - j < MAX_ENTITY:
+            return None
+        if close == -1 or -1 < self._find(data, "[", j + 1, end) < middle or middle == j + 1:
+            out.append("\\[")
+            return j + 1
+        out.append(data[j:close + 1])
+        return close + 1
+
+
+class StreamCleaner:
+    """Limpa a resposta de um agente conforme os pedaços chegam.
+
+    feed() devolve o texto limpo acumulado até agora; finish() devolve o
+    texto final, igual ao de clean_response para o texto completo. Com
+    telegram=False (Streamlit) só os blocos de ferramentas/raciocínio saem e
+    o Markdown fica como o modelo escreveu.
+    """
+
+    def __init__(self, telegram: bool = True):
+        self.telegram = telegram
+        self._blocks = _BlockFilter()
+        self._markdown = _TelegramMarkdown() if telegram else None
+        self._parts = []
+        self._text = ""
+
+    def feed(self, chunk: str) -> str:
+        self._push(chunk, final=False)
+        return self.text
+
+    def finish(self, chunk: str = "") -> str:
+        self._push(chunk, final=True)
+        return self.text
+
+    @property
+    def text(self) -> str:
+        if self._parts:
+            self._text += "".join(self._parts)
+            self._parts = []
+        return self._text.strip() if self.telegram else self._text
+
+    def _push(self, chunk: str, final: bool) -> None:
+        released = self._blocks.feed(chunk, final)
+        if self._markdown is not None:
+            released = self._markdown.feed(released, final)
+        if released:
+            self._parts.append(released)
+
+
+def clean_response(text: str, telegram: bool = True) -> str:
+    return StreamCleaner(telegram).finish(text)
+
+
+def escape_markdown(text: str) -> str:
+    """Texto do usuário (ex.: um título) como literal no Markdown do Telegram."""
+    return "".join("\\" + c if c in _ESCAPABLE else c for c in text)
+
+
+##############################
+# DIVISÃO EM MENSAGENS DO TELEGRAM
+##############################
+
+_REOPEN = {"*": "*", "_": "_", "`": "`", "pre": "```"}
+_CUT_PREFERENCE = ("paragraph", "line", "pre", "space", "char", "entity")
+
+
+def _telegram_length(text: str) -> int:
+    # O Telegram conta em unidades UTF-16 (emojis valem 2)
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _find_cut(text: str, start: int, window: int, state: str = None):
+    """Melhor ponto para cortar text a partir de start sem passar de window.
+
+    Percorre o trecho uma vez acompanhando a formatação aberta e guarda o
+    último corte de cada tipo; prefere parágrafo, depois linha, espaço e,
+    em último caso, o meio de uma entidade (que é fechada e reaberta).
+    """
+    best = {}
+    used = 0
+    i = start
+    while i < len(text) and used < window:
+        char = text[i]
+        if state is None:
+            best["char"] = (i, None)
+            if char == "\\":
+                used += 2
+                i += 2
+                continue
+            if text.startswith("```", i):
+                state = "pre"
+                used += 3
+                i += 3
+                continue
+            if char == "\n":
+                best["paragraph" if text.startswith("\n\n", i) else "line"] = (i, None)
+            elif char == " ":
+                best["space"] = (i, None)
+            elif char in "*_`":
+                state = char
+            elif char == "[":
+                state = "link"
+        elif state == "pre":
+            if text.startswith("```", i):
+                state = None
+                used += 3
+                i += 3
+                continue
+            if char == "\n":
+                best["pre"] = (i + 1, "pre")
+        elif state == "link":
+            if char == ")":
+                state = None
+        elif char == state:
+            state = None
+        elif i > start:
+            best["entity"] = (i, state)
+        used += 2 if char > "\uffff" else 1
+        i += 1
+
+    for minimum in (window // 2, 1):
+        for kind in _CUT_PREFERENCE:
+            if kind in best and best[kind][0] - start >= minimum:
+                return best[kind]
+    return i, None
+
+
+def split_message(text: str, limit: int = TELEGRAM_MAX_LENGTH) -> list:
+    """Divide um texto (já em Markdown do Telegram) em mensagens de até limit."""
+    parts = []
+    start = 0
+    reopen = ""
+    state = None
+    while _telegram_length(reopen) + _telegram_length(text[start:]) > limit:
+        # Reserva espaço para fechar uma formatação cortada ao meio ('\n```')
+        cut, state = _find_cut(text, start, limit - _telegram_length(reopen) - 4, state)
+        part = reopen + text[start:cut]
+        if state is None:
+            parts.append(part.rstrip())
+            reopen = ""
+            while cut < len(text) and text[cut] in " \n":
+                cut += 1
+        else:
+            parts.append(part + _REOPEN[state])
+            reopen = _REOPEN[state]
+        start = cut
+
+    rest = reopen + text[start:]
+    if rest.strip() or not parts:
+        parts.append(rest)
+    return parts
+
+
+def pack_messages(sections: list, limit: int = TELEGRAM_MAX_LENGTH, separator: str = "\n\n") -> list:
+    """Junta seções (já em Markdown do Telegram) no menor número de mensagens
+    de até limit, sem cortar uma seção que caiba inteira numa mensagem."""
+    messages = []
+    current = ""
+    for section in sections:
+        candidate = f"{current}{separator}{section}" if current else section
+        if _telegram_length(candidate) <= limit:
+            current = candidate
+            continue
+        if current:
+            messages.append(current)
+        *full, current = split_message(section, limit)
+        messages.extend(full)
+    if current:
+        messages.append(current)
+    return messages
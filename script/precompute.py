@@ -0,0 +1,153 @@
+import os
+import time
+import asyncio
+import argparse
+
+from dotenv import load_dotenv
+
+##############################
+# PRÉ-CÁLCULO DAS RESPOSTAS DOS LIVROS EM ALTA
+##############################
+
+# Job offline: lê o catálogo raspado (Amazon e Americanas, via PRICE_SOURCES),
+# ordena os livros por popularidade e desconto e grava no response_cache as
+# respostas de get_book_info / get_recommendations do bot do Telegram. O bot
+# procura essas respostas pelo título do catálogo (precomputed), então o
+# primeiro usuário a perguntar por um livro em alta já não espera o agente.
+#
+# Popularidade: a posição do livro na listagem de cada loja (página e ordem
+# na página, gravadas pelos scrapers; as listagens vêm ordenadas pelos mais
+# vendidos) somada entre as lojas que o vendem.
+# Desconto: o maior entre as ofertas, de 0 a 1, com peso --peso-desconto.
+#
+# Os pedidos vão com PRIORIDADE_LOTE e, como este processo tem o próprio
+# agendador, usa só uma fração (--fracao-limite, vira GROQ_PROCESS_SHARE) de
+# GROQ_RPM/GROQ_TPM para deixar o resto para o bot; a conta inteira continua
+# dividida com o bot pelo GROQ_LIMITS_STORE. É retomável: o que já está no cache é pulado,
+# então basta rodar de novo depois de uma interrupção.
+#
+# Uso (a partir da pasta script/):
+#   python precompute.py [--limite 200] [--paralelo 2] [--tipos info,recomendacoes]
+#       [--peso-desconto 1.0] [--fracao-limite 0.5] [--listar]
+
+TIPOS = {
+    "info": "telegram_info",
+    "recomendacoes": "telegram_recomendacoes",
+}
+
+
+def configurar_limites(fracao: float) -> None:
+    # Precisa vir antes de importar o groq_scheduler (os limites são lidos no import)
+    load_dotenv()
+    os.environ["GROQ_PROCESS_SHARE"] = str(fracao)
+    # Sem ninguém olhando, não há por que transmitir a resposta aos pedaços
+    os.environ.setdefault("STREAMING_ENABLED", "0")
+
+
+def ranquear(indice, peso_desconto: float = 1.0) -> list:
+    """[(pontuação, título)] dos livros do índice de preços, do mais para o menos relevante."""
+    tamanhos = {}
+    for ofertas in indice.ofertas:
+        for oferta in ofertas:
+            if oferta.get("posicao") is not None:
+                tamanhos[oferta["loja"]] = max(tamanhos.get(oferta["loja"], 0), oferta["posicao"] + 1)
+
+    ranking = []
+    for titulo, ofertas in zip(indice.titulos, indice.ofertas):
+        melhor_posicao = {}
+        for oferta in ofertas:
+            if oferta.get("posicao") is not None:
+                loja = oferta["loja"]
+                melhor_posicao[loja] = min(melhor_posicao.get(loja, oferta["posicao"]), oferta["posicao"])
+        popularidade = sum(1 - posicao / tamanhos[loja] for loja, posicao in melhor_posicao.items())
+        desconto = max(
+            ((oferta["preco_antigo"] - oferta["preco"]) / oferta["preco_antigo"]
+             for oferta in ofertas if oferta["preco_antigo"] and oferta["preco_antigo"] > oferta["preco"]),
+            default=0.0,
+        )
+        ranking.append((round(popularidade + peso_desconto * desconto, 4), titulo))
+    ranking.sort(key=lambda item: (-item[0], item[1]))
+    return ranking
+
+
+async def precomputar(titulos: list, tipos: list, paralelo: int = 2, pausa_ocupado: float = 30.0) -> dict:
+    """Preenche o cache para cada (título, tipo) que ainda não está lá."""
+    import app_telegram
+    from groq_scheduler import PRIORIDADE_LOTE, SchedulerBusyError
+    from metrics import medir
+
+    funcoes = {"info": app_telegram.get_book_info, "recomendacoes": app_telegram.get_recommendations}
+    cache = app_telegram.get_cache()
+    pendentes = [(titulo, tipo) for titulo in titulos for tipo in tipos
+                 if cache.get(TIPOS[tipo], titulo) is None]
+    resultado = {"total": len(titulos) * len(tipos), "ja_prontos": len(titulos) * len(tipos) - len(pendentes),
+                 "calculados": 0, "falhas": 0}
+    print(f"{resultado['ja_prontos']} respostas já estavam no cache; {len(pendentes)} a calcular.")
+
+    limite = asyncio.Semaphore(paralelo)
+    ocupado_ate = 0.0
+    inicio = time.perf_counter()
+
+    async def calcular(titulo: str, tipo: str) -> None:
+        nonlocal ocupado_ate
+        async with limite:
+            # Depois de um "fila cheia"/429, todos esperam um pouco antes de continuar
+            espera = ocupado_ate - time.monotonic()
+            if espera > 0:
+                await asyncio.sleep(espera)
+            try:
+                with medir("precalculo", tipo=tipo):
+                    await funcoes[tipo](titulo.title(), priority=PRIORIDADE_LOTE)
+                resultado["calculados"] += 1
+            except SchedulerBusyError as e:
+                ocupado_ate = time.monotonic() + pausa_ocupado
+                resultado["falhas"] += 1
+                print(f"[{tipo}] {titulo}: {e}; pausando {pausa_ocupado:.0f}s")
+            except Exception as e:
+                resultado["falhas"] += 1
+                print(f"[{tipo}] {titulo}: {type(e).__name__}: {e}")
+            feitos = resultado["calculados"] + resultado["falhas"]
+            if feitos % 10 == 0 or feitos == len(pendentes):
+                print(f"{feitos}/{len(pendentes)} ({time.perf_counter() - inicio:.0f}s)")
+
+    await asyncio.gather(*(calcular(titulo, tipo) for titulo, tipo in pendentes))
+    return resultado
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--limite", type=int, default=200, help="quantos livros do topo do ranking")
+    parser.add_argument("--paralelo", type=int, default=2, help="respostas calculadas ao mesmo tempo")
+    parser.add_argument("--tipos", default="info,recomendacoes", help="info, recomendacoes ou ambos")
+    parser.add_argument("--peso-desconto", type=float, default=1.0)
+    parser.add_argument("--fracao-limite", type=float, default=0.5,
+                        help="fração de GROQ_RPM/GROQ_TPM que o job pode usar")
+    parser.add_argument("--pausa-ocupado", type=float, default=30.0,
+                        help="segundos de pausa depois de a Groq recusar por limite")
+    parser.add_argument("--listar", action="store_true", help="só mostra o ranking, sem chamar os agentes")
+    args = parser.parse_args()
+
+    tipos = [tipo.strip() for tipo in args.tipos.split(",") if tipo.strip()]
+    desconhecidos = set(tipos) - set(TIPOS)
+    if desconhecidos:
+        parser.error(f"tipos desconhecidos: {', '.join(sorted(desconhecidos))}")
+
+    configurar_limites(args.fracao_limite)
+    from price_index import get_price_index
+
+    ranking = ranquear(get_price_index(), args.peso_desconto)[:args.limite]
+    if not ranking:
+        print("Catálogo vazio: rode os scrapers (get_amazon.py, get_americanas.py) antes.")
+        return
+    if args.listar:
+        for pontuacao, titulo in ranking:
+            print(f"{pontuacao:7.3f}  {titulo}")
+        return
+
+    resultado = asyncio.run(precomputar([titulo for _, titulo in ranking], tipos, args.paralelo, args.pausa_ocupado))
+    print(f"Pronto: {resultado['calculados']} calculadas, {resultado['ja_prontos']} já estavam prontas, "
+          f"{resultado['falhas']} falhas (rode de novo para tentar outra vez).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from catalog_io import iter_registros
+from crawl_store import CRAWL_DB
+from price_index import PriceIndex, fontes_configuradas, normalizar_titulo, parse_preco
+
+##############################
+# ANÁLISE DE PREÇOS (PANDAS)
+##############################
+
+# Carrega os catálogos raspados e o histórico do modo incremental em
+# DataFrames tipados e faz as contas por coluna (sem laços em Python por
+# registro): desconto, loja mais barata por título e evolução de preços.
+# A coluna livro junta os títulos do mesmo livro com grafias diferentes
+# entre as lojas, com o mesmo casamento por trigramas do price_index (o que
+# o bot usa para comparar preços).
+
+COLUNAS_OFERTAS = ["loja", "produto_id", "titulo", "titulo_normalizado", "livro", "categoria",
+                   "preco_novo", "preco_antigo", "imagem_url"]
+
+
+def normalizar_titulos(titulos: pd.Series) -> pd.Series:
+    """price_index.normalizar_titulo na coluna inteira (as mesmas regras que o bot usa)."""
+    # Cada título distinto é normalizado uma vez só (o histórico repete muito)
+    codigos, unicos = pd.factorize(titulos.fillna("").astype("string"))
+    texto = np.array([normalizar_titulo(titulo) for titulo in unicos], dtype=object)
+    return pd.Series(texto[codigos], index=titulos.index, dtype="string")
+
+
+def agrupar_titulos(titulos: pd.Series) -> pd.Series:
+    """Título normalizado -> título do grupo (livro) no price_index, na ordem em que aparecem."""
+    # O casamento por trigramas roda uma vez por título distinto
+    codigos, unicos = pd.factorize(titulos)
+    indice = PriceIndex()
+    grupos = np.array([indice.titulos[indice.grupo(titulo)] for titulo in unicos] + [pd.NA], dtype=object)
+    return pd.Series(grupos[codigos], index=titulos.index, dtype="string")
+
+
+def parse_precos(valores: pd.Series) -> pd.Series:
+    """price_index.parse_preco na coluna inteira: 39.9, '39.90' ou 'R$ 1.039,90' -> float64."""
+    # Só os valores distintos passam pelo parse; o resultado volta por índice
+    codigos, unicos = pd.factorize(valores)
+    numeros = [parse_preco(valor) for valor in unicos]
+    # factorize marca ausentes com -1: o NaN acrescentado no fim cobre esses
+    numeros = np.array([np.nan if numero is None else numero for numero in numeros] + [np.nan], dtype="float64")
+    return pd.Series(numeros[codigos], index=valores.index, dtype="float64")
+
+
+def _ler_fonte(path: str) -> pd.DataFrame:
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    if path.endswith(".json"):
+        return pd.DataFrame.from_records(list(iter_registros(path)))
+    # dtype=False: preços e ids ficam como vieram, a tipagem é feita abaixo
+    return pd.read_json(path, lines=True, dtype=False, compression="infer")
+
+
+def carregar_ofertas(fontes=None) -> pd.DataFrame:
+    """Uma linha por oferta raspada, com preços em float64 e loja/categoria como category."""
+    frames = []
+    for loja, path in fontes or fontes_configuradas():
+        if not os.path.exists(path):
+            continue
+        df = _ler_fonte(path)
+        if df.empty:
+            continue
+        if "imagem_url" not in df and "link_imagem" in df:
+            df = df.rename(columns={"link_imagem": "imagem_url"})
+        df = df.reindex(columns=["produto_id", "nome_livro", "categoria", "preco_novo", "preco_antigo", "imagem_url"])
+        df.insert(0, "loja", loja)
+        frames.append(df)
+
+    if not frames:
+        return pd.DataFrame({
+            "loja": pd.Categorical([]), "produto_id": pd.Series(dtype="string"),
+            "titulo": pd.Series(dtype="string"), "titulo_normalizado": pd.Series(dtype="string"),
+            "livro": pd.Series(dtype="string"),
+            "categoria": pd.Categorical([]), "preco_novo": pd.Series(dtype="float64"),
+            "preco_antigo": pd.Series(dtype="float64"), "imagem_url": pd.Series(dtype="string"),
+        })
+
+    df = pd.concat(frames, ignore_index=True)
+    df = df.rename(columns={"nome_livro": "titulo"})
+    df["titulo"] = df["titulo"].astype("string")
+    df["titulo_normalizado"] = normalizar_titulos(df["titulo"])
+    df["produto_id"] = df["produto_id"].astype("string").fillna(df["titulo"])
+    df["preco_novo"] = parse_precos(df["preco_novo"])
+    df["preco_antigo"] = parse_precos(df["preco_antigo"])
+    df["loja"] = df["loja"].astype("category")
+    df["categoria"] = df["categoria"].astype("string").astype("category")
+    df["imagem_url"] = df["imagem_url"].astype("string")
+    df = df[df["preco_novo"].notna() & (df["titulo_normalizado"] != "")].copy()
+    df["livro"] = agrupar_titulos(df["titulo_normalizado"])
+    return df[COLUNAS_OFERTAS].reset_index(drop=True)
+
+
+def com_desconto(df: pd.DataFrame) -> pd.DataFrame:
+    """Acrescenta desconto_pct (0 quando não há preço antigo maior que o atual)."""
+    antigo = df["preco_antigo"].to_numpy(dtype="float64", na_value=np.nan)
+    novo = df["preco_novo"].to_numpy(dtype="float64", na_value=np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        desconto = np.where(antigo > novo, (antigo - novo) / antigo * 100, 0.0)
+    return df.assign(desconto_pct=np.round(desconto, 1))
+
+
+def mais_barato_por_titulo(df: pd.DataFrame) -> pd.DataFrame:
+    """Para cada livro, a oferta mais barata e quanto ela economiza em relação à mais cara."""
+    if df.empty:
+        return df.assign(lojas=pd.Series(dtype="int64"), preco_max=pd.Series(dtype="float64"),
+                         economia=pd.Series(dtype="float64"))
+    grupos = df.groupby("livro", sort=False)
+    resumo = pd.DataFrame({"lojas": grupos["loja"].nunique(), "preco_max": grupos["preco_novo"].max()})
+    # Ordena uma vez e fica com a primeira linha de cada livro (mais barata)
+    baratas = (df.sort_values(["livro", "preco_novo"], kind="stable")
+                 .drop_duplicates("livro"))
+    baratas = baratas.join(resumo, on="livro")
+    baratas["economia"] = baratas["preco_max"] - baratas["preco_novo"]
+    return baratas.reset_index(drop=True)
+
+
+def resumo_por_loja(df: pd.DataFrame) -> pd.DataFrame:
+    df = com_desconto(df)
+    return df.groupby("loja", observed=True).agg(
+        ofertas=("preco_novo", "size"),
+        preco_medio=("preco_novo", "mean"),
+        preco_mediano=("preco_novo", "median"),
+        desconto_medio_pct=("desconto_pct", "mean"),
+    ).round(2)
+
+
+def carregar_historico(path: str = CRAWL_DB) -> pd.DataFrame:
+    """Histórico de preços gravado pelo modo incremental dos scrapers (vazio se não houver)."""
+    colunas = ["loja", "produto_id", "titulo", "preco_novo", "preco_antigo", "coletado_em"]
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=colunas)
+
+    # Join e ordenação ficam com o pandas: no SQLite custam mais que a leitura
+    with sqlite3.connect(path) as db:
+        df = pd.read_sql_query(
+            "SELECT loja, produto_id, preco_novo, preco_antigo, coletado_em FROM historico_precos", db
+        )
+        titulos = pd.read_sql_query("SELECT loja, produto_id, nome_livro AS titulo FROM produtos", db)
+    df = df.merge(titulos, on=["loja", "produto_id"], how="left")[colunas]
+    df["loja"] = df["loja"].astype("category")
+    df["produto_id"] = df["produto_id"].astype("string")
+    df["titulo"] = df["titulo"].astype("string")
+    df["preco_novo"] = parse_precos(df["preco_novo"])
+    df["preco_antigo"] = parse_precos(df["preco_antigo"])
+    df["coletado_em"] = pd.to_datetime(df["coletado_em"], unit="s")
+    return df.sort_values(["loja", "produto_id", "coletado_em"], kind="stable").reset_index(drop=True)
+
+
+def variacao_de_precos(historico: pd.DataFrame) -> pd.DataFrame:
+    """Por produto: primeiro, último, menor e maior preço, número de mudanças e variação em %."""
+    grupos = historico.groupby(["loja", "produto_id"], observed=True, sort=False)
+    resumo = grupos.agg(
+        titulo=("titulo", "last"),
+        primeiro=("preco_novo", "first"),
+        ultimo=("preco_novo", "last"),
+        minimo=("preco_novo", "min"),
+        maximo=("preco_novo", "max"),
+        mudancas=("preco_novo", "size"),
+        desde=("coletado_em", "first"),
+        ate=("coletado_em", "last"),
+    )
+    resumo["mudancas"] -= 1
+    resumo["variacao_pct"] = ((resumo["ultimo"] - resumo["primeiro"]) / resumo["primeiro"] * 100).round(1)
+    return resumo.reset_index()
+
+
+def serie_de_precos(historico: pd.DataFrame, produtos, freq: str = "D") -> pd.DataFrame:
+    """Preço de cada produto por período (último valor visto, repetido até a próxima mudança)."""
+    selecao = historico[historico["produto_id"].isin(list(produtos))]
+    if selecao.empty:
+        return pd.DataFrame()
+    tabela = selecao.pivot_table(index="coletado_em", columns="produto_id", values="preco_novo",
+                                 aggfunc="last", observed=True)
+    return tabela.resample(freq).last().ffill()
@@ -0,0 +1,264 @@
+import os
+import re
+import math
+import threading
+import unicodedata
+from collections import Counter
+
+from catalog_io import iter_registros
+
+##############################
+# ÍNDICE DE PREÇOS ENTRE LOJAS
+##############################
+
+# Junta as ofertas dos scrapers (Americanas e Amazon) por título. Os títulos
+# são normalizados e comparados por trigramas de caracteres; um índice
+# invertido de trigramas limita a comparação a poucos candidatos (blocking),
+# em vez de comparar todos os pares.
+PRICE_SOURCES = os.getenv(
+    "PRICE_SOURCES",
+    "americanas=livros_americanas.jsonl,amazon=livros_appday_completo.jsonl",
+)
+# Similaridade mínima para considerar duas ofertas o mesmo livro
+LIMIAR_MESMO_LIVRO = float(os.getenv("PRICE_MATCH_THRESHOLD", "0.8"))
+
+NOMES_LOJAS = {"americanas": "Americanas", "amazon": "Amazon"}
+
+_RUIDO = re.compile(r"\b(CAPA (COMUM|DURA|FLEXIVEL)|EDICAO DE BOLSO|EBOOK|LIVRO)\b")
+_NAO_ALFANUMERICO = re.compile(r"[^A-Z0-9]+")
+_PRECO = re.compile(r"\d[\d.]*(?:,\d+)?|\d+(?:\.\d+)?")
+# O que o usuário põe além do título: '(George Orwell)', '- Frank Herbert', 'por Harari'
+_AUTOR = re.compile(r"\s*[(\[][^)\]]*[)\]]|\s+(?:[-–—]|por|by)\s.*$", re.IGNORECASE)
+
+
+def normalizar_titulo(titulo: str) -> str:
+    """'O Senhor dos Anéis: A Sociedade do Anel (Capa Comum)' -> 'O SENHOR DOS ANEIS A SOCIEDADE DO ANEL'"""
+    texto = unicodedata.normalize("NFKD", titulo or "")
+    texto = "".join(c for c in texto if not unicodedata.combining(c)).upper()
+    texto = _NAO_ALFANUMERICO.sub(" ", texto)
+    texto = _RUIDO.sub(" ", texto)
+    return " ".join(texto.split())
+
+
+def variantes_da_consulta(consulta: str) -> list:
+    """'1984 (George Orwell)' -> ['1984 GEORGE ORWELL', '1984']: a consulta
+    normalizada e, se for diferente, sem o autor (parênteses ou depois de
+    ' - ', ' por ', ' by '). A versão sem autor só é usada se a inteira não casar."""
+    variantes = []
+    for texto in (consulta, _AUTOR.sub("", consulta or "")):
+        titulo = normalizar_titulo(texto)
+        if titulo and titulo not in variantes:
+            variantes.append(titulo)
+    return variantes
+
+
+def parse_preco(valor):
+    """Aceita 39.9, '39.90' ou 'R$ 1.039,90'. Devolve float ou None."""
+    if valor is None or isinstance(valor, bool):
+        return None
+    if isinstance(valor, (int, float)):
+        return float(valor) if not math.isnan(valor) else None
+    match = _PRECO.search(str(valor))
+    if not match:
+        return None
+    numero = match.group(0)
+    if "," in numero:
+        numero = numero.replace(".", "").replace(",", ".")
+    try:
+        return float(numero)
+    except ValueError:
+        return None
+
+
+def formatar_preco(valor: float) -> str:
+    return "R$ " + f"{valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+def trigramas(texto: str) -> frozenset:
+    texto = f"  {texto} "
+    return frozenset(texto[i:i + 3] for i in range(len(texto) - 2))
+
+
+def similaridade(a: frozenset, b: frozenset) -> float:
+    """Coeficiente de Dice entre dois conjuntos de trigramas."""
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+class PriceIndex:
+    def __init__(self, limiar: float = LIMIAR_MESMO_LIVRO):
+        self.limiar = limiar
+        self.titulos = []      # título normalizado de cada grupo (livro)
+        self.ofertas = []      # lista de ofertas de cada grupo
+        self._grams = []       # trigramas de cada grupo
+        self._por_titulo = {}  # título normalizado -> grupo
+        self._postings = {}    # trigrama -> grupos que o contêm
+
+    def __len__(self) -> int:
+        return len(self.titulos)
+
+    def _candidatos(self, grams: frozenset, prefixo: int) -> Counter:
+        # Só os trigramas mais raros geram candidatos: se um grupo não tem
+        # nenhum deles, não tem como atingir a similaridade mínima
+        presentes = [gram for gram in grams if gram in self._postings]
+        raros = sorted(presentes, key=lambda gram: len(self._postings[gram]))[:max(prefixo, 1)]
+        contagem = Counter()
+        for gram in raros:
+            contagem.update(self._postings[gram])
+        return contagem
+
+    def _melhor_grupo(self, grams: frozenset):
+        t = self.limiar
+        # Dice >= t exige pelo menos t*|Q|/(2-t) trigramas em comum
+        minimo = math.ceil(t * len(grams) / (2 - t))
+        prefixo = len(grams) - minimo + 1
+        menor, maior = len(grams) * t / (2 - t), len(grams) * (2 - t) / t
+        melhor, melhor_score = None, t
+        for grupo, comuns in self._candidatos(grams, prefixo).items():
+            alvo = self._grams[grupo]
+            # Descarta sem calcular a interseção: tamanho incompatível ou, mesmo
+            # que todos os trigramas fora do prefixo batessem, não chegaria ao limiar
+            if not menor <= len(alvo) <= maior:
+                continue
+            if comuns + len(grams) - prefixo < t * (len(grams) + len(alvo)) / 2:
+                continue
+            score = similaridade(grams, alvo)
+            if score >= melhor_score:
+                melhor, melhor_score = grupo, score
+        return melhor
+
+    def grupo(self, titulo: str) -> int:
+        """Grupo (livro) do título já normalizado; cria um novo se nenhum for parecido o bastante."""
+        grupo = self._por_titulo.get(titulo)
+        if grupo is None:
+            grams = trigramas(titulo)
+            grupo = self._melhor_grupo(grams)
+            if grupo is None:
+                grupo = len(self.titulos)
+                self.titulos.append(titulo)
+                self.ofertas.append([])
+                self._grams.append(grams)
+                for gram in grams:
+                    self._postings.setdefault(gram, []).append(grupo)
+            self._por_titulo[titulo] = grupo
+        return grupo
+
+    def adicionar(self, loja: str, registro: dict, posicao: int = None) -> None:
+        titulo = normalizar_titulo(registro.get("nome_livro"))
+        preco = parse_preco(registro.get("preco_novo"))
+        if not titulo or preco is None:
+            return
+
+        self.ofertas[self.grupo(titulo)].append({
+            "loja": loja,
+            "titulo": registro.get("nome_livro"),
+            "preco": preco,
+            "preco_antigo": parse_preco(registro.get("preco_antigo")),
+            "imagem_url": registro.get("imagem_url") or registro.get("link_imagem"),
+            "categoria": registro.get("categoria"),
+            # Posição do livro na listagem da loja (mais vendidos primeiro)
+            "posicao": posicao,
+        })
+
+    def buscar(self, consulta: str, limite: int = 3, minimo: float = 0.5) -> list:
+        """Devolve até `limite` livros parecidos com a consulta, com as ofertas ordenadas por preço.
+
+        A pontuação é o Dice, simétrico de propósito: medir só quanto do título
+        aparece na consulta faria um título curto casar com qualquer consulta
+        que o contenha ('Filhos de Duna' virava DUNA e levava os preços dele).
+        Se a consulta inteira não casar, tenta de novo sem o autor que o
+        usuário acrescenta ('Sapiens (Yuval Noah Harari)').
+        """
+        for titulo in variantes_da_consulta(consulta):
+            resultados = self._pontuar(titulo, limite, minimo)
+            if resultados:
+                return resultados
+        return []
+
+    def _pontuar(self, titulo: str, limite: int, minimo: float) -> list:
+        exato = self._por_titulo.get(titulo)
+        grams = trigramas(titulo)
+        resultados = []
+        for grupo in self._candidatos(grams, len(grams) // 2 + 3):
+            alvo = self._grams[grupo]
+            score = similaridade(grams, alvo)
+            if grupo == exato:
+                score = 1.0
+            if score >= minimo:
+                resultados.append((score, grupo))
+
+        resultados.sort(reverse=True)
+        return [
+            {
+                "grupo": grupo,
+                "titulo": self.titulos[grupo],
+                "score": round(score, 3),
+                "ofertas": sorted(self.ofertas[grupo], key=lambda oferta: oferta["preco"]),
+            }
+            for score, grupo in resultados[:limite]
+        ]
+
+    def carregar(self, loja: str, path: str) -> int:
+        registros = list(iter_registros(path))
+        # A posição vem da página e da ordem na página gravadas pelo scraper:
+        # a ordem do arquivo é a em que as páginas terminaram de baixar.
+        # Registros sem esses campos (arquivos antigos) ficam por último.
+        ordem = sorted(range(len(registros)), key=lambda linha: (
+            registros[linha].get("pagina") is None,
+            registros[linha].get("pagina") or 0,
+            registros[linha].get("posicao_na_pagina") or 0,
+            linha,
+        ))
+        posicoes = [0] * len(registros)
+        for posicao, linha in enumerate(ordem):
+            posicoes[linha] = posicao
+        for registro, posicao in zip(registros, posicoes):
+            self.adicionar(loja, registro, posicao)
+        return len(registros)
+
+
+def fontes_configuradas(fontes: str = PRICE_SOURCES) -> list:
+    pares = []
+    for item in fontes.split(","):
+        if "=" in item:
+            loja, path = item.split("=", 1)
+            pares.append((loja.strip(), path.strip()))
+    return pares
+
+
+def construir_indice(fontes=None) -> PriceIndex:
+    indice = PriceIndex()
+    for loja, path in fontes or fontes_configuradas():
+        if os.path.exists(path):
+            indice.carregar(loja, path)
+    return indice
+
+
+def formatar_ofertas(resultado: dict, negrito: str = "*") -> str:
+    """Texto em Markdown com as ofertas de um livro, da mais barata para a mais cara."""
+    linhas = []
+    for oferta in resultado["ofertas"]:
+        loja = NOMES_LOJAS.get(oferta["loja"], oferta["loja"])
+        linha = f"- {loja}: {negrito}{formatar_preco(oferta['preco'])}{negrito}"
+        if oferta["preco_antigo"] and oferta["preco_antigo"] > oferta["preco"]:
+            linha += f" (de {formatar_preco(oferta['preco_antigo'])})"
+        linhas.append(linha)
+    return "\n".join(linhas)
+
+
+_indice = None
+_assinatura = None
+_indice_lock = threading.Lock()
+
+
+def get_price_index() -> PriceIndex:
+    """Índice compartilhado pelo processo; é reconstruído quando os arquivos mudam."""
+    global _indice, _assinatura
+    fontes = fontes_configuradas()
+    assinatura = tuple(os.path.getmtime(path) if os.path.exists(path) else None for _, path in fontes)
+    with _indice_lock:
+        if _indice is None or assinatura != _assinatura:
+            _indice = construir_indice(fontes)
+            _assinatura = assinatura
+        return _indice
@@ -0,0 +1,126 @@
+import os
+import re
+import time
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+
+##############################
+# CACHE DE RESPOSTAS DOS AGENTES
+##############################
+
+# Duas camadas: LRU em memória (rápida, por processo) e SQLite em disco
+# (sobrevive a restarts e é compartilhada entre o bot e o Streamlit).
+CACHE_PATH = os.getenv("CACHE_PATH", "respostas_cache.sqlite3")
+CACHE_TTL = float(os.getenv("CACHE_TTL", str(7 * 24 * 3600)))
+CACHE_MAX_ITEMS = int(os.getenv("CACHE_MAX_ITEMS", "512"))
+
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """'  O  Senhor dos ANÉIS ' -> 'o senhor dos aneis'"""
+    text = unicodedata.normalize("NFKD", query)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return _SPACES.sub(" ", text).strip().casefold()
+
+
+class ResponseCache:
+    def __init__(self, path: str = CACHE_PATH, ttl: float = CACHE_TTL, max_items: int = CACHE_MAX_ITEMS):
+        self.path = path
+        self.ttl = ttl
+        self.max_items = max_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS respostas ("
+                " agent_type TEXT NOT NULL,"
+                " query TEXT NOT NULL,"
+                " content TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " PRIMARY KEY (agent_type, query))"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def key(agent_type: str, query: str):
+        return agent_type, normalize_query(query)
+
+    def get(self, agent_type: str, query: str):
+        key = self.key(agent_type, query)
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                content, created_at = entry
+                if now - created_at < self.ttl:
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return content
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT content, created_at FROM respostas WHERE agent_type = ? AND query = ?", key
+                ).fetchone()
+                if row and now - row[1] < self.ttl:
+                    self._remember(key, row[0], row[1])
+                    self.stats["disk_hits"] += 1
+                    return row[0]
+
+            self.stats["misses"] += 1
+            return None
+
+    def set(self, agent_type: str, query: str, content: str) -> None:
+        key = self.key(agent_type, query)
+        created_at = time.time()
+
+        with self._lock:
+            self._remember(key, content, created_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO respostas (agent_type, query, content, created_at) VALUES (?, ?, ?, ?)",
+                    (*key, content, created_at),
+                )
+                self._db.commit()
+
+    def _remember(self, key, content: str, created_at: float) -> None:
+        self._memory[key] = (content, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def purge_expired(self) -> int:
+        """Remove do disco as respostas vencidas. Retorna quantas foram apagadas."""
+        if self._db is None:
+            return 0
+        with self._lock:
+            cursor = self._db.execute("DELETE FROM respostas WHERE created_at < ?", (time.time() - self.ttl,))
+            self._db.commit()
+            return cursor.rowcount
+
+    def hit_rate(self) -> float:
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> ResponseCache:
+    """Instância única do cache por processo."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
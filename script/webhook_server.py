@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import signal
+import asyncio
+
+import tornado.web
+
+from metrics import registry, observar_etapa
+
+##############################
+# SERVIDOR ÚNICO (WEBHOOK + HEALTH CHECK)
+##############################
+
+# Um só servidor assíncrono, no mesmo event loop do bot: recebe os updates
+# do Telegram por webhook e responde ao health check do Render. Sem
+# webhook configurado (ex.: rodando local), o bot usa polling e o servidor
+# fica só com o health check. As métricas ficam em /metrics (formato do
+# Prometheus) e /metrics.json (contadores e p50/p95/p99 recentes).
+#
+# Inicialização em etapas: a porta abre antes de o bot ser carregado (o
+# health check responde na hora), o bot é importado e montado numa thread e
+# o registro do webhook (chamada de rede) fica em segundo plano. Um update
+# que chega no meio disso (é ele que acorda o serviço no Render) espera o
+# bot ficar pronto em vez de ser recusado.
+WEBHOOK_PATH = "/telegram"
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+# Quanto um update espera o bot terminar de subir antes de receber 503
+BOOT_TIMEOUT = float(os.getenv("BOOT_TIMEOUT", "60"))
+
+
+class HealthHandler(tornado.web.RequestHandler):
+    def initialize(self, message: str):
+        self.message = message
+
+    def get(self):
+        self.write(self.message)
+
+    def head(self):
+        self.set_status(200)
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    def initialize(self, formato: str = "prometheus"):
+        self.formato = formato
+
+    def get(self):
+        if self.formato == "json":
+            self.set_header("Content-Type", "application/json; charset=utf-8")
+            self.write(json.dumps(registry.resumo(), ensure_ascii=False))
+        else:
+            self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.write(registry.prometheus())
+
+
+class BotState:
+    """O que o servidor sabe do bot; preenchido quando ele termina de carregar."""
+
+    def __init__(self):
+        self.ready = asyncio.Event()
+        self.application = None
+        self.webhook = False
+        self.secret = None
+
+
+class TelegramWebhookHandler(tornado.web.RequestHandler):
+    def initialize(self, state: BotState):
+        self.state = state
+
+    async def post(self):
+        try:
+            await asyncio.wait_for(self.state.ready.wait(), BOOT_TIMEOUT)
+        except asyncio.TimeoutError:
+            # O Telegram tenta entregar de novo mais tarde
+            self.set_status(503)
+            return
+        if not self.state.webhook:
+            self.set_status(404)
+            return
+        if self.state.secret and self.request.headers.get(SECRET_HEADER) != self.state.secret:
+            self.set_status(403)
+            return
+        try:
+            data = json.loads(self.request.body)
+        except ValueError:
+            self.set_status(400)
+            return
+
+        from telegram import Update
+
+        # Só enfileira: o Application processa (em paralelo, com
+        # concurrent_updates) e o Telegram recebe o 200 na hora
+        application = self.state.application
+        await application.update_queue.put(Update.de_json(data, application.bot))
+        self.set_status(200)
+
+
+def _parar_com_sinais(stop: asyncio.Event) -> None:
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows ou fora da thread principal
+            pass
+
+
+def _marcar(etapa: str, inicio: float) -> None:
+    duracao = time.perf_counter() - inicio
+    observar_etapa("inicializacao", duracao, parte=etapa)
+    print(f"Inicialização: {etapa} em {duracao:.2f}s")
+
+
+async def _registrar_webhook(application, url: str, secret: str, max_connections: int, tentativas: int = 3) -> None:
+    from telegram import Update
+
+    for tentativa in range(tentativas):
+        try:
+            await application.bot.set_webhook(
+                url=url.rstrip("/") + WEBHOOK_PATH,
+                secret_token=secret,
+                allowed_updates=Update.ALL_TYPES,
+                max_connections=max_connections,
+            )
+            return
+        except Exception as e:
+            # Enquanto isso o webhook antigo (mesma URL, em geral) continua valendo
+            print(f"Falha ao registrar o webhook ({tentativa + 1}/{tentativas}): {e}")
+            await asyncio.sleep(2 ** tentativa)
+
+
+async def serve(load, port: int, health_message: str = "ok", started_at: float = None) -> None:
+    """Roda o bot até SIGINT/SIGTERM e encerra com calma.
+
+    load() é chamada numa thread depois que a porta já está aberta e devolve
+    um dict com "application" e, opcionalmente, "webhook_url", "secret",
+    "max_connections" e "post_init". No encerramento o servidor para de
+    aceitar conexões, o Application termina os updates que já estavam em
+    andamento e só então o processo sai.
+    """
+    inicio = time.perf_counter() if started_at is None else started_at
+    state = BotState()
+    routes = [
+        (r"/", HealthHandler, {"message": health_message}),
+        (r"/healthz", HealthHandler, {"message": health_message}),
+        (r"/metrics", MetricsHandler, {"formato": "prometheus"}),
+        (r"/metrics.json", MetricsHandler, {"formato": "json"}),
+        (WEBHOOK_PATH, TelegramWebhookHandler, {"state": state}),
+    ]
+
+    stop = asyncio.Event()
+    _parar_com_sinais(stop)
+
+    # O health check responde antes mesmo de o bot ser carregado
+    server = tornado.web.Application(routes).listen(port, address="0.0.0.0")
+    _marcar("porta aberta", inicio)
+    try:
+        setup = await asyncio.get_running_loop().run_in_executor(None, load)
+        _marcar("bot carregado", inicio)
+        application = setup["application"]
+        webhook_url = setup.get("webhook_url")
+        state.application = application
+        state.webhook = bool(webhook_url)
+        state.secret = setup.get("secret")
+        if webhook_url and not state.secret:
+            # Sem segredo, qualquer um que ache a URL manda updates falsos
+            raise RuntimeError("Modo webhook exige um segredo (setup['secret'])")
+
+        async with application:
+            if setup.get("post_init") is not None:
+                await setup["post_init"](application)
+            if not webhook_url:
+                # start_polling também remove um webhook que tenha ficado registrado
+                from telegram import Update
+
+                await application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+            await application.start()
+            state.ready.set()
+            _marcar("pronto", inicio)
+            print(f"Bot no ar ({'webhook' if webhook_url else 'polling'}), porta {port}.")
+
+            registro = None
+            if webhook_url:
+                registro = asyncio.create_task(_registrar_webhook(
+                    application, webhook_url, state.secret, setup.get("max_connections", 40)
+                ))
+
+            try:
+                await stop.wait()
+                print("Encerrando: terminando os pedidos em andamento...")
+            finally:
+                server.stop()
+                if registro is not None:
+                    registro.cancel()
+                if application.updater.running:
+                    await application.updater.stop()
+                if application.running:
+                    await application.stop()
+    finally:
+        server.stop()